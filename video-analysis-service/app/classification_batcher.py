@@ -0,0 +1,172 @@
+import asyncio
+import os
+import time
+from app.image_classifier import ImageClassifier
+from app.logger import setup_logger
+from app.metrics import Histogram
+
+logger = setup_logger(
+    __name__, log_level="DEBUG", log_file="video-analysis-service.log"
+)
+
+
+class ClassificationBatcher:
+    """
+    A class used to classify frames from concurrent requests in shared batches
+
+    Each request only classifies a single frame, so on its own every request
+    pays the full interpreter overhead. Frames are queued instead and flushed
+    as one ImageClassifier.classify_frames call once either MAX_BATCH_SIZE
+    frames are waiting or the first frame has waited for MAX_WAIT seconds,
+    every caller gets its own scores back through a future
+
+    ...
+
+    Attributes
+    ----------
+    MAX_BATCH_SIZE : int
+        the amount of frames that flushes a batch straight away,
+        set with the CLASSIFICATION_BATCH_SIZE environment variable
+    MAX_WAIT : float
+        the time in seconds the first frame in a batch waits for more frames,
+        set with the CLASSIFICATION_BATCH_MAX_WAIT environment variable
+    batch_size : Histogram
+        the amount of frames in each flushed batch
+    queue_wait_time : Histogram
+        the time frames spend queued before their batch is flushed
+
+    Methods
+    -------
+    start() -> None
+        starts the task that collects queued frames into batches
+    close() -> None
+        stops collecting frames and waits for the flushed batches to finish
+    classify_frame(numpy.ndarray | PIL.Image.Image) -> {str: float}
+        queues a frame and returns its category scores once its batch has run
+    """
+
+    MAX_BATCH_SIZE = int(
+        os.environ.get("CLASSIFICATION_BATCH_SIZE", ImageClassifier.MAX_BATCH_SIZE)
+    )
+    MAX_WAIT = float(os.environ.get("CLASSIFICATION_BATCH_MAX_WAIT", 0.005))
+
+    batch_size = Histogram(
+        "classification_batch_size",
+        "Amount of frames in each classification batch",
+        buckets=(1, 2, 4, 8, 16, 32, 64),
+    )
+    queue_wait_time = Histogram(
+        "classification_queue_wait_seconds",
+        "Time frames spend queued before their batch is classified",
+    )
+
+    def __init__(self):
+        self._frame_queue = None
+        self._collector_task = None
+        self._batch_tasks = set()
+
+    async def start(self):
+        if self._collector_task is not None:
+            return
+
+        logger.debug(
+            f"Starting classification batcher: max_batch_size={self.MAX_BATCH_SIZE}, "
+            f"max_wait={self.MAX_WAIT}"
+        )
+        self._frame_queue = asyncio.Queue()
+        self._collector_task = asyncio.create_task(self._collect_batches())
+
+    async def close(self):
+        if self._collector_task is None:
+            return
+
+        logger.debug("Closing classification batcher.")
+        self._collector_task.cancel()
+        await asyncio.gather(self._collector_task, return_exceptions=True)
+        await asyncio.gather(*self._batch_tasks, return_exceptions=True)
+
+        # Nothing is going to flush the frames that are still queued
+        while not self._frame_queue.empty():
+            _, result_future, _ = self._frame_queue.get_nowait()
+            result_future.cancel()
+
+        self._collector_task = None
+        self._frame_queue = None
+
+    async def classify_frame(self, frame):
+        """
+        Queues a frame and returns its category scores once its batch has run
+
+        Parameters
+        ----------
+        frame : numpy.ndarray | PIL.Image.Image
+            an RGB frame to be classified
+
+        Returns
+        -------
+        {str: float}
+        """
+        await self.start()
+
+        result_future = asyncio.get_running_loop().create_future()
+        await self._frame_queue.put((frame, result_future, time.perf_counter()))
+
+        image_scores = await result_future
+        logger.debug("Image scores: %s", image_scores)
+        return image_scores
+
+    async def _collect_batches(self):
+        while True:
+            batch = []
+            try:
+                # Wait as long as needed for the first frame of a batch
+                batch.append(await self._frame_queue.get())
+                flush_time = time.perf_counter() + self.MAX_WAIT
+
+                while len(batch) < self.MAX_BATCH_SIZE:
+                    remaining_wait = flush_time - time.perf_counter()
+                    if remaining_wait <= 0:
+                        break
+
+                    try:
+                        batch.append(
+                            await asyncio.wait_for(
+                                self._frame_queue.get(), remaining_wait
+                            )
+                        )
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # Don't leave the callers of a half collected batch waiting
+                for _, result_future, _ in batch:
+                    result_future.cancel()
+                raise
+
+            # Keep collecting the next batch while this one is classified,
+            # the classifier has a pool of interpreters to run them in parallel
+            batch_task = asyncio.create_task(self._classify_batch(batch))
+            self._batch_tasks.add(batch_task)
+            batch_task.add_done_callback(self._batch_tasks.discard)
+
+    async def _classify_batch(self, batch):
+        flush_time = time.perf_counter()
+        ClassificationBatcher.batch_size.observe(len(batch))
+        for _, _, queue_time in batch:
+            ClassificationBatcher.queue_wait_time.observe(flush_time - queue_time)
+
+        logger.debug(f"Flushing classification batch of {len(batch)} frames.")
+        try:
+            batch_scores = await asyncio.to_thread(
+                ImageClassifier().classify_frames, [frame for frame, _, _ in batch]
+            )
+        except Exception as e:
+            logger.error(f"Classification batch failed: {e!r}")
+            for _, result_future, _ in batch:
+                if not result_future.done():
+                    result_future.set_exception(e)
+            return
+
+        for (_, result_future, _), image_scores in zip(batch, batch_scores):
+            # The caller may have been cancelled while the batch was running
+            if not result_future.done():
+                result_future.set_result(image_scores)
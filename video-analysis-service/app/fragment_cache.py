@@ -0,0 +1,210 @@
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+from app.logger import setup_logger
+
+logger = setup_logger(
+    __name__, log_level="DEBUG", log_file="video-analysis-service.log"
+)
+
+
+class FragmentCache:
+    """
+    A class used to keep downloaded storyboard fragments and thumbnails on disk
+
+    Images are stored as the compressed bytes they were downloaded as, in files
+    named by the hash of their URL. Storyboard URLs are signed with a sigh
+    parameter that changes between extractions of the same video, it is left
+    out of the hash since the rest of the URL already identifies the image.
+    Cached images are memory mapped, so decoding reads them straight from
+    the page cache. The cache is bounded by the total size of the files,
+    the least recently used files are evicted first
+
+    ...
+
+    Attributes
+    ----------
+    DIRECTORY : str
+        the directory that holds the cached files, set with the
+        FRAGMENT_CACHE_DIR environment variable, the cache is disabled
+        if this is empty
+    MAX_BYTES : int
+        the maximum total size of the cached files,
+        set with the FRAGMENT_CACHE_MAX_BYTES environment variable
+    VOLATILE_PARAMS : {str: {str}}
+        the query parameters that are left out of the key, for each URL path
+        prefix where it is safe to do so
+    directory : pathlib.Path
+        the directory that holds the cached files
+    max_bytes : int
+        the maximum total size of the cached files
+    total_bytes : int
+        the current total size of the cached files
+    hits : int
+        the amount of lookups that found a cached file
+    misses : int
+        the amount of lookups that found no cached file
+    evictions : int
+        the amount of files removed to stay within max_bytes
+
+    Methods
+    -------
+    open() -> None
+        indexes the files that are already in the cache directory
+    get(str) -> mmap.mmap
+        returns the memory mapped bytes for a URL, or None if there are none
+    put(str, bytes) -> None
+        stores the bytes for a URL
+    stats() -> {str: int | float}
+        returns the counters, hit ratio and total size
+    """
+
+    DIRECTORY = os.environ.get("FRAGMENT_CACHE_DIR", "fragment-cache")
+    MAX_BYTES = int(os.environ.get("FRAGMENT_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+    VOLATILE_PARAMS = {"/sb/": {"sigh"}}
+
+    def __init__(self, directory=DIRECTORY, max_bytes=MAX_BYTES):
+        """
+        Parameters
+        ----------
+        directory : str
+            the directory that holds the cached files,
+            the cache is disabled if this is empty
+        max_bytes : int
+            the maximum total size of the cached files
+        """
+        self.directory = Path(directory) if directory else None
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Maps file names to file sizes, ordered from least to most recent use
+        self._file_sizes = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        if self.directory is None or self._file_sizes is not None:
+            return
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        # Files that were used most recently have the latest modification time
+        cached_files = sorted(
+            (
+                (cached_file.name, cached_file.stat())
+                for cached_file in self.directory.iterdir()
+                # Temporary files start with a dot
+                if cached_file.is_file() and not cached_file.name.startswith(".")
+            ),
+            key=lambda cached_file: cached_file[1].st_mtime,
+        )
+        file_sizes = OrderedDict(
+            (file_name, file_stat.st_size) for file_name, file_stat in cached_files
+        )
+
+        with self._lock:
+            self._file_sizes = file_sizes
+            self.total_bytes = sum(file_sizes.values())
+            self._evict()
+
+        logger.info(
+            f"Opened fragment cache {self.directory} with {len(cached_files)} files, "
+            f"{self.total_bytes}B."
+        )
+
+    def get(self, url):
+        if self._file_sizes is None:
+            return None
+
+        file_name = self._file_name(url)
+
+        with self._lock:
+            if file_name not in self._file_sizes:
+                self.misses += 1
+                return None
+
+            self._file_sizes.move_to_end(file_name)
+            self.hits += 1
+
+        cached_file = self.directory / file_name
+        try:
+            with open(cached_file, "rb") as image_file:
+                # The mapping stays valid after the file is closed or evicted
+                image_bytes = mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ)
+            # Keep the modification time in use order for the next open
+            os.utime(cached_file)
+        except (FileNotFoundError, ValueError):
+            # The file was removed behind our back or is empty
+            with self._lock:
+                self.total_bytes -= self._file_sizes.pop(file_name, 0)
+            return None
+
+        return image_bytes
+
+    def put(self, url, image_bytes):
+        # Empty files can't be memory mapped
+        if self._file_sizes is None or len(image_bytes) == 0:
+            return
+
+        file_name = self._file_name(url)
+
+        # Write to a temporary file first so a partial file is never read
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".")
+        with os.fdopen(file_descriptor, "wb") as temp_file:
+            temp_file.write(image_bytes)
+        os.replace(temp_path, self.directory / file_name)
+
+        with self._lock:
+            self.total_bytes += len(image_bytes) - self._file_sizes.pop(file_name, 0)
+            self._file_sizes[file_name] = len(image_bytes)
+            self._evict()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups > 0 else 0.0,
+                "evictions": self.evictions,
+                "files": 0 if self._file_sizes is None else len(self._file_sizes),
+                "bytes": self.total_bytes,
+            }
+
+    def _file_name(self, url):
+        split_url = urlsplit(url)
+        volatile_params = set()
+        for path_prefix, params in self.VOLATILE_PARAMS.items():
+            if split_url.path.startswith(path_prefix):
+                volatile_params |= params
+
+        cache_url = urlunsplit(
+            split_url._replace(
+                query=urlencode(
+                    [
+                        (param, value)
+                        for param, value in parse_qsl(
+                            split_url.query, keep_blank_values=True
+                        )
+                        if param not in volatile_params
+                    ]
+                )
+            )
+        )
+
+        return hashlib.sha256(cache_url.encode()).hexdigest()
+
+    def _evict(self):
+        # Must be called while holding the lock
+        while self.total_bytes > self.max_bytes and len(self._file_sizes) > 0:
+            file_name, file_size = self._file_sizes.popitem(last=False)
+            self.total_bytes -= file_size
+            self.evictions += 1
+            (self.directory / file_name).unlink(missing_ok=True)
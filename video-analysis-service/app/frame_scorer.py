@@ -0,0 +1,432 @@
+import cv2
+import numpy
+from app.logger import SampledLogger, setup_logger
+
+logger = setup_logger(
+    __name__, log_level="DEBUG", log_file="video-analysis-service.log"
+)
+chunk_logger = SampledLogger(logger)
+
+
+class FrameScorer:
+    """
+    A class used to compute the detail and diff data for a set of frames
+    with whole-array operations instead of per-frame loops
+
+    Frames are stacked into contiguous (N, H, W) grayscale arrays,
+    so colour conversion, edge detection, diffing and the outlier filtering
+    each run as a single operation over the whole stack
+
+    Frames can be RGB or already grayscale (for example decoded straight to
+    grayscale from the fetched bytes), grayscale frames skip the conversion.
+    Frames can be added in chunks as they become available (for example one
+    storyboard fragment at a time), the colour conversion and edge detection
+    run for each chunk as it is added and only the filtering and diffing
+    have to wait for the last chunk
+
+    In low memory mode only the grayscale frames and the per-frame scalars
+    (index, variance and diff sum) are kept, the edge maps are generated in
+    small chunks and dropped as soon as their scalars are known, any map that
+    is needed afterwards is rebuilt on demand
+
+    ...
+
+    Attributes
+    ----------
+    LOW_MEMORY_CHUNK_SIZE : int
+        the amount of frames that have edge maps in memory at once
+        when running in low memory mode
+    low_memory : bool
+        indicates if the maps are dropped after their scalars are computed
+    frame_count : int
+        the amount of frames added so far
+    video_frames : [numpy.ndarray | PIL.Image.Image]
+        all the added frames in chunk order, populated when scoring
+    chunk_sizes : [(int, int)]
+        the order and the amount of frames of every chunk, in chunk order,
+        populated when scoring
+    gray_frames : numpy.ndarray
+        a (N, H, W) uint8 array of the grayscale frames, populated when scoring
+    edge_positions : numpy.ndarray
+        the indices of the frames kept after filtering edge outliers,
+        sorted by detail level (lowest first)
+    edge_maps : numpy.ndarray
+        a (M, H, W) int16 array of the kept edge maps, in edge_positions order,
+        this is None in low memory mode
+    edge_variances : numpy.ndarray
+        the detail score (variance) of every kept edge map
+    diff_maps : numpy.ndarray
+        a (M, H, W) int16 array of the absolute differences between
+        each kept edge map and the reference (lowest detail) edge map,
+        this is None in low memory mode
+    diff_sums : numpy.ndarray
+        the diff score (sum of absolute diff) of every diff map
+    filtered_positions : numpy.ndarray
+        positions into edge_maps and diff_maps that are kept after filtering
+        diff outliers, sorted by diff score (lowest first)
+    selected_position : int
+        the position of the median filtered frame
+
+    Methods
+    -------
+    add_frames([numpy.ndarray | PIL.Image.Image], int) -> None
+        converts and edge detects a chunk of frames
+    score() -> int
+        runs the full scoring pipeline and returns the selected position
+    edge_map(int) -> numpy.ndarray
+        returns the edge map at a position, rebuilding it if needed
+    diff_map(int) -> numpy.ndarray
+        returns the diff map at a position, rebuilding it if needed
+    frame_location(int) -> (int, int)
+        returns the chunk order and the index in that chunk of a frame
+    preview() -> (float, float, float, float)
+        scores the frames added so far while more frames can still be added
+    """
+
+    LOW_MEMORY_CHUNK_SIZE = 8
+
+    def __init__(self, video_frames=(), low_memory=False):
+        """
+        Parameters
+        ----------
+        video_frames : [numpy.ndarray | PIL.Image.Image]
+            a list of equally sized RGB or grayscale frames,
+            more can be added with add_frames
+        low_memory : bool
+            keep only per-frame scalars instead of full edge and diff maps
+        """
+        self.low_memory = low_memory
+        self.frame_count = 0
+        # Chunks are keyed by their order so they can arrive in any order,
+        # each chunk holds (frames, gray frames, edge maps, variances)
+        self._frame_chunks = {}
+        self.video_frames = None
+        self.chunk_sizes = None
+        self.gray_frames = None
+        self.edge_positions = None
+        self.edge_maps = None
+        self.edge_variances = None
+        self.diff_maps = None
+        self.diff_sums = None
+        self.filtered_positions = None
+        self.selected_position = None
+
+        if len(video_frames) > 0:
+            self.add_frames(video_frames)
+
+    def add_frames(self, video_frames, order=None):
+        """
+        Converts and edge detects a chunk of frames
+
+        Parameters
+        ----------
+        video_frames : [numpy.ndarray | PIL.Image.Image]
+            a list of RGB or grayscale frames with the same size
+            as the other chunks
+        order : int
+            the position of the chunk, chunks are joined in ascending order,
+            defaults to the order the chunks were added in
+
+        Returns
+        -------
+        None
+        """
+        if self.selected_position is not None:
+            logger.error("Cannot add frames after the frames have been scored.")
+            raise FrameScorerError
+
+        if order is None:
+            order = len(self._frame_chunks)
+
+        chunk_logger.debug("Adding %s frames as chunk %s.", len(video_frames), order)
+        if self.low_memory:
+            gray_frames = self._convert_grayscale(video_frames)
+            # Only the variances outlive each chunk
+            edge_maps = None
+            variances = numpy.concatenate(
+                [
+                    self._variances(chunk)
+                    for chunk in self._chunked_laplacian(
+                        gray_frames, numpy.arange(len(gray_frames))
+                    )
+                ]
+            )
+        else:
+            gray_frames = self._stack_grayscale(video_frames)
+            edge_maps = self._laplacian(gray_frames)
+            variances = self._variances(edge_maps)
+
+        self._frame_chunks[order] = (
+            list(video_frames),
+            gray_frames,
+            edge_maps,
+            variances,
+        )
+        self.frame_count += len(video_frames)
+
+    def score(self):
+        """
+        Generates the edge and diff data and selects the median frame
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        int
+            the position of the selected frame in edge_maps and diff_maps
+        """
+        if self.selected_position is not None:
+            return self.selected_position
+
+        if self.frame_count < 2:
+            logger.error("At least 2 frames are needed to calculate frame scores.")
+            raise FrameScorerError
+
+        # These must be called in this order
+        self._filter_edge_maps()
+        self._generate_diff_maps()
+
+        logger.debug("Selecting median frame.")
+        filter_mask = self._outlier_mask(self.diff_sums)
+        kept_positions = numpy.flatnonzero(filter_mask)
+        self.filtered_positions = kept_positions[
+            numpy.argsort(self.diff_sums[kept_positions], kind="stable")
+        ]
+        self.selected_position = int(
+            self.filtered_positions[len(self.filtered_positions) // 2]
+        )
+
+        return self.selected_position
+
+    def preview(self):
+        """
+        Scores the frames added so far while more frames can still be added,
+        this shows how much the scores still change as frames are added
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        (float, float, float, float)
+            the mean and standard deviation of the detail levels of every frame,
+            and the detail level and diff sum of the frame that would be selected
+        """
+        if self.frame_count < 2:
+            logger.error("At least 2 frames are needed to calculate frame scores.")
+            raise FrameScorerError
+
+        # Score a copy so the chunks stay available for more frames,
+        # the chunks themselves are only read
+        preview_scorer = FrameScorer(low_memory=self.low_memory)
+        preview_scorer._frame_chunks = dict(self._frame_chunks)
+        preview_scorer.frame_count = self.frame_count
+        selected_position = preview_scorer.score()
+
+        variances = numpy.concatenate(
+            [chunk[3] for chunk in self._frame_chunks.values()]
+        )
+
+        return (
+            float(variances.mean()),
+            float(variances.std(ddof=1)),
+            float(preview_scorer.edge_variances[selected_position]),
+            float(preview_scorer.diff_sums[selected_position]),
+        )
+
+    def edge_map(self, position):
+        """
+        Returns the edge map at a position in edge_positions order
+
+        Parameters
+        ----------
+        position : int
+            a position in edge_positions
+
+        Returns
+        -------
+        numpy.ndarray
+        """
+        if self.edge_maps is not None:
+            return self.edge_maps[position]
+
+        frame_idx = self.edge_positions[position]
+        return self._laplacian(self.gray_frames[frame_idx : frame_idx + 1])[0]
+
+    def diff_map(self, position):
+        """
+        Returns the diff map at a position in edge_positions order
+
+        Parameters
+        ----------
+        position : int
+            a position in edge_positions
+
+        Returns
+        -------
+        numpy.ndarray
+        """
+        if self.diff_maps is not None:
+            return self.diff_maps[position]
+
+        return numpy.abs(self.edge_map(position) - self.edge_map(0))
+
+    def frame_location(self, frame_idx):
+        """
+        Returns the chunk order and the index in that chunk of a frame,
+        this can be used to find the source of a frame
+
+        Parameters
+        ----------
+        frame_idx : int
+            an index in video_frames
+
+        Returns
+        -------
+        (int, int)
+        """
+        for order, chunk_size in self.chunk_sizes:
+            if frame_idx < chunk_size:
+                return (order, frame_idx)
+
+            frame_idx -= chunk_size
+
+        raise IndexError("frame index out of range")
+
+    @staticmethod
+    def _convert_grayscale(video_frames):
+        first_frame = numpy.asarray(video_frames[0])
+        gray_frames = numpy.empty(
+            (len(video_frames),) + first_frame.shape[:2], dtype=numpy.uint8
+        )
+
+        # Convert one frame at a time so the RGB frames are never stacked
+        for frame_idx, frame in enumerate(video_frames):
+            frame = numpy.asarray(frame)
+
+            if frame.ndim == 2:
+                gray_frames[frame_idx] = frame
+            else:
+                cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY, dst=gray_frames[frame_idx])
+
+        return gray_frames
+
+    @staticmethod
+    def _stack_grayscale(video_frames):
+        rgb_frames = numpy.stack([numpy.asarray(frame) for frame in video_frames])
+        frame_count, height, width = rgb_frames.shape[:3]
+
+        # Frames that were decoded as grayscale are already done
+        if rgb_frames.ndim == 3:
+            return rgb_frames
+
+        # Colour conversion works per pixel, so the whole stack can be
+        # converted at once by treating it as one tall image
+        return cv2.cvtColor(
+            rgb_frames.reshape(frame_count * height, width, 3), cv2.COLOR_RGB2GRAY
+        ).reshape(frame_count, height, width)
+
+    @staticmethod
+    def _laplacian(gray_frames):
+        frame_count, height, width = gray_frames.shape
+
+        # Pad every frame with its own reflected border, this matches the
+        # default border mode of cv2.Laplacian and stops neighbouring frames
+        # from bleeding into each other when the stack is filtered as one image
+        padded_frames = numpy.pad(gray_frames, ((0, 0), (1, 1), (1, 1)), "reflect")
+        # The laplacian of an 8 bit image always fits in 16 bits, so this holds
+        # the exact same values as a CV_64F map in a quarter of the memory
+        edge_maps = cv2.Laplacian(
+            padded_frames.reshape(frame_count * (height + 2), width + 2), cv2.CV_16S
+        ).reshape(frame_count, height + 2, width + 2)
+
+        return numpy.ascontiguousarray(edge_maps[:, 1:-1, 1:-1])
+
+    @staticmethod
+    def _outlier_mask(values):
+        # Keep only the values within one standard deviation of the mean
+        mean = values.mean()
+        stdev = values.std(ddof=1)
+
+        return (values >= mean - stdev) & (values <= mean + stdev)
+
+    @staticmethod
+    def _variances(edge_maps):
+        return edge_maps.reshape(len(edge_maps), -1).var(axis=1)
+
+    @staticmethod
+    def _absdiff(edge_maps, ref_frame):
+        diff_maps = edge_maps - ref_frame
+        numpy.abs(diff_maps, out=diff_maps)
+        return diff_maps
+
+    @staticmethod
+    def _diff_sums(diff_maps):
+        # Integer sums are exact, which keeps the scores equal to float64 maps
+        return diff_maps.reshape(len(diff_maps), -1).sum(axis=1).astype(numpy.float64)
+
+    def _chunked_laplacian(self, gray_frames, frame_indices):
+        for chunk_start in range(0, len(frame_indices), self.LOW_MEMORY_CHUNK_SIZE):
+            chunk_indices = frame_indices[
+                chunk_start : chunk_start + self.LOW_MEMORY_CHUNK_SIZE
+            ]
+            yield self._laplacian(gray_frames[chunk_indices])
+
+    def _filter_edge_maps(self):
+        logger.debug("Filtering edge maps.")
+        # Join the chunks in order, the chunks are dropped afterwards
+        sorted_orders = sorted(self._frame_chunks)
+        frame_chunks = [self._frame_chunks[order] for order in sorted_orders]
+        self._frame_chunks = {}
+
+        self.video_frames = [frame for chunk in frame_chunks for frame in chunk[0]]
+        self.chunk_sizes = [
+            (order, len(chunk[0])) for order, chunk in zip(sorted_orders, frame_chunks)
+        ]
+        self.gray_frames = numpy.concatenate([chunk[1] for chunk in frame_chunks])
+        variances = numpy.concatenate([chunk[3] for chunk in frame_chunks])
+
+        # Sort by detail level and filter the outliers
+        sorted_positions = numpy.argsort(variances, kind="stable")
+        self.edge_positions = sorted_positions[
+            self._outlier_mask(variances)[sorted_positions]
+        ]
+        self.edge_variances = variances[self.edge_positions]
+
+        if not self.low_memory:
+            frame_edge_maps = [
+                edge_map for chunk in frame_chunks for edge_map in chunk[2]
+            ]
+            self.edge_maps = numpy.stack(
+                [frame_edge_maps[frame_idx] for frame_idx in self.edge_positions]
+            )
+
+        logger.info(f"Generated {len(self.edge_positions)} edge maps.")
+
+    def _generate_diff_maps(self):
+        logger.debug("Generating diff maps.")
+        # Use the lowest detail edge map as the reference frame
+        ref_frame = self.edge_map(0)
+
+        if self.low_memory:
+            # Edge maps are rebuilt chunk by chunk and only the sums are kept
+            self.diff_sums = numpy.concatenate(
+                [
+                    self._diff_sums(self._absdiff(chunk, ref_frame))
+                    for chunk in self._chunked_laplacian(
+                        self.gray_frames, self.edge_positions
+                    )
+                ]
+            )
+        else:
+            self.diff_maps = self._absdiff(self.edge_maps, ref_frame)
+            self.diff_sums = self._diff_sums(self.diff_maps)
+
+        logger.info(f"Generated {len(self.diff_sums)} diff maps.")
+
+
+class FrameScorerError(Exception):
+    pass
@@ -0,0 +1,141 @@
+import asyncio
+import httpx
+import importlib.util
+import os
+from app.logger import setup_logger
+
+logger = setup_logger(
+    __name__, log_level="DEBUG", log_file="video-analysis-service.log"
+)
+
+
+class HttpClientPool:
+    """
+    A class used to share one HTTP connection pool between all requests
+
+    Storyboards and thumbnails all come from the same few image hosts, sharing
+    a client lets requests reuse open connections instead of paying for new
+    TCP and TLS handshakes on every analysis
+
+    ...
+
+    Attributes
+    ----------
+    HTTP_TIMEOUT : int
+        a network timeout that is used when getting frames,
+        keep this at a reasonable level to allow for slow sources
+        without letting it get too long
+    MAX_CONNECTIONS : int
+        the maximum amount of open connections,
+        set with the HTTP_POOL_MAX_CONNECTIONS environment variable
+    MAX_KEEPALIVE_CONNECTIONS : int
+        the maximum amount of idle connections kept open for reuse,
+        set with the HTTP_POOL_MAX_KEEPALIVE_CONNECTIONS environment variable
+    KEEPALIVE_EXPIRY : float
+        the time in seconds an idle connection is kept open,
+        set with the HTTP_POOL_KEEPALIVE_EXPIRY environment variable
+    HTTP2 : bool
+        use HTTP/2 when the optional h2 package is installed,
+        set with the HTTP_POOL_HTTP2 environment variable
+    WARM_UP_URLS : [str]
+        URLs on the image hosts that are requested when warming up the pool,
+        set with the comma separated HTTP_POOL_WARM_UP_URLS environment variable
+    client : httpx.AsyncClient
+        the shared client, this is None until the pool is opened
+    requests_sent : int
+        the amount of requests sent through the pool
+    connections_opened : int
+        the amount of new connections the pool had to open
+
+    Methods
+    -------
+    open() -> None
+        creates the shared client
+    close() -> None
+        closes the shared client and all of its connections
+    warm_up() -> None
+        opens connections to the WARM_UP_URLS hosts ahead of the first request
+    stats() -> {str: int}
+        returns the amount of requests and opened and reused connections
+    """
+
+    HTTP_TIMEOUT = 20
+    MAX_CONNECTIONS = int(os.environ.get("HTTP_POOL_MAX_CONNECTIONS", 100))
+    MAX_KEEPALIVE_CONNECTIONS = int(
+        os.environ.get("HTTP_POOL_MAX_KEEPALIVE_CONNECTIONS", 20)
+    )
+    KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_POOL_KEEPALIVE_EXPIRY", 30))
+    HTTP2 = os.environ.get("HTTP_POOL_HTTP2", "false").lower() == "true"
+    WARM_UP_URLS = [
+        url
+        for url in os.environ.get(
+            "HTTP_POOL_WARM_UP_URLS", "https://i.ytimg.com/"
+        ).split(",")
+        if url
+    ]
+
+    def __init__(self):
+        self.client = None
+        self.requests_sent = 0
+        self.connections_opened = 0
+
+    async def open(self):
+        if self.client is not None:
+            return
+
+        http2 = self.HTTP2
+        # HTTP/2 support is an optional extra of httpx (httpx[http2])
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 requested but h2 is not installed, using HTTP/1.1.")
+            http2 = False
+
+        logger.info(
+            f"Opening HTTP connection pool: max_connections={self.MAX_CONNECTIONS}, "
+            f"max_keepalive_connections={self.MAX_KEEPALIVE_CONNECTIONS}, "
+            f"http2={http2}"
+        )
+        self.client = httpx.AsyncClient(
+            timeout=self.HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=self.MAX_CONNECTIONS,
+                max_keepalive_connections=self.MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=self.KEEPALIVE_EXPIRY,
+            ),
+            http2=http2,
+            event_hooks={"request": [self._trace_request]},
+        )
+
+    async def warm_up(self):
+        # The DNS lookups and TLS handshakes are done before the first request,
+        # the connections then stay in the pool until they expire
+        async def warm_up_url(url):
+            try:
+                await self.client.head(url)
+            except httpx.HTTPError as e:
+                logger.warning(f"Failed to warm up connection to {url}: {e!r}")
+
+        await asyncio.gather(*(warm_up_url(url) for url in self.WARM_UP_URLS))
+
+    async def close(self):
+        if self.client is None:
+            return
+
+        logger.info(f"Closing HTTP connection pool: {self.stats()}")
+        await self.client.aclose()
+        self.client = None
+
+    def stats(self):
+        return {
+            "requests": self.requests_sent,
+            "connections_opened": self.connections_opened,
+            "connections_reused": self.requests_sent - self.connections_opened,
+        }
+
+    async def _trace_request(self, request):
+        self.requests_sent += 1
+        # The transport reports connection events through the trace extension
+        request.extensions["trace"] = self._trace_connection
+
+    async def _trace_connection(self, event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
@@ -1,6 +1,14 @@
 import numpy as np
 import tflite_runtime.interpreter as tflite
+from PIL import Image
+from collections import OrderedDict
+from contextlib import contextmanager
+import os
+import queue
+import threading
+import time
 from app.logger import setup_logger
+from app.metrics import Counter, Histogram, stage_timer
 
 logger = setup_logger(
     __name__, log_level="DEBUG", log_file="video-analysis-service.log"
@@ -8,7 +16,58 @@ logger = setup_logger(
 
 
 class ImageClassifier:
-    MODEL_PATH = "model/model.tflite"
+    """
+    A class used to classify frames with a pool of TFLite interpreters
+
+    ...
+
+    Attributes
+    ----------
+    MODEL_PATH : str
+        the path to the TFLite model file, set with the
+        IMAGE_CLASSIFIER_MODEL_PATH environment variable, this can be a float
+        model or a uint8/int8 quantized variant of it
+    CLASS_NAMES : [str]
+        the category names in the order of the model outputs
+    IMAGE_DIMENSION : (int, int)
+        the frame size expected by the model
+    MAX_BATCH_SIZE : int
+        an upper limit for the amount of frames passed to a single invocation
+    BATCH_BUCKETS : (int)
+        the batch sizes the interpreters are invoked with, smaller batches
+        are padded up to the next bucket
+    BUCKET_INTERPRETERS : int
+        the maximum amount of interpreters, each allocated for one bucket,
+        kept in every pool slot, set with the
+        IMAGE_CLASSIFIER_BUCKET_INTERPRETERS environment variable
+    POOL_SIZE : int
+        the amount of interpreters that can run inference concurrently,
+        set with the IMAGE_CLASSIFIER_POOL_SIZE environment variable,
+        defaults to the CPUs this process may run on, up to DEFAULT_MAX_POOL_SIZE
+    DEFAULT_MAX_POOL_SIZE : int
+        the largest default POOL_SIZE, larger pools have to be set explicitly
+    NUM_THREADS : int
+        the amount of threads used by each interpreter,
+        set with the IMAGE_CLASSIFIER_NUM_THREADS environment variable
+    XNNPACK : bool
+        whether the interpreters use the XNNPACK delegate,
+        set with the IMAGE_CLASSIFIER_XNNPACK environment variable
+    interpreter_wait_time : Histogram
+        the time requests spend waiting for an interpreter to become available
+    tensor_allocations : Counter
+        the amount of times tensors were allocated for a new batch size
+
+    Methods
+    -------
+    classify_frame(numpy.ndarray | PIL.Image.Image) -> {str: float}
+        returns the category scores for a single frame
+    classify_frames([numpy.ndarray | PIL.Image.Image]) -> [{str: float}]
+        returns the category scores for a batch of frames
+    warm_up() -> None
+        runs a dummy inference on every pooled interpreter
+    """
+
+    MODEL_PATH = os.environ.get("IMAGE_CLASSIFIER_MODEL_PATH", "model/model.tflite")
     CLASS_NAMES = [
         "graphics",
         "lowLight",
@@ -19,8 +78,39 @@ class ImageClassifier:
         "textHeavy",
     ]
     IMAGE_DIMENSION = (224, 224)
+    MAX_BATCH_SIZE = 16
+    BATCH_BUCKETS = (1, 2, 4, 8, 16)
+    BUCKET_INTERPRETERS = max(
+        1, int(os.environ.get("IMAGE_CLASSIFIER_BUCKET_INTERPRETERS", 2))
+    )
+    NUM_THREADS = int(os.environ.get("IMAGE_CLASSIFIER_NUM_THREADS", 1))
+    XNNPACK = os.environ.get("IMAGE_CLASSIFIER_XNNPACK", "true").lower() == "true"
+    DEFAULT_MAX_POOL_SIZE = 4
+    # os.cpu_count() is the CPU count of the host, the affinity mask follows
+    # the CPUs of the container, CPU quotas aren't visible to either of them
+    _AVAILABLE_CPUS = (
+        len(os.sched_getaffinity(0))
+        if hasattr(os, "sched_getaffinity")
+        else os.cpu_count() or 1
+    )
+    POOL_SIZE = int(
+        os.environ.get(
+            "IMAGE_CLASSIFIER_POOL_SIZE",
+            max(1, min(DEFAULT_MAX_POOL_SIZE, _AVAILABLE_CPUS // NUM_THREADS)),
+        )
+    )
+
+    interpreter_wait_time = Histogram(
+        "image_classifier_interpreter_wait_seconds",
+        "Time spent waiting to check out an interpreter",
+    )
+    tensor_allocations = Counter(
+        "image_classifier_tensor_allocations_total",
+        "Times tensors were allocated for a new batch size",
+    )
 
     _instance = None
+    _init_lock = threading.Lock()
 
     # returns the static instance variable on every instantiation
     def __new__(cls):
@@ -31,42 +121,257 @@ class ImageClassifier:
 
     def __init__(self):
         logger.debug("Initializing ImageClassifier.")
-        # check if interpreter instantiated in instance, if not set interpreter and details
-        try:
-            self._interpreter
-        except AttributeError:
-            logger.debug("Loading TFLite model.")
-            # load model through interpreter api
-            self._interpreter = tflite.Interpreter(
-                model_path=ImageClassifier.MODEL_PATH
+        # Concurrent first calls from worker threads must not load the model twice
+        with ImageClassifier._init_lock:
+            # check if the pool is instantiated in instance, if not load it
+            if hasattr(self, "_interpreter_pool"):
+                return
+
+            logger.debug(
+                f"Loading {ImageClassifier.POOL_SIZE} TFLite interpreters "
+                f"with {ImageClassifier.NUM_THREADS} threads each, "
+                f"xnnpack={ImageClassifier.XNNPACK}."
             )
-            self._interpreter.allocate_tensors()
+            interpreter_pool = queue.Queue(maxsize=ImageClassifier.POOL_SIZE)
 
-            # retieve details of input and output tensors to shape input image acccordingly
-            self._input_details = self._interpreter.get_input_details()[0]
-            self._output_details = self._interpreter.get_output_details()[0]
+            for _ in range(ImageClassifier.POOL_SIZE):
+                interpreter_pool.put(_PooledInterpreter(ImageClassifier.MODEL_PATH))
+
+            # retieve details of input and output tensors to shape input images
+            # these are the same for every interpreter since they share the model
+            pooled_interpreter = interpreter_pool.queue[0]
+            self._input_details = pooled_interpreter.input_details
+            self._output_details = pooled_interpreter.output_details
+            self._interpreter_pool = interpreter_pool
             logger.info("Model loaded successfully.")
 
+    def warm_up(self):
+        # The first invocation of an interpreter sets up its delegate and
+        # kernels, check out every interpreter so each one runs once
+        logger.debug("Warming up the pooled interpreters.")
+        pooled_interpreters = [
+            self._interpreter_pool.get() for _ in range(ImageClassifier.POOL_SIZE)
+        ]
+        try:
+            dummy_array = np.zeros(
+                (1,) + ImageClassifier.IMAGE_DIMENSION + (3,), dtype=np.uint8
+            )
+            for pooled_interpreter in pooled_interpreters:
+                pooled_interpreter.invoke(dummy_array)
+        finally:
+            for pooled_interpreter in pooled_interpreters:
+                self._interpreter_pool.put(pooled_interpreter)
+
     def classify_frame(self, frame):
         logger.debug("Classifying frame.")
-        resized_frame = frame.resize(ImageClassifier.IMAGE_DIMENSION)
-        numpy_image = np.array(resized_frame).reshape(
-            (ImageClassifier.IMAGE_DIMENSION + (3,))
-        )
+        image_scores = self.classify_frames([frame])[0]
 
-        # shape image according to model input tensor shape and pass image as batch
-        prediction_array = np.expand_dims(numpy_image, axis=0).astype(
-            self._input_details["dtype"]
-        )
-        self._interpreter.set_tensor(self._input_details["index"], prediction_array)
-        self._interpreter.invoke()
-        prediction = self._interpreter.get_tensor(self._output_details["index"])[0]
+        logger.debug("Image scores: %s", image_scores)
+        return image_scores
+
+    def classify_frames(self, frames):
+        """
+        Classifies a batch of frames with a single interpreter invocation
+
+        The interpreter input tensor is resized to the batch size so that
+        the interpreter overhead is paid once per batch instead of once per frame,
+        batches larger than MAX_BATCH_SIZE are split into multiple invocations
+        and each invocation is padded up to one of the BATCH_BUCKETS sizes
+
+        Parameters
+        ----------
+        frames : [numpy.ndarray | PIL.Image.Image]
+            a list of RGB frames to be classified, either as arrays or PIL images
+
+        Returns
+        -------
+        [{str: float}]
+            a list of category score maps, in the same order as the frames
+        """
+        logger.debug(f"Classifying {len(frames)} frames.")
+        image_scores = []
+
+        for batch_start in range(0, len(frames), ImageClassifier.MAX_BATCH_SIZE):
+            batch_frames = frames[
+                batch_start : batch_start + ImageClassifier.MAX_BATCH_SIZE
+            ]
+            # Fill the whole batch into one contiguous array, the interpreter
+            # converts it to the input type of the model
+            prediction_array = np.stack(
+                [self._prepare_frame(frame) for frame in batch_frames]
+            )
+
+            with (
+                self._checkout_interpreter() as pooled_interpreter,
+                stage_timer("classify"),
+            ):
+                predictions = pooled_interpreter.invoke(prediction_array)
+
+            image_scores.extend(
+                self._generate_image_scores(prediction) for prediction in predictions
+            )
+
+        return image_scores
+
+    @contextmanager
+    def _checkout_interpreter(self):
+        # Blocks until one of the pooled interpreters is free
+        wait_start = time.perf_counter()
+        pooled_interpreter = self._interpreter_pool.get()
+        ImageClassifier.interpreter_wait_time.observe(time.perf_counter() - wait_start)
+
+        try:
+            yield pooled_interpreter
+        finally:
+            self._interpreter_pool.put(pooled_interpreter)
+
+    @staticmethod
+    def _prepare_frame(frame):
+        # Frames can be array views into a storyboard, resize them the same way
+        # as PIL images so the scores don't depend on the frame type
+        if isinstance(frame, np.ndarray):
+            frame = Image.fromarray(frame)
 
-        logger.debug("Generating image scores.")
-        image_scores = {
+        resized_frame = frame.resize(ImageClassifier.IMAGE_DIMENSION)
+        return np.array(resized_frame).reshape((ImageClassifier.IMAGE_DIMENSION + (3,)))
+
+    @staticmethod
+    def _generate_image_scores(prediction):
+        return {
             class_name: float(score)
             for class_name, score in zip(ImageClassifier.CLASS_NAMES, prediction)
         }
 
-        logger.info(f"Image scores: {image_scores}")
-        return image_scores
+
+class _PooledInterpreter:
+    """
+    A TFLite interpreter that is only ever used by one thread at a time
+
+    The interpreter is not thread-safe, so it must be checked out of the
+    ImageClassifier pool before use. Quantized models are given the same
+    pixel values as float models, the inputs are quantized and the outputs
+    dequantized with the scale and zero point of their tensors. Resizing
+    the input reallocates every tensor, so batches are padded to the
+    ImageClassifier.BATCH_BUCKETS sizes and up to BUCKET_INTERPRETERS
+    interpreters are kept allocated for the most recently used buckets
+    """
+
+    def __init__(self, model_path, num_threads=None, xnnpack=None):
+        if num_threads is None:
+            num_threads = ImageClassifier.NUM_THREADS
+        if xnnpack is None:
+            xnnpack = ImageClassifier.XNNPACK
+
+        # XNNPACK is applied by default, it can only be turned off by using
+        # the builtin kernels without the default delegates
+        op_resolver_type = (
+            tflite.OpResolverType.AUTO
+            if xnnpack
+            else tflite.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+        )
+
+        self._model_path = model_path
+        self._num_threads = num_threads
+        self._op_resolver_type = op_resolver_type
+
+        # load model through interpreter api, with a batch size of 1
+        interpreter = self._load_interpreter()
+        interpreter.allocate_tensors()
+        self._interpreters = OrderedDict({1: interpreter})
+
+        self.input_details = interpreter.get_input_details()[0]
+        self.output_details = interpreter.get_output_details()[0]
+
+    @property
+    def batch_sizes(self):
+        return sorted(self._interpreters)
+
+    def invoke(self, prediction_array):
+        frame_count = len(prediction_array)
+        # Flushed batches come in every size, padding them to a few bucket
+        # sizes keeps the interpreter from reallocating on most invocations
+        batch_size = next(
+            (
+                bucket
+                for bucket in ImageClassifier.BATCH_BUCKETS
+                if bucket >= frame_count
+            ),
+            frame_count,
+        )
+        if batch_size != frame_count:
+            padded_array = np.zeros(
+                (batch_size,) + prediction_array.shape[1:], prediction_array.dtype
+            )
+            padded_array[:frame_count] = prediction_array
+            prediction_array = padded_array
+
+        interpreter = self._get_interpreter(batch_size)
+        interpreter.set_tensor(
+            self.input_details["index"],
+            self._quantize(prediction_array, self.input_details),
+        )
+        interpreter.invoke()
+        # Dequantizing copies the output, the tensor buffer is reused by the
+        # next invocation, the outputs of the padding frames are dropped
+        return self._dequantize(
+            interpreter.get_tensor(self.output_details["index"])[:frame_count],
+            self.output_details,
+        )
+
+    @staticmethod
+    def _quantize(values, tensor_details):
+        dtype = tensor_details["dtype"]
+        scale, zero_point = tensor_details["quantization"]
+
+        # Float tensors have a scale of 0, uint8 pixels can also be passed
+        # as they are when the quantization is the identity
+        if scale == 0 or (values.dtype == dtype and (scale, zero_point) == (1, 0)):
+            return values.astype(dtype, copy=False)
+
+        dtype_info = np.iinfo(dtype)
+        return np.clip(
+            np.round(values / np.float32(scale) + zero_point),
+            dtype_info.min,
+            dtype_info.max,
+        ).astype(dtype)
+
+    @staticmethod
+    def _dequantize(values, tensor_details):
+        scale, zero_point = tensor_details["quantization"]
+
+        if scale == 0:
+            return values.astype(np.float32)
+
+        return (values.astype(np.float32) - zero_point) * np.float32(scale)
+
+    def _load_interpreter(self):
+        return tflite.Interpreter(
+            model_path=self._model_path,
+            num_threads=self._num_threads,
+            experimental_op_resolver_type=self._op_resolver_type,
+        )
+
+    def _get_interpreter(self, batch_size):
+        # Allocating tensors is expensive, so interpreters are kept allocated
+        # for the buckets that were used last
+        if batch_size in self._interpreters:
+            self._interpreters.move_to_end(batch_size)
+            return self._interpreters[batch_size]
+
+        logger.debug(f"Allocating an interpreter for batch size {batch_size}.")
+        if len(self._interpreters) < ImageClassifier.BUCKET_INTERPRETERS:
+            interpreter = self._load_interpreter()
+        else:
+            # Every interpreter holds its own weights and buffers, so resize
+            # the least recently used one instead of loading another
+            _, interpreter = self._interpreters.popitem(last=False)
+
+        interpreter.resize_tensor_input(
+            self.input_details["index"],
+            (batch_size,) + ImageClassifier.IMAGE_DIMENSION + (3,),
+        )
+        interpreter.allocate_tensors()
+        ImageClassifier.tensor_allocations.inc()
+
+        self._interpreters[batch_size] = interpreter
+        return interpreter
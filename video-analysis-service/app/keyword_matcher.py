@@ -0,0 +1,157 @@
+import re
+from app.logger import setup_logger
+
+logger = setup_logger(
+    __name__, log_level="DEBUG", log_file="video-analysis-service.log"
+)
+
+
+class KeywordMatcher:
+    """
+    A class used to find the keywords of every category in one pass over a text
+
+    All the keywords are compiled into a single case insensitive regex,
+    an alternation laid out as a prefix tree with a named group marking the end
+    of each keyword, so every position of the text is only visited once and
+    keywords that share a prefix are only compared once. Keywords are matched
+    literally and must have either a non-word character or the edge of the
+    text on both sides
+
+    Longer keywords are tried first, so at every position the regex reports
+    the longest keyword that matches there. Any shorter keyword that also
+    matches at that position must be a prefix of it that ends right before
+    a non-word character, these are worked out ahead of time and counted as
+    hits along with the reported keyword
+
+    ...
+
+    Attributes
+    ----------
+    keywords : {str: [str]}
+        a map of categories to keywords
+    pattern : re.Pattern
+        the compiled regex, this is None when there are no keywords
+
+    Methods
+    -------
+    find_keywords(str) -> {str}
+        returns the lowercase keywords that are found in a text
+    calculate_scores(str) -> {str: int}
+        returns the number of keywords found for each category
+    """
+
+    def __init__(self, keywords):
+        """
+        Parameters
+        ----------
+        keywords : {str: [str]}
+            a map of categories to keywords
+        """
+        self.keywords = keywords
+
+        # Keywords are case insensitive, so only one spelling of each is needed
+        unique_keywords = sorted(
+            {keyword.lower() for values in keywords.values() for keyword in values}
+            - {""},
+            key=lambda keyword: (-len(keyword), keyword),
+        )
+        self._group_keywords = {
+            f"k{keyword_idx}": keyword
+            for keyword_idx, keyword in enumerate(unique_keywords)
+        }
+        self._implied_keywords = {
+            keyword: self._find_implied_keywords(keyword, unique_keywords)
+            for keyword in unique_keywords
+        }
+
+        if len(unique_keywords) == 0:
+            self.pattern = None
+        else:
+            keyword_trie = {}
+            for group, keyword in self._group_keywords.items():
+                trie_node = keyword_trie
+                for char in keyword:
+                    trie_node = trie_node.setdefault(char, {})
+                trie_node[None] = group
+
+            # The lookahead doesn't consume the text, so keywords that
+            # overlap each other can still all be found
+            self.pattern = re.compile(
+                f"(?<!\\w)(?={self._trie_pattern(keyword_trie)})", re.IGNORECASE
+            )
+
+        logger.debug(f"Compiled keyword matcher for {len(unique_keywords)} keywords.")
+
+    def find_keywords(self, text):
+        """
+        Returns the lowercase keywords that are found in a text
+
+        Parameters
+        ----------
+        text : str
+            the text that will be searched for keywords
+
+        Returns
+        -------
+        {str}
+        """
+        if self.pattern is None:
+            return set()
+
+        found_keywords = set()
+        for match in self.pattern.finditer(text):
+            keyword = self._group_keywords[match.lastgroup]
+
+            if keyword not in found_keywords:
+                found_keywords.add(keyword)
+                found_keywords.update(self._implied_keywords[keyword])
+
+        return found_keywords
+
+    def calculate_scores(self, text):
+        """
+        Returns the number of keywords found for each category
+
+        Parameters
+        ----------
+        text : str
+            the text that will be searched for keywords
+
+        Returns
+        -------
+        {str: int}
+        """
+        found_keywords = self.find_keywords(text)
+
+        # Keywords that are listed more than once in a category count each time
+        return {
+            key: sum(keyword.lower() in found_keywords for keyword in values)
+            for key, values in self.keywords.items()
+        }
+
+    @staticmethod
+    def _find_implied_keywords(keyword, unique_keywords):
+        # A shorter keyword matches wherever this one does if it's a prefix
+        # of this keyword that is followed by a non-word character
+        return [
+            prefix
+            for prefix in unique_keywords
+            if len(prefix) < len(keyword)
+            and keyword.startswith(prefix)
+            and re.match(r"\W", keyword[len(prefix)])
+        ]
+
+    @staticmethod
+    def _trie_pattern(trie_node):
+        # Longer keywords are tried first by putting the branches that continue
+        # the keyword before the branch that ends it
+        branches = [
+            re.escape(char) + KeywordMatcher._trie_pattern(child_node)
+            for char, child_node in trie_node.items()
+            if char is not None
+        ]
+        if None in trie_node:
+            # An empty named group marks which keyword ended here
+            branches.append(f"(?P<{trie_node[None]}>)(?!\\w)")
+
+        return f"(?:{'|'.join(branches)})"
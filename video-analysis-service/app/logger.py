@@ -1,4 +1,10 @@
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import itertools
 import logging
+import os
+import queue
+import threading
 
 
 LOG_LEVELS = {
@@ -14,24 +20,112 @@ LOG_FORMATTER = logging.Formatter(
 )
 CONSOLE_FORMATTER = logging.Formatter("%(levelname)s - %(name)s - %(message)s")
 
+# Overrides the level every module asks for, so production can log less
+LOG_LEVEL = os.environ.get("LOG_LEVEL")
+# Hot loops only log one in this many messages
+LOG_SAMPLE_EVERY = int(os.environ.get("LOG_SAMPLE_EVERY", 20))
+
+# One queue handler per log file, shared by every logger that writes to it
+_queue_handlers = {}
+_queue_handlers_lock = threading.Lock()
+
 
 def setup_logger(name, log_level="INFO", log_file=None):
     logger = logging.getLogger(name)
-    logger.setLevel(LOG_LEVELS.get(log_level.upper(), logging.INFO))
+    logger.setLevel(LOG_LEVELS.get((LOG_LEVEL or log_level).upper(), logging.INFO))
 
     # Remove all handlers
-    for handler in logger.handlers:
+    for handler in list(logger.handlers):
         logger.removeHandler(handler)
 
-    # Add console handler
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(CONSOLE_FORMATTER)
-    logger.addHandler(console_handler)
-
-    # Add file handler if log file is provided
-    if log_file:
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setFormatter(LOG_FORMATTER)
-        logger.addHandler(file_handler)
+    # Records are only queued here, writing them happens on a listener thread
+    logger.addHandler(_get_queue_handler(log_file))
 
     return logger
+
+
+def _get_queue_handler(log_file):
+    with _queue_handlers_lock:
+        if log_file in _queue_handlers:
+            return _queue_handlers[log_file]
+
+        # Add console handler
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(CONSOLE_FORMATTER)
+        handlers = [console_handler]
+
+        # Add file handler if log file is provided
+        if log_file:
+            file_handler = logging.FileHandler(log_file)
+            file_handler.setFormatter(LOG_FORMATTER)
+            handlers.append(file_handler)
+
+        log_queue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, *handlers)
+        listener.start()
+        # Write out whatever is still queued when the process exits
+        atexit.register(listener.stop)
+
+        queue_handler = QueueHandler(log_queue)
+        _queue_handlers[log_file] = queue_handler
+        return queue_handler
+
+
+class SampledLogger:
+    """
+    A class used to log from hot loops without logging every iteration
+
+    Only one in every few messages is logged, messages are dropped before
+    they are formatted, so arguments should be passed separately
+    (logger.debug("Value: %s", value)) rather than in an f-string
+
+    ...
+
+    Attributes
+    ----------
+    logger : logging.Logger
+        the logger the sampled messages are logged to
+    every : int
+        one in this many messages is logged
+
+    Methods
+    -------
+    debug(str, *object) -> None
+        logs a sampled debug message
+    info(str, *object) -> None
+        logs a sampled info message
+    log(int, str, *object) -> None
+        logs a sampled message at the given level
+    """
+
+    def __init__(self, logger, every=LOG_SAMPLE_EVERY):
+        """
+        Parameters
+        ----------
+        logger : logging.Logger
+            the logger the sampled messages are logged to
+        every : int
+            one in this many messages is logged
+        """
+        self.logger = logger
+        self.every = max(1, every)
+        # next() on a count is atomic, so this is safe to share between threads
+        self._message_count = itertools.count()
+
+    def debug(self, message, *args):
+        self.log(logging.DEBUG, message, *args)
+
+    def info(self, message, *args):
+        self.log(logging.INFO, message, *args)
+
+    def log(self, level, message, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+
+        if next(self._message_count) % self.every != 0:
+            return
+
+        if self.every > 1:
+            message = f"{message} (1 in {self.every} logged)"
+
+        self.logger.log(level, message, *args)
@@ -0,0 +1,95 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class LRUCache:
+    """
+    A thread-safe, size bounded cache that evicts the least recently used entry
+
+    ...
+
+    Attributes
+    ----------
+    max_size : int
+        the maximum amount of entries kept in the cache
+    ttl : float
+        the time in seconds an entry stays valid for, entries never expire if None
+    hits : int
+        the amount of lookups that found a valid entry
+    misses : int
+        the amount of lookups that found no entry or an expired one
+    evictions : int
+        the amount of entries dropped to stay within max_size
+
+    Methods
+    -------
+    get(object, object) -> object
+        returns the cached value for a key, or the default if there is none
+    put(object, object) -> None
+        stores a value for a key
+    clear() -> None
+        removes every entry from the cache
+    stats() -> {str: int}
+        returns the hit, miss and eviction counters and the current size
+    """
+
+    def __init__(self, max_size, ttl=None):
+        """
+        Parameters
+        ----------
+        max_size : int
+            the maximum amount of entries kept in the cache
+        ttl : float
+            the time in seconds an entry stays valid for,
+            entries never expire if None
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Maps keys to (expiry time, value), ordered from least to most recent use
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or (entry[0] is not None and entry[0] < time.monotonic()):
+                # Drop the expired entry so it doesn't take up space
+                self._entries.pop(key, None)
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
@@ -1,17 +1,189 @@
-from fastapi import FastAPI
+from contextlib import aclosing, asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import Json
+from pydantic import BaseModel, Json
 from app.video_analyser import VideoAnalyser
-from app.video_downloader import VideoDownloader
 from app.image_classifier import ImageClassifier
+from app.video_downloader import VideoDownloader
+from app.classification_batcher import ClassificationBatcher
+from app.http_pool import HttpClientPool
+from app.result_cache import ResultCache
+from app.single_flight import SingleFlight
+from app.metrics import Counter, Gauge, registry
 import asyncio
+import os
+import time
 from app.logger import setup_logger
 
 logger = setup_logger(
     __name__, log_level="DEBUG", log_file="video-analysis-service.log"
 )
 
-app = FastAPI()
+# The maximum amount of videos in a batch that are looked up at once
+TEXT_ANALYSIS_BATCH_CONCURRENCY = int(
+    os.environ.get("TEXT_ANALYSIS_BATCH_CONCURRENCY", 8)
+)
+
+# Shared by every request so connections to the image hosts are reused
+http_pool = HttpClientPool()
+# Selected frames from concurrent requests are classified together
+classification_batcher = ClassificationBatcher()
+# Frame analysis results are kept on disk between restarts
+result_cache = ResultCache()
+# Concurrent requests for the same video share one analysis
+single_flight = SingleFlight()
+# Set once the models and caches are warm, until then /ready fails
+service_ready = asyncio.Event()
+
+startup_time = Gauge(
+    "startup_seconds", "Time from the start of the process until it was warmed up"
+)
+in_flight_requests = Gauge(
+    "http_requests_in_flight", "Amount of requests that are being handled"
+)
+
+
+def _process_start_time():
+    # The process start time also covers starting the interpreter and importing
+    # the modules (cv2, tflite, yt_dlp), which happen before the lifespan starts
+    try:
+        with open("/proc/self/stat") as stat_file:
+            # The command name can hold spaces, the fields after it can't
+            start_ticks = int(stat_file.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+    return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+
+
+# The time the process started at, or None where /proc isn't available
+PROCESS_START_TIME = _process_start_time()
+
+
+def _default_executor_queue_size():
+    # asyncio.to_thread queues its work on the default executor of the loop
+    try:
+        executor = getattr(asyncio.get_running_loop(), "_default_executor", None)
+    except RuntimeError:
+        return 0
+
+    if executor is None:
+        return 0
+
+    return executor._work_queue.qsize()
+
+
+def _hit_ratio(cache):
+    lookups = cache.hits + cache.misses
+    return cache.hits / lookups if lookups > 0 else 0.0
+
+
+default_executor_queue_size = Gauge(
+    "default_executor_queue_size",
+    "Amount of jobs waiting for a thread in the default executor",
+    function=_default_executor_queue_size,
+)
+cache_hit_ratios = [
+    Gauge(
+        "cache_hit_ratio",
+        "Share of cache lookups that found an entry",
+        function=lambda cache=cache: _hit_ratio(cache),
+        labels={"cache": cache_name},
+    )
+    for cache_name, cache in (
+        ("metadata", VideoDownloader.metadata_cache),
+        ("keyword", VideoAnalyser.keyword_cache),
+        ("fragment", VideoDownloader.fragment_cache),
+        ("result", result_cache),
+    )
+]
+analyses_in_flight = Gauge(
+    "analyses_in_flight",
+    "Amount of analyses that are running, shared by concurrent requests",
+    function=lambda: single_flight.stats()["in_flight"],
+)
+# Reused connections skipped the TCP and TLS handshakes
+http_pool_stats = [
+    Counter(
+        f"http_pool_{stat}_total",
+        description,
+        function=lambda stat=stat: http_pool.stats()[stat],
+    )
+    for stat, description in (
+        ("requests", "Amount of requests sent through the shared HTTP pool"),
+        ("connections_opened", "Amount of new connections the HTTP pool opened"),
+        ("connections_reused", "Amount of requests that reused an open connection"),
+    )
+]
+# Every follower is an analysis that didn't have to run
+single_flight_calls = [
+    Counter(
+        "single_flight_calls_total",
+        "Amount of requests that ran an analysis (leader) or shared one (follower)",
+        function=lambda stat=stat: single_flight.stats()[stat],
+        labels={"role": role},
+    )
+    for role, stat in (("leader", "leaders"), ("follower", "followers"))
+]
+
+
+class TextAnalysisBatchRequest(BaseModel):
+    video_ids: list[str]
+    category_keywords: dict[str, list[str]] | None = None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    startup_start = PROCESS_START_TIME or time.time()
+    # Hashing the model can be slow, results aren't cached until it's done
+    result_cache_task = asyncio.create_task(asyncio.to_thread(result_cache.open))
+    await asyncio.to_thread(VideoDownloader.fragment_cache.open)
+    await http_pool.open()
+    await classification_batcher.start()
+    await VideoDownloader.start_extractor_pool()
+    # Requests are served while warming up, they are just slower
+    warm_up_task = asyncio.create_task(warm_up(startup_start))
+    yield
+    warm_up_task.cancel()
+    await asyncio.gather(warm_up_task, return_exceptions=True)
+    await VideoDownloader.shutdown_extractor_pool()
+    await classification_batcher.close()
+    await http_pool.close()
+    await asyncio.gather(result_cache_task, return_exceptions=True)
+    await asyncio.to_thread(result_cache.close)
+
+
+async def warm_up(startup_start):
+    # Everything that is otherwise loaded lazily by the first requests
+    warm_up_steps = (
+        ("image classifier", lambda: ImageClassifier().warm_up()),
+        ("video analyser", VideoAnalyser.warm_up),
+        ("video downloader", VideoDownloader.warm_up),
+    )
+
+    try:
+        for step_name, warm_up_step in warm_up_steps:
+            step_start = time.perf_counter()
+            await asyncio.to_thread(warm_up_step)
+            logger.info(
+                f"Warmed up the {step_name} in {time.perf_counter() - step_start:.3f}s."
+            )
+
+        await http_pool.warm_up()
+    except Exception as e:
+        # Stay unready so no traffic is routed to a broken instance
+        logger.error(f"Warm-up failed, the service will not become ready: {e!r}")
+        return
+
+    startup_time.set(time.time() - startup_start)
+    service_ready.set()
+    logger.info(f"Service ready after {startup_time.value():.3f}s.")
+
+
+app = FastAPI(lifespan=lifespan)
 # Restrict this when we deploy
 app.add_middleware(
     CORSMiddleware,
@@ -22,35 +194,90 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def count_in_flight_requests(request: Request, call_next):
+    in_flight_requests.inc()
+    try:
+        return await call_next(request)
+    finally:
+        in_flight_requests.dec()
+
+
 @app.get("/")
 def root_route():
     logger.info("Received request for root route.")
-    return {"error": "Use GET /video-analysis instead"}
+    return {"error": "Use GET /analysis instead"}
+
+
+@app.get("/ready")
+async def ready_route():
+    if not service_ready.is_set():
+        return JSONResponse({"ready": False}, status_code=503)
+
+    return {"ready": True}
+
+
+@app.get("/metrics")
+async def metrics_route():
+    # Async so the gauges are read on the event loop thread
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/text-analysis")
 async def text_analysis_route(video_id: str, category_keywords: Json | None = None):
     logger.info(
-        f"Received request for text analysis: video_id: {video_id}, category_keywords: {category_keywords}"
+        "Received request for text analysis: video_id: %s, category_keywords: %s",
+        video_id,
+        category_keywords,
     )
 
-    vid_dl = VideoDownloader(video_id)
-    video_category, video_text_data = await vid_dl.get_video_text_info()
+    vid_dl = VideoDownloader(video_id, http_pool.client)
+    keyword_matcher = VideoAnalyser.get_keyword_matcher(category_keywords)
 
-    merged_keywords = VideoAnalyser.merge_keywords(category_keywords)
-    text_scores = VideoAnalyser.calculate_text_scores(video_text_data, merged_keywords)
+    response_data = VideoAnalyser.generate_dummy_scores()
+    response_data.update(await analyse_text(vid_dl, keyword_matcher))
 
-    is_yt_categorized = VideoAnalyser.yt_categorization_check(
-        video_category, text_scores
+    logger.info("Text analysis complete, sending data")
+    logger.debug("Response data: %s", response_data)
+
+    return response_data
+
+
+@app.post("/text-analysis/batch")
+async def text_analysis_batch_route(batch_request: TextAnalysisBatchRequest):
+    logger.info(
+        "Received request for batch text analysis: video_ids: %s, category_keywords: %s",
+        batch_request.video_ids,
+        batch_request.category_keywords,
     )
 
-    response_data = VideoAnalyser.generate_dummy_scores()
+    # Every video in the batch is scored with the same keywords
+    keyword_matcher = VideoAnalyser.get_keyword_matcher(batch_request.category_keywords)
+    semaphore = asyncio.Semaphore(TEXT_ANALYSIS_BATCH_CONCURRENCY)
 
-    response_data["isYtCategorized"] = is_yt_categorized
-    response_data["textScores"] = text_scores
+    async def analyse_video_text(video_id):
+        response_data = {"videoId": video_id}
 
-    logger.info("Text analysis complete, sending data")
-    logger.info(response_data)
+        async with semaphore:
+            try:
+                vid_dl = VideoDownloader(video_id, http_pool.client)
+                response_data.update(VideoAnalyser.generate_dummy_scores())
+                response_data.update(await analyse_text(vid_dl, keyword_matcher))
+            except Exception as e:
+                # One bad video shouldn't fail the rest of the batch
+                logger.error(f"Text analysis failed for video_id: {video_id}: {e!r}")
+                response_data = {"videoId": video_id, "error": repr(e)}
+
+        return response_data
+
+    response_data = {
+        "results": await asyncio.gather(
+            *(analyse_video_text(video_id) for video_id in batch_request.video_ids)
+        )
+    }
+
+    logger.info("Batch text analysis complete, sending data")
+    logger.debug("Response data: %s", response_data)
 
     return response_data
 
@@ -58,33 +285,137 @@ async def text_analysis_route(video_id: str, category_keywords: Json | None = No
 @app.get("/video-analysis")
 async def video_analysis_route(video_id: str, category_keywords: Json | None = None):
     logger.info(
-        f"Received request for video analysis: video_id: {video_id}, category_keywords: {category_keywords}"
+        "Received request for video analysis: video_id: %s, category_keywords: %s",
+        video_id,
+        category_keywords,
     )
 
-    vid_dl = VideoDownloader(video_id)
+    vid_dl = VideoDownloader(video_id, http_pool.client)
 
     response_data = VideoAnalyser.generate_dummy_scores()
+    response_data.update(await analyse_frames(vid_dl))
+
+    logger.info("Video analysis completed. Returning response data.")
+    logger.debug("Response data: %s", response_data)
+    return response_data
+
+
+@app.get("/analysis")
+async def analysis_route(video_id: str, category_keywords: Json | None = None):
+    logger.info(
+        "Received request for analysis: video_id: %s, category_keywords: %s",
+        video_id,
+        category_keywords,
+    )
+
+    # One downloader for both halves so the video info is only extracted once
+    vid_dl = VideoDownloader(video_id, http_pool.client)
+
+    response_data = VideoAnalyser.generate_dummy_scores()
+
+    keyword_matcher = VideoAnalyser.get_keyword_matcher(category_keywords)
+
+    # Start downloading the frames while the text is being scored
+    frame_analysis_task = asyncio.create_task(analyse_uncategorized_frames(vid_dl))
+    try:
+        response_data.update(await analyse_text(vid_dl, keyword_matcher))
+
+        frame_analysis = await frame_analysis_task
+        if frame_analysis is None:
+            logger.info("Video is YT categorized, skipped frame analysis.")
+        else:
+            response_data.update(frame_analysis)
+    finally:
+        if not frame_analysis_task.done():
+            frame_analysis_task.cancel()
+            await asyncio.gather(frame_analysis_task, return_exceptions=True)
+
+    logger.info("Analysis completed. Returning response data.")
+    logger.debug("Response data: %s", response_data)
+    return response_data
+
+
+async def analyse_text(vid_dl, keyword_matcher):
+    # The matcher is cached per keyword set, so it identifies the keywords
+    return await single_flight.run(
+        ("text", vid_dl.video_id, keyword_matcher),
+        lambda: calculate_text_analysis(vid_dl, keyword_matcher),
+    )
+
+
+async def analyse_frames(vid_dl):
+    return await single_flight.run(
+        ("frames", vid_dl.video_id), lambda: calculate_frame_analysis(vid_dl)
+    )
+
+
+async def analyse_uncategorized_frames(vid_dl):
+    # The frames aren't needed if YT has already categorized the video,
+    # so check as soon as the video info is in, before any download starts
+    video_category, _ = await vid_dl.get_video_text_info()
+    # Only the check is needed here, the text scores are boosted by the text path
+    if VideoAnalyser.yt_categorization_check(video_category, {}):
+        return None
+
+    return await analyse_frames(vid_dl)
+
+
+async def calculate_text_analysis(vid_dl, keyword_matcher):
+    video_category, video_text_data = await vid_dl.get_video_text_info()
+
+    text_scores = VideoAnalyser.calculate_text_scores(video_text_data, keyword_matcher)
+
+    is_yt_categorized = VideoAnalyser.yt_categorization_check(
+        video_category, text_scores
+    )
+
+    return {"isYtCategorized": is_yt_categorized, "textScores": text_scores}
+
+
+async def calculate_frame_analysis(vid_dl):
+    cached_result = await asyncio.to_thread(result_cache.get, vid_dl.video_id)
+    if cached_result is not None:
+        logger.debug("Using cached frame analysis result.")
+        return cached_result
+
+    vid_analyser = VideoAnalyser()
+    progressive = VideoAnalyser.PROGRESSIVE
+    # Prepare each chunk of frames while the rest are still downloading
+    async with aclosing(vid_dl.iter_video_frames(progressive=progressive)) as chunks:
+        async for chunk_idx, frames, round_end in chunks:
+            await vid_analyser.add_frames(frames, chunk_idx)
+
+            # Only whole rounds are evenly spread over the video, so only
+            # check between rounds, closing the chunks stops the downloads left
+            if progressive and round_end and await vid_analyser.has_converged():
+                break
 
-    video_frames = await vid_dl.get_video_frames()
     connection_closing_coroutine = vid_dl.close_http_connections()
-    vid_analyser = VideoAnalyser(video_frames)
     (
         detail_score,
         diff_score,
         selected_frame,
     ) = await vid_analyser.calculate_frame_scores()
 
-    image_scores = await asyncio.to_thread(
-        ImageClassifier().classify_frame, selected_frame
-    )
+    # Scoring only needs grayscale, but the classifier needs the frame in colour
+    color_frame = await vid_dl.get_color_frame(*vid_analyser.selected_frame_location)
+    if color_frame is not None:
+        selected_frame = color_frame
 
-    response_data["imageScores"] = image_scores
-    response_data["frameScores"] = {
-        "detailScore": detail_score,
-        "diffScore": diff_score,
-    }
+    image_scores = await classification_batcher.classify_frame(selected_frame)
 
     await connection_closing_coroutine
-    logger.info("Video analysis completed. Returning response data.")
-    logger.info(response_data)
-    return response_data
+    result = {
+        "imageScores": image_scores,
+        "frameScores": {
+            "detailScore": detail_score,
+            "diffScore": diff_score,
+        },
+        "framesUsed": vid_analyser.frames_used,
+    }
+
+    # Live videos only have thumbnails, which change during the stream
+    if not vid_dl.is_live:
+        await asyncio.to_thread(result_cache.put, vid_dl.video_id, result)
+
+    return result
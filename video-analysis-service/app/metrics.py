@@ -0,0 +1,411 @@
+from contextlib import contextmanager
+import bisect
+import math
+import threading
+import time
+
+
+class MetricsError(Exception):
+    pass
+
+
+class MetricsRegistry:
+    """
+    A thread-safe collection of metrics that can be rendered for Prometheus
+
+    ...
+
+    Attributes
+    ----------
+    None
+
+    Methods
+    -------
+    register(Histogram | Gauge | Counter) -> None
+        adds a metric, its name and labels must be unique
+    render() -> str
+        returns every metric in the Prometheus text exposition format
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        metric_key = (metric.name, tuple(sorted(metric.labels.items())))
+
+        with self._lock:
+            if metric_key in self._metrics:
+                raise MetricsError(
+                    f"Metric {metric.name} with labels {metric.labels} "
+                    "is already registered."
+                )
+            self._metrics[metric_key] = metric
+
+    def render(self):
+        with self._lock:
+            metrics = sorted(self._metrics.items(), key=lambda item: item[0])
+
+        lines = []
+        rendered_names = set()
+        for (name, _), metric in metrics:
+            # Metrics that only differ by their labels share one header
+            if name not in rendered_names:
+                rendered_names.add(name)
+                lines.append(f"# HELP {name} {_escape_help(metric.description)}")
+                lines.append(f"# TYPE {name} {metric.TYPE}")
+
+            for suffix, sample_labels, value in metric.samples():
+                sample_labels = metric.labels | sample_labels
+                lines.append(
+                    f"{name}{suffix}{_format_labels(sample_labels)} {_format_value(value)}"
+                )
+
+        return "\n".join(lines) + "\n"
+
+
+# Every metric is added here unless it is given its own registry
+registry = MetricsRegistry()
+
+
+class Histogram:
+    """
+    A thread-safe histogram used to record timings and sizes
+
+    ...
+
+    Attributes
+    ----------
+    DEFAULT_BUCKETS : (float, ...)
+        upper bounds (in seconds) that suit most latency measurements
+    TYPE : str
+        the Prometheus metric type
+    name : str
+        a unique name for the measured value
+    description : str
+        a short human readable description of the measured value
+    buckets : (float, ...)
+        the sorted upper bounds of the histogram buckets
+    labels : {str: str}
+        labels that tell apart histograms of the same name
+
+    Methods
+    -------
+    observe(float) -> None
+        records a single value into the histogram
+    time() -> contextmanager
+        records the time spent in the with block, in seconds
+    snapshot() -> {str: object}
+        returns a consistent copy of the bucket counts, sum and count
+    samples() -> [(str, {str: str}, float)]
+        returns the cumulative Prometheus samples of the histogram
+    """
+
+    DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    TYPE = "histogram"
+
+    def __init__(
+        self, name, description, buckets=DEFAULT_BUCKETS, labels=None, registry=registry
+    ):
+        """
+        Parameters
+        ----------
+        name : str
+            a unique name for the measured value
+        description : str
+            a short human readable description of the measured value
+        buckets : (float, ...)
+            upper bounds for the histogram buckets
+        labels : {str: str}
+            labels that tell apart histograms of the same name
+        registry : MetricsRegistry | None
+            the registry to render the histogram from, None to not register it
+        """
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self.labels = {} if labels is None else dict(labels)
+        # The last bucket catches everything above the highest bound
+        self._bucket_counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+        if registry is not None:
+            registry.register(self)
+
+    def observe(self, value):
+        bucket_idx = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            self._bucket_counts[bucket_idx] += 1
+            self._sum += value
+            self._count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            bucket_counts = list(self._bucket_counts)
+            value_sum = self._sum
+            count = self._count
+
+        return {
+            "buckets": dict(zip(self.buckets + (float("inf"),), bucket_counts)),
+            "sum": value_sum,
+            "count": count,
+        }
+
+    def samples(self):
+        snapshot = self.snapshot()
+
+        # Prometheus buckets count every value up to their bound
+        samples = []
+        cumulative_count = 0
+        for bound, bucket_count in snapshot["buckets"].items():
+            cumulative_count += bucket_count
+            samples.append(("_bucket", {"le": _format_value(bound)}, cumulative_count))
+        samples.append(("_sum", {}, snapshot["sum"]))
+        samples.append(("_count", {}, snapshot["count"]))
+
+        return samples
+
+
+class Gauge:
+    """
+    A thread-safe value that can go up and down, such as a queue size
+
+    ...
+
+    Attributes
+    ----------
+    TYPE : str
+        the Prometheus metric type
+    name : str
+        a unique name for the measured value
+    description : str
+        a short human readable description of the measured value
+    labels : {str: str}
+        labels that tell apart gauges of the same name
+
+    Methods
+    -------
+    set(float) -> None
+        sets the value of the gauge
+    inc(float) -> None
+        increases the value of the gauge
+    dec(float) -> None
+        decreases the value of the gauge
+    value() -> float
+        returns the current value, calling the function of the gauge if it has one
+    samples() -> [(str, {str: str}, float)]
+        returns the Prometheus sample of the gauge
+    """
+
+    TYPE = "gauge"
+
+    def __init__(
+        self, name, description, function=None, labels=None, registry=registry
+    ):
+        """
+        Parameters
+        ----------
+        name : str
+            a unique name for the measured value
+        description : str
+            a short human readable description of the measured value
+        function : () -> float
+            reads the value when the metrics are rendered, for values that
+            are already tracked elsewhere
+        labels : {str: str}
+            labels that tell apart gauges of the same name
+        registry : MetricsRegistry | None
+            the registry to render the gauge from, None to not register it
+        """
+        self.name = name
+        self.description = description
+        self.labels = {} if labels is None else dict(labels)
+        self._function = function
+        self._value = 0
+        self._lock = threading.Lock()
+
+        if registry is not None:
+            registry.register(self)
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+    def value(self):
+        if self._function is not None:
+            return self._function()
+
+        with self._lock:
+            return self._value
+
+    def samples(self):
+        return [("", {}, self.value())]
+
+
+class Counter:
+    """
+    A thread-safe value that only goes up, such as an amount of requests
+
+    Prometheus handles counter resets and computes rates from counters,
+    so their names end in _total
+
+    ...
+
+    Attributes
+    ----------
+    TYPE : str
+        the Prometheus metric type
+    name : str
+        a unique name for the counted value, ending in _total
+    description : str
+        a short human readable description of the counted value
+    labels : {str: str}
+        labels that tell apart counters of the same name
+
+    Methods
+    -------
+    inc(float) -> None
+        increases the value of the counter
+    value() -> float
+        returns the current value, calling the function of the counter if it has one
+    samples() -> [(str, {str: str}, float)]
+        returns the Prometheus sample of the counter
+    """
+
+    TYPE = "counter"
+
+    def __init__(
+        self, name, description, function=None, labels=None, registry=registry
+    ):
+        """
+        Parameters
+        ----------
+        name : str
+            a unique name for the counted value, ending in _total
+        description : str
+            a short human readable description of the counted value
+        function : () -> float
+            reads the value when the metrics are rendered, for counts that
+            are already tracked elsewhere, it must never go down
+        labels : {str: str}
+            labels that tell apart counters of the same name
+        registry : MetricsRegistry | None
+            the registry to render the counter from, None to not register it
+        """
+        if not name.endswith("_total"):
+            raise MetricsError(f"Counter name {name} must end in _total.")
+
+        self.name = name
+        self.description = description
+        self.labels = {} if labels is None else dict(labels)
+        self._function = function
+        self._value = 0
+        self._lock = threading.Lock()
+
+        if registry is not None:
+            registry.register(self)
+
+    def inc(self, amount=1):
+        if amount < 0:
+            raise MetricsError(f"Counter {self.name} can't go down by {amount}.")
+
+        with self._lock:
+            self._value += amount
+
+    def value(self):
+        if self._function is not None:
+            return self._function()
+
+        with self._lock:
+            return self._value
+
+    def samples(self):
+        return [("", {}, self.value())]
+
+
+_stage_histograms = {}
+_stage_histograms_lock = threading.Lock()
+
+
+def stage_timer(stage):
+    """
+    Records the time spent in a with block as a stage of the video analysis
+
+    Every stage gets its own video_analysis_stage_seconds histogram, labelled
+    with the stage name
+
+    Parameters
+    ----------
+    stage : str
+        the name of the stage
+
+    Returns
+    -------
+    contextmanager
+    """
+    stage_histogram = _stage_histograms.get(stage)
+    if stage_histogram is None:
+        with _stage_histograms_lock:
+            stage_histogram = _stage_histograms.get(stage)
+            if stage_histogram is None:
+                stage_histogram = Histogram(
+                    "video_analysis_stage_seconds",
+                    "Time spent in each stage of the video analysis",
+                    labels={"stage": stage},
+                )
+                _stage_histograms[stage] = stage_histogram
+
+    return stage_histogram.time()
+
+
+def _escape_help(text):
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape_label_value(value):
+    return _escape_help(str(value)).replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if len(labels) == 0:
+        return ""
+
+    return (
+        "{"
+        + ",".join(
+            f'{label}="{_escape_label_value(value)}"' for label, value in labels.items()
+        )
+        + "}"
+    )
+
+
+def _format_value(value):
+    # Values read by gauge functions can be numpy scalars or booleans
+    if not isinstance(value, int) or isinstance(value, bool):
+        value = float(value)
+
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+
+    return repr(value)
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from app.image_classifier import ImageClassifier
+from app.logger import setup_logger
+from app.video_analyser import VideoAnalyser
+from app.video_downloader import VideoDownloader
+
+logger = setup_logger(
+    __name__, log_level="DEBUG", log_file="video-analysis-service.log"
+)
+
+
+class ResultCache:
+    """
+    A class used to keep video analysis results on disk between restarts
+
+    Results are stored in a SQLite database along with a fingerprint of the
+    model file and the settings that change results, if the fingerprint
+    changes the stored results are dropped since they would no longer match
+    fresh results. The database holds at most MAX_ENTRIES results, the least
+    recently used results are evicted first. Until the cache is opened, or
+    when there is no model file to fingerprint, nothing is cached
+
+    ...
+
+    Attributes
+    ----------
+    PATH : str
+        the path of the database file, set with the RESULT_CACHE_PATH
+        environment variable, the cache is disabled if this is empty
+    MAX_ENTRIES : int
+        the maximum amount of results kept in the database,
+        set with the RESULT_CACHE_MAX_ENTRIES environment variable
+    path : str
+        the path of the database file
+    max_entries : int
+        the maximum amount of results kept in the database
+    fingerprint : str
+        a hash of the model file and the settings that change results
+    hits : int
+        the amount of lookups that found a result
+    misses : int
+        the amount of lookups that found no result
+
+    Methods
+    -------
+    open() -> None
+        opens the database and drops any results from an older fingerprint,
+        the cache stays disabled if the model file is missing
+    close() -> None
+        closes the database
+    get(str) -> dict
+        returns the stored result for a video, or None if there is none
+    put(str, dict) -> None
+        stores the result for a video
+    stats() -> {str: int}
+        returns the hit and miss counters and the amount of stored results
+    """
+
+    PATH = os.environ.get("RESULT_CACHE_PATH", "result-cache.sqlite3")
+    MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", 100_000))
+
+    def __init__(self, path=PATH, max_entries=MAX_ENTRIES, model_path=None):
+        """
+        Parameters
+        ----------
+        path : str
+            the path of the database file, the cache is disabled if this is empty
+        max_entries : int
+            the maximum amount of results kept in the database
+        model_path : str
+            the model file that the results depend on,
+            defaults to ImageClassifier.MODEL_PATH
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.model_path = (
+            ImageClassifier.MODEL_PATH if model_path is None else model_path
+        )
+        self.fingerprint = None
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        # The connection is shared between the worker threads
+        self._lock = threading.Lock()
+
+    def open(self):
+        if not self.path or self._connection is not None:
+            return
+
+        if not os.path.isfile(self.model_path):
+            # Without the model there are no results to cache
+            logger.warning(
+                f"Model file {self.model_path} not found, result cache disabled."
+            )
+            return
+
+        self.fingerprint = self._generate_fingerprint()
+        logger.info(f"Opening result cache {self.path}, fingerprint {self.fingerprint}")
+
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "video_id TEXT PRIMARY KEY, result TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprint (value TEXT NOT NULL)"
+            )
+
+            stored_fingerprint = connection.execute(
+                "SELECT value FROM fingerprint"
+            ).fetchone()
+            if stored_fingerprint is None or stored_fingerprint[0] != self.fingerprint:
+                # Results from a different model or scoring setup are stale
+                logger.info("Result cache fingerprint changed, dropping results.")
+                connection.execute("DELETE FROM results")
+                connection.execute("DELETE FROM fingerprint")
+                connection.execute(
+                    "INSERT INTO fingerprint (value) VALUES (?)", (self.fingerprint,)
+                )
+
+        self._connection = connection
+
+    def close(self):
+        if self._connection is None:
+            return
+
+        logger.info(f"Closing result cache: {self.stats()}")
+        with self._lock:
+            self._connection.close()
+            self._connection = None
+
+    def get(self, video_id):
+        if self._connection is None:
+            return None
+
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT result FROM results WHERE video_id = ?", (video_id,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._connection.execute(
+                "UPDATE results SET last_used = ? WHERE video_id = ?",
+                (time.time(), video_id),
+            )
+            self.hits += 1
+
+        return json.loads(row[0])
+
+    def put(self, video_id, result):
+        if self._connection is None:
+            return
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO results (video_id, result, last_used) "
+                "VALUES (?, ?, ?)",
+                (video_id, json.dumps(result), time.time()),
+            )
+            # Evict the least recently used results that don't fit
+            self._connection.execute(
+                "DELETE FROM results WHERE video_id IN ("
+                "SELECT video_id FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def stats(self):
+        entries = 0
+        if self._connection is not None:
+            with self._lock:
+                entries = self._connection.execute(
+                    "SELECT COUNT(*) FROM results"
+                ).fetchone()[0]
+
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def _generate_fingerprint(self):
+        fingerprint = hashlib.sha256()
+
+        with open(self.model_path, "rb") as model_file:
+            for block in iter(lambda: model_file.read(1 << 20), b""):
+                fingerprint.update(block)
+
+        fingerprint.update(
+            json.dumps(
+                {
+                    "DIFF_SCORE_RANGE": VideoAnalyser.DIFF_SCORE_RANGE,
+                    "DETAIL_SCORE_RANGE": VideoAnalyser.DETAIL_SCORE_RANGE,
+                    "PROGRESSIVE": VideoAnalyser.PROGRESSIVE,
+                    "PROGRESSIVE_TOLERANCE": VideoAnalyser.PROGRESSIVE_TOLERANCE,
+                    "PROGRESSIVE_FIRST_ROUND": VideoDownloader.PROGRESSIVE_FIRST_ROUND,
+                    "GRAYSCALE_DECODE": VideoDownloader.GRAYSCALE_DECODE,
+                    "FRAME_LIMIT": VideoDownloader.FRAME_LIMIT,
+                    "MIN_FRAME_SIZE": (
+                        VideoDownloader.storyboard_selector.min_frame_size
+                    ),
+                    "REQUEST_COST": VideoDownloader.storyboard_selector.request_cost,
+                }
+            ).encode()
+        )
+
+        return fingerprint.hexdigest()
@@ -0,0 +1,96 @@
+import asyncio
+from app.logger import setup_logger
+
+logger = setup_logger(
+    __name__, log_level="DEBUG", log_file="video-analysis-service.log"
+)
+
+
+class SingleFlight:
+    """
+    A class used to share one in-flight computation between identical requests
+
+    The first request for a key (the leader) starts the computation as a task,
+    any request for the same key that arrives while it is running (a follower)
+    awaits that task instead of starting its own. The task is cancelled if
+    every request waiting on it is cancelled
+
+    ...
+
+    Attributes
+    ----------
+    leaders : int
+        the amount of requests that started a computation
+    followers : int
+        the amount of requests that shared a computation that was in flight
+
+    Methods
+    -------
+    run(object, () -> Coroutine) -> object
+        returns the result of the in-flight computation for a key,
+        starting it if there is none
+    stats() -> {str: int}
+        returns the leader and follower counters and the amount in flight
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.followers = 0
+        self._tasks = {}
+        self._waiter_counts = {}
+
+    async def run(self, key, coroutine_function):
+        """
+        Returns the result of the in-flight computation for a key,
+        starting it if there is none
+
+        Parameters
+        ----------
+        key : object
+            a hashable key that identifies identical requests
+        coroutine_function : () -> Coroutine
+            a function that returns the coroutine to run, this is only called
+            by the leader
+
+        Returns
+        -------
+        object
+            the result of the coroutine, or the exception that it raised
+        """
+        task = self._tasks.get(key)
+
+        if task is None:
+            self.leaders += 1
+            task = asyncio.create_task(coroutine_function())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._remove_task(key, task))
+        else:
+            logger.debug(f"Joining in-flight computation for {key}.")
+            self.followers += 1
+
+        self._waiter_counts[task] = self._waiter_counts.get(task, 0) + 1
+        try:
+            # Shield the task so that a cancelled request doesn't cancel it
+            # for the other requests that are waiting on it
+            return await asyncio.shield(task)
+        finally:
+            self._waiter_counts[task] -= 1
+            if self._waiter_counts[task] == 0:
+                del self._waiter_counts[task]
+
+            if task not in self._waiter_counts and not task.done():
+                logger.debug(f"No requests left waiting for {key}, cancelling.")
+                # New requests must not join a task that is being cancelled
+                self._remove_task(key, task)
+                task.cancel()
+
+    def stats(self):
+        return {
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "in_flight": len(self._tasks),
+        }
+
+    def _remove_task(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
@@ -0,0 +1,184 @@
+import math
+import os
+from app.logger import setup_logger
+
+logger = setup_logger(
+    __name__, log_level="DEBUG", log_file="video-analysis-service.log"
+)
+
+
+class StoryboardSelector:
+    """
+    A class used to pick the cheapest storyboard format and fragments
+    that give a target amount of frames
+
+    Every fragment of a storyboard is a mosaic of rows * columns frames that
+    is downloaded and decoded as a whole, so the cost of a fragment is
+    modelled as a fixed cost per request plus the amount of pixels in it,
+    which both the download size and the decode time follow closely.
+    Only formats with frames of at least MIN_FRAME_SIZE are considered,
+    since the detail and diff score ranges depend on the frame resolution,
+    if no format is that large the highest resolution formats are used
+
+    ...
+
+    Attributes
+    ----------
+    MIN_FRAME_SIZE : (int, int)
+        the smallest frame width and height that keeps the scores calibrated,
+        set with the STORYBOARD_MIN_FRAME_SIZE environment variable
+        as WIDTHxHEIGHT
+    REQUEST_COST : int
+        the cost of requesting a fragment in pixels, set with the
+        STORYBOARD_REQUEST_COST environment variable
+    frame_target : int
+        the amount of frames to get
+    min_frame_size : (int, int)
+        the smallest frame width and height of the considered formats
+    request_cost : int
+        the cost of requesting a fragment in pixels
+
+    Methods
+    -------
+    select_format([dict]) -> dict
+        returns the format that gives the most frames up to the target
+        for the lowest cost, or None if there are no formats
+    select_fragments(dict) -> [int]
+        returns the positions of the fragments to download, evenly spread
+        over the video
+    cost(dict) -> int
+        returns the cost of getting the target frames from a format
+    """
+
+    MIN_FRAME_SIZE = tuple(
+        int(size)
+        for size in os.environ.get("STORYBOARD_MIN_FRAME_SIZE", "320x180").split("x")
+    )
+    REQUEST_COST = int(os.environ.get("STORYBOARD_REQUEST_COST", 50_000))
+
+    def __init__(
+        self, frame_target, min_frame_size=MIN_FRAME_SIZE, request_cost=REQUEST_COST
+    ):
+        """
+        Parameters
+        ----------
+        frame_target : int
+            the amount of frames to get
+        min_frame_size : (int, int)
+            the smallest frame width and height of the considered formats
+        request_cost : int
+            the cost of requesting a fragment in pixels
+        """
+        self.frame_target = frame_target
+        self.min_frame_size = min_frame_size
+        self.request_cost = request_cost
+
+    def select_format(self, storyboard_formats):
+        """
+        Returns the format that gives the most frames up to the target
+        for the lowest cost
+
+        Parameters
+        ----------
+        storyboard_formats : [dict]
+            storyboard formats with rows, columns, width, height and fragments
+
+        Returns
+        -------
+        dict
+            the selected format, or None if there are no formats
+        """
+        if len(storyboard_formats) == 0:
+            return None
+
+        min_width, min_height = self.min_frame_size
+        candidates = [
+            x
+            for x in storyboard_formats
+            if x["width"] >= min_width and x["height"] >= min_height
+        ]
+
+        # Fall back to the formats that are closest to the calibrated resolution
+        if len(candidates) == 0:
+            max_frame_area = max(x["width"] * x["height"] for x in storyboard_formats)
+            candidates = [
+                x
+                for x in storyboard_formats
+                if x["width"] * x["height"] == max_frame_area
+            ]
+
+        selected_format = min(
+            candidates,
+            key=lambda x: (-min(self._frame_count(x), self.frame_target), self.cost(x)),
+        )
+        logger.debug(
+            f"Selected storyboard format {selected_format.get('format_id')} "
+            f"with cost {self.cost(selected_format)}."
+        )
+        return selected_format
+
+    def select_fragments(self, storyboard_format):
+        """
+        Returns the positions of the fragments to download
+
+        The fragments are taken from the middle of evenly sized sections
+        of the video, which also keeps the often partial last fragment out
+        unless every fragment is needed
+
+        Parameters
+        ----------
+        storyboard_format : dict
+            a storyboard format with rows, columns and fragments
+
+        Returns
+        -------
+        [int]
+        """
+        fragment_count = len(storyboard_format["fragments"])
+        selected_count = self._fragments_needed(storyboard_format)
+
+        return [
+            int((section + 0.5) * fragment_count / selected_count)
+            for section in range(selected_count)
+        ]
+
+    def cost(self, storyboard_format):
+        """
+        Returns the cost of getting the target frames from a format
+
+        Parameters
+        ----------
+        storyboard_format : dict
+            a storyboard format with rows, columns, width, height and fragments
+
+        Returns
+        -------
+        int
+        """
+        fragment_pixels = (
+            storyboard_format["rows"]
+            * storyboard_format["columns"]
+            * storyboard_format["width"]
+            * storyboard_format["height"]
+        )
+
+        return self._fragments_needed(storyboard_format) * (
+            self.request_cost + fragment_pixels
+        )
+
+    def _fragments_needed(self, storyboard_format):
+        frames_per_fragment = storyboard_format["rows"] * storyboard_format["columns"]
+
+        # Short videos can have fewer frames than the target
+        return min(
+            len(storyboard_format["fragments"]),
+            math.ceil(self.frame_target / frames_per_fragment),
+        )
+
+    @staticmethod
+    def _frame_count(storyboard_format):
+        return (
+            storyboard_format["rows"]
+            * storyboard_format["columns"]
+            * len(storyboard_format["fragments"])
+        )
@@ -1,11 +1,17 @@
 import cv2
-import statistics
-import asyncio
 import numpy
-import re
+import asyncio
+import hashlib
+import json
+import os
+from PIL import Image
 from app.logger import setup_logger
+from app.frame_scorer import FrameScorer
 from app.keywords import STATIC_KEYWORDS
+from app.keyword_matcher import KeywordMatcher
+from app.lru_cache import LRUCache
 from app.image_classifier import ImageClassifier
+from app.metrics import stage_timer
 
 logger = setup_logger(
     __name__, log_level="DEBUG", log_file="video-analysis-service.log"
@@ -24,51 +30,173 @@ class VideoAnalyser:
         the expected range of scores for image diffing
     DETAIL_SCORE_RANGE: (int, int)
         the expected range of scores for image detail
-    video_frames: [PIL.Image.Image]
-        a list of frames that are being analysed
+    LOW_MEMORY: bool
+        the default scoring mode, set with the VIDEO_ANALYSER_LOW_MEMORY
+        environment variable
+    PROGRESSIVE: bool
+        whether frames are only added until the scores converge,
+        set with the VIDEO_ANALYSER_PROGRESSIVE environment variable
+    PROGRESSIVE_TOLERANCE: float
+        the largest relative change of the frame statistics between two
+        convergence checks that counts as converged, set with the
+        VIDEO_ANALYSER_PROGRESSIVE_TOLERANCE environment variable
+    KEYWORD_CACHE_SIZE: int
+        the maximum amount of client keyword sets kept in the keyword cache,
+        set with the KEYWORD_CACHE_SIZE environment variable
+    keyword_cache: LRUCache
+        a cache of keyword matchers for the merged keyword sets, keyed by
+        a hash of the client keywords
+    video_frames: [numpy.ndarray | PIL.Image.Image]
+        a list of frames that are being analysed, frames added with add_frames
+        are included once the frames have been scored
+    low_memory: bool
+        indicates if only per-frame scalars are kept while scoring,
+        the map lists below stay empty in this mode
+    frame_scorer: FrameScorer
+        the scorer that holds the frame data, maps can be rebuilt through it
     frame_edge_maps: [(cv2.MatLike, int)]
         a list of tuples that contain both an edge map and
         the corresponding detail score (variance)
     frame_diff_maps: [(cv2.MatLike, int)]
         a list of tuples that contain both a diff map and
         the corresponding diff score (sum of absolute diff)
-    filtered_frame_data: [((cv2.MatLike, int), (cv2.MatLike, int), PIL.Image.Image)]
+    filtered_frame_data: [((cv2.MatLike, int), (cv2.MatLike, int), numpy.ndarray)]
         a list that contains the final filtered form of all the data, this list aggregates
         all the appropriate datapoints into one tuple
     video_detail_score: int
         the final detail score for the video
     video_diff_score: int
         the final diff score for the video (approximately the amount of motion)
-    selected_frame: PIL.Image.Image
-        the image that corresponds to the detail and diff scores
+    selected_frame: numpy.ndarray | PIL.Image.Image
+        the image that corresponds to the detail and diff scores,
+        this is grayscale if grayscale frames were added
+    selected_frame_location: (int, int)
+        the chunk order and the index in that chunk of the selected frame,
+        this can be used to decode the selected frame again in colour
+    frames_used: int
+        the amount of frames the scores were calculated from
 
     Methods
     -------
-    calculate_text_scores(str, {str: [str]}) -> {str: int}
+    calculate_text_scores(str, {str: [str]} | KeywordMatcher) -> {str: int}
         takes in the description text for a video and the keyword mappings
         for categories, and returns a map of the category and the scores
-    calculate_frame_scores() -> (int, int, PIL.Image.Image)
+    get_keyword_matcher({str: [str]}) -> KeywordMatcher
+        returns a matcher for the client keywords merged with the static keywords
+    add_frames([numpy.ndarray | PIL.Image.Image], int) -> None
+        prepares a chunk of frames for scoring as soon as it is available
+    has_converged() -> bool
+        checks if the frame statistics stopped changing since the last check
+    calculate_frame_scores() -> (int, int, numpy.ndarray | PIL.Image.Image)
         returns the detail score, diff score and the selected image as a tuple
+    warm_up() -> None
+        compiles the default keyword matcher and scores a few blank frames
     """
 
     DIFF_SCORE_RANGE = (0, 2_000_000)
     DETAIL_SCORE_RANGE = (0, 2_000)
-
-    def __init__(self, video_frames):
+    LOW_MEMORY = os.environ.get("VIDEO_ANALYSER_LOW_MEMORY", "false").lower() == "true"
+    PROGRESSIVE = (
+        os.environ.get("VIDEO_ANALYSER_PROGRESSIVE", "false").lower() == "true"
+    )
+    PROGRESSIVE_TOLERANCE = float(
+        os.environ.get("VIDEO_ANALYSER_PROGRESSIVE_TOLERANCE", 0.05)
+    )
+    KEYWORD_CACHE_SIZE = int(os.environ.get("KEYWORD_CACHE_SIZE", 128))
+
+    # Clients send the same few keyword sets, so merging and compiling them
+    # only has to be done once per set
+    keyword_cache = LRUCache(KEYWORD_CACHE_SIZE)
+
+    def __init__(self, video_frames=None, low_memory=None):
         """
         Parameters
         ----------
-        video_frames : [PIL.Image.Image]
-            a list of frames to be analysed
+        video_frames : [numpy.ndarray | PIL.Image.Image]
+            a list of RGB frames to be analysed, either as arrays or PIL images,
+            more frames can be added with add_frames
+        low_memory : bool
+            keep only per-frame scalars instead of the full edge and diff maps,
+            defaults to LOW_MEMORY
         """
+        video_frames = [] if video_frames is None else video_frames
         logger.info(f"Initializing VideoAnalyser with {len(video_frames)} frames.")
         self.video_frames = video_frames
+        self.low_memory = self.LOW_MEMORY if low_memory is None else low_memory
+        self.frame_scorer = FrameScorer(low_memory=self.low_memory)
+        # Frames given up front are prepared together with the scoring
+        self._initial_frames = video_frames
         self.frame_edge_maps = []
         self.frame_diff_maps = []
         self.filtered_frame_data = []
         self.video_detail_score = None
         self.video_diff_score = None
         self.selected_frame = None
+        self.selected_frame_location = None
+        self.frames_used = None
+        # The frame statistics of the last convergence check
+        self._previous_statistics = None
+
+    async def add_frames(self, video_frames, order=None):
+        """
+        Prepares a chunk of frames for scoring as soon as it is available,
+        this lets scoring overlap with downloading the rest of the frames
+
+        Parameters
+        ----------
+        video_frames : [numpy.ndarray | PIL.Image.Image]
+            a list of RGB or grayscale frames, such as the frames of one
+            storyboard fragment
+        order : int
+            the position of the chunk among all the chunks
+
+        Returns
+        -------
+        None
+        """
+        with stage_timer("edge_maps"):
+            await asyncio.to_thread(self.frame_scorer.add_frames, video_frames, order)
+
+    async def has_converged(self):
+        """
+        Checks if the frame statistics stopped changing since the last check
+
+        The statistics are the mean and standard deviation of the detail
+        levels and the detail level and diff sum of the frame that would be
+        selected. Adding frames can be stopped once every one of them changed
+        by at most PROGRESSIVE_TOLERANCE relative to its size
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        bool
+            always False for the first check and while there are
+            fewer than 2 frames
+        """
+        if self.frame_scorer.frame_count < 2:
+            return False
+
+        statistics = await asyncio.to_thread(self.frame_scorer.preview)
+        previous_statistics = self._previous_statistics
+        self._previous_statistics = statistics
+
+        if previous_statistics is None:
+            return False
+
+        converged = all(
+            abs(value - previous_value)
+            <= self.PROGRESSIVE_TOLERANCE * max(abs(value), abs(previous_value))
+            for value, previous_value in zip(statistics, previous_statistics)
+        )
+        if converged:
+            logger.debug(
+                f"Frame statistics converged after {self.frame_scorer.frame_count} frames."
+            )
+
+        return converged
 
     async def calculate_frame_scores(self):
         logger.debug("Calculating frame scores...")
@@ -82,9 +210,10 @@ class VideoAnalyser:
 
         Returns
         -------
-        (int, int, PIL.Image.Image)
+        (int, int, numpy.ndarray | PIL.Image.Image)
         """
-        result = await asyncio.to_thread(self._calculate_frame_scores)
+        with stage_timer("frame_scores"):
+            result = await asyncio.to_thread(self._calculate_frame_scores)
         # Uncomment the below lines to dump the analysed data onto disk
         # await asyncio.to_thread(self._save_to_disk)
 
@@ -100,8 +229,9 @@ class VideoAnalyser:
         ----------
         video_text_data: str
             the text that will be searched for keywords
-        keywords: {str: [str]}
-            a map of categories to keywords
+        keywords: {str: [str]} | KeywordMatcher
+            a map of categories to keywords, or a matcher that was already
+            compiled for them
 
         Returns
         -------
@@ -109,35 +239,60 @@ class VideoAnalyser:
             a map of categories to their keyword occurence scores
         """
         logger.info("Calculating text scores.")
-        return {
-            key: len(  # Use the number of non-zero keyword hits as the score
-                [
-                    score
-                    for score in (
-                        len(  # Get the number of occurences
-                            re.findall(
-                                # Match each keyword
-                                # ensuring it has either space or punctuation
-                                # around it
-                                re.compile(
-                                    f"\\W{value}\\W", re.MULTILINE + re.IGNORECASE
-                                ),
-                                video_text_data,
-                            )
-                        )
-                        for value in keywords[key]
-                    )
-                    if score > 0  # Filter out any keywords that didn't have occurences
-                ]
+        if not isinstance(keywords, KeywordMatcher):
+            keywords = KeywordMatcher(keywords)
+
+        # Use the number of keywords with at least one occurence as the score
+        with stage_timer("text_scores"):
+            return keywords.calculate_scores(video_text_data)
+
+    @staticmethod
+    def get_keyword_matcher(category_keywords):
+        """
+        Returns a matcher for the client keywords merged with the static keywords,
+        matchers are cached for each distinct set of client keywords
+
+        Parameters
+        ----------
+        category_keywords: {str: [str]}
+            a map of categories to client keywords, this may be None
+
+        Returns
+        -------
+        KeywordMatcher
+            a matcher that holds the merged keywords
+        """
+        # Sorting the keys gives the same hash for the same keywords
+        # no matter which order the client sent the categories in
+        cache_key = hashlib.sha256(
+            json.dumps(category_keywords, sort_keys=True).encode()
+        ).hexdigest()
+        keyword_matcher = VideoAnalyser.keyword_cache.get(cache_key)
+
+        if keyword_matcher is None:
+            logger.debug("Keyword cache miss, merging and compiling keywords.")
+            keyword_matcher = KeywordMatcher(
+                VideoAnalyser.merge_keywords(category_keywords)
             )
-            for key in keywords.keys()
-        }
+            VideoAnalyser.keyword_cache.put(cache_key, keyword_matcher)
+
+        return keyword_matcher
+
+    @staticmethod
+    def warm_up():
+        # Requests without client keywords all use this matcher
+        VideoAnalyser.get_keyword_matcher(None).calculate_scores("")
+
+        # The first edge and diff maps pay for setting up the cv2 kernels
+        blank_frames = [numpy.zeros((90, 160), dtype=numpy.uint8) for _ in range(4)]
+        VideoAnalyser(blank_frames)._calculate_frame_scores()
 
     @staticmethod
     def generate_dummy_scores():
         data = {
             "imageScores": {key: 0.0 for key in ImageClassifier.CLASS_NAMES},
             "frameScores": {"detailScore": 0, "diffScore": 0},
+            "framesUsed": 0,
         }
 
         return data
@@ -180,58 +335,74 @@ class VideoAnalyser:
         return False
 
     def _save_to_disk(self):
-        if self.selected_frame:
+        if self.selected_frame is not None:
             logger.debug("Saving selected frame to disk.")
-            self.selected_frame.save("selected_frame.webp")
+            self._as_image(self.selected_frame).save("selected_frame.webp")
 
-        for f_idx in range(len(self.filtered_frame_data)):
+        if self.frame_scorer.selected_position is None:
+            return
+
+        for f_idx, position in enumerate(self.frame_scorer.filtered_positions):
             logger.debug(f"Saving frame {f_idx} to disk.")
-            self.filtered_frame_data[f_idx][2].save(f"outputs/{f_idx}.webp")
+            self._as_image(self.video_frames[position]).save(f"outputs/{f_idx}.webp")
+            # Maps are rebuilt here when running in low memory mode
+            # and scaled down to 8 bits so they can be written as images
             cv2.imwrite(
-                f"outputs/{f_idx}_edgemap.webp", self.filtered_frame_data[f_idx][0][0]
+                f"outputs/{f_idx}_edgemap.webp",
+                cv2.convertScaleAbs(self.frame_scorer.edge_map(position)),
             )
             cv2.imwrite(
-                f"outputs/{f_idx}_diffmap.webp", self.filtered_frame_data[f_idx][1][0]
+                f"outputs/{f_idx}_diffmap.webp",
+                cv2.convertScaleAbs(self.frame_scorer.diff_map(position)),
             )
 
     def _calculate_frame_scores(self):
         logger.debug("Calculating frame scores.")
         # Return cached values if available
-        if self.video_detail_score and self.video_diff_score and self.selected_frame:
+        if (
+            self.video_detail_score is not None
+            and self.video_diff_score is not None
+            and self.selected_frame is not None
+        ):
             return (self.video_detail_score, self.video_diff_score, self.selected_frame)
 
-        # These must be called in this order prior to doing anything else
-        self._generate_edge_maps()
-        self._generate_diff_maps()
-
-        # Get the stdev and mean of the diff scores in order to filter outliers
-        diff_sum = [x[1] for x in self.frame_diff_maps]
-        diff_stdev = statistics.stdev(diff_sum)
-        diff_mean = statistics.mean(diff_sum)
-
-        diff_lower_bound = diff_mean - diff_stdev
-        diff_upper_bound = diff_mean + diff_stdev
-
-        self.filtered_frame_data = sorted(
-            (
-                x
-                # Keep the data together before filtering
-                for x in zip(
-                    self.frame_edge_maps,
-                    self.frame_diff_maps,
-                    self.video_frames,
+        # The scorer handles all the edge and diff map generation
+        # as well as the outlier filtering
+        frame_scorer = self.frame_scorer
+
+        # Frames given up front are placed before any added chunks
+        if len(self._initial_frames) > 0:
+            frame_scorer.add_frames(self._initial_frames, order=-1)
+            self._initial_frames = []
+
+        selected_position = frame_scorer.score()
+        self.video_frames = frame_scorer.video_frames
+
+        # In low memory mode there are no maps to keep around
+        if not self.low_memory:
+            self.frame_edge_maps = list(
+                zip(frame_scorer.edge_maps, frame_scorer.edge_variances)
+            )
+            self.frame_diff_maps = list(
+                zip(frame_scorer.diff_maps, frame_scorer.diff_sums)
+            )
+            # Positions follow the detail sorted maps while the frames keep their
+            # original order, this pairing is kept so the selected frame is unchanged
+            self.filtered_frame_data = [
+                (
+                    self.frame_edge_maps[position],
+                    self.frame_diff_maps[position],
+                    self.video_frames[position],
                 )
-                # Filter the outliers
-                if x[1][1] <= diff_upper_bound and x[1][1] >= diff_lower_bound
-            ),
-            key=lambda x: x[1][1],
-        )
+                for position in frame_scorer.filtered_positions
+            ]
 
         # Pick the median
-        selected_data = self.filtered_frame_data[len(self.filtered_frame_data) // 2]
-        self.video_detail_score = selected_data[0][1]
-        self.video_diff_score = selected_data[1][1]
-        self.selected_frame = selected_data[2]
+        self.video_detail_score = frame_scorer.edge_variances[selected_position]
+        self.video_diff_score = frame_scorer.diff_sums[selected_position]
+        self.selected_frame = self.video_frames[selected_position]
+        self.selected_frame_location = frame_scorer.frame_location(selected_position)
+        self.frames_used = len(self.video_frames)
 
         # Normalize frame scores
         self.video_diff_score = self._normalize_value_in_range(
@@ -247,6 +418,13 @@ class VideoAnalyser:
         )
         return (self.video_detail_score, self.video_diff_score, self.selected_frame)
 
+    @staticmethod
+    def _as_image(frame):
+        if isinstance(frame, Image.Image):
+            return frame
+
+        return Image.fromarray(frame)
+
     @staticmethod
     def _normalize_value_in_range(value, value_range):
         clamped_value = min(value_range[1], value)
@@ -254,73 +432,6 @@ class VideoAnalyser:
 
         return (clamped_value - value_range[0]) / value_range[1] - value_range[0]
 
-    def _generate_edge_maps(self):
-        # Skip if we already have generated edge_maps
-        if len(self.frame_edge_maps) > 0:
-            logger.debug("Edge maps already generated, skipping generation.")
-            return
-
-        logger.debug("Generating edge maps.")
-        self.frame_edge_maps = sorted(
-            (
-                (edge_map, edge_map.var())
-                for edge_map in (
-                    # Generate edge maps using the laplacian operator
-                    cv2.Laplacian(
-                        # Load the PIL image as a grayscale opencv matrix
-                        cv2.cvtColor(numpy.array(video_frame), cv2.COLOR_RGB2GRAY),
-                        cv2.CV_64F,
-                    )
-                    for video_frame in self.video_frames
-                )
-            ),
-            key=lambda x: x[1],
-        )
-
-        # Stuff needed to filter outliers
-        edge_var = [x[1] for x in self.frame_edge_maps]
-        edge_mean = statistics.mean(edge_var)
-        edge_stddev = statistics.stdev(edge_var)
-
-        edge_upper_bound = edge_mean + edge_stddev
-        edge_lower_bound = edge_mean - edge_stddev
-
-        self.frame_edge_maps = [
-            x
-            for x in self.frame_edge_maps
-            # Filter outliers
-            if x[1] <= edge_upper_bound and x[1] >= edge_lower_bound
-        ]
-        logger.info(f"Generated {len(self.frame_edge_maps)} edge maps.")
-
-    def _generate_diff_maps(self):
-        logger.debug("Generating diff maps.")
-        # We need the edge maps to be already generated
-        # before we can do the diff maps
-        if len(self.frame_edge_maps) <= 0:
-            logger.error("Edge maps not generated. Cannot generate diff maps.")
-            raise VideoAnalyserError
-
-        # Skip generation if we already have the maps cached
-        if len(self.frame_diff_maps) > 0:
-            logger.debug("Diff maps already generated, skipping generation.")
-            return
-
-        # Use the highest detail edge map
-        # The gen edge map function should always return
-        # the maps sorted by detail level
-        ref_frame = self.frame_edge_maps[0][0]
-
-        self.frame_diff_maps = [
-            (diff_map, diff_map.sum())
-            for diff_map in (
-                # Getting the absolute difference map
-                cv2.absdiff(ref_frame, edge_map[0])
-                for edge_map in self.frame_edge_maps
-            )
-        ]
-        logger.info(f"Generated {len(self.frame_diff_maps)} diff maps.")
-
 
 class VideoAnalyserError(Exception):
     pass
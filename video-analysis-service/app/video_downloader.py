@@ -1,13 +1,27 @@
 from yt_dlp import YoutubeDL
 from PIL import Image
 from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import asyncio
+import mmap
+import cv2
+import numpy
 import httpx
-from app.logger import setup_logger
+import os
+import threading
+from app.logger import SampledLogger, setup_logger
+from app.lru_cache import LRUCache
+from app.fragment_cache import FragmentCache
+from app.storyboard_selector import StoryboardSelector
+from app.single_flight import SingleFlight
+from app.metrics import stage_timer
 
 logger = setup_logger(
     __name__, log_level="DEBUG", log_file="video-analysis-service.log"
 )
+# Every fragment and thumbnail is logged, so only keep a sample of those
+fragment_logger = SampledLogger(logger)
 
 
 class VideoDownloader:
@@ -24,55 +38,133 @@ class VideoDownloader:
         without letting it get too long
     FRAME_LIMIT : int
         a loosely followed upper limit for the amount of frames downloaded
+    storyboard_selector : StoryboardSelector
+        picks the storyboard format and fragments that give FRAME_LIMIT frames
+        for the lowest download and decode cost
+    PROGRESSIVE_FIRST_ROUND : int
+        the amount of storyboard fragments downloaded in the first round
+        of a progressive download, every round after it doubles the total
     DEFAULT_FRAME_SIZE : (int, int)
         a default size to normalize uneven shaped frame sequences,
         only used for ensuring thumbnails are similarly sized
+    METADATA_CACHE_SIZE : int
+        the maximum amount of videos kept in the metadata cache,
+        set with the VIDEO_METADATA_CACHE_SIZE environment variable
+    METADATA_CACHE_TTL : float
+        the time in seconds cached metadata stays valid for,
+        set with the VIDEO_METADATA_CACHE_TTL environment variable
+    metadata_cache : LRUCache
+        a cache of trimmed video information shared by all downloaders
+    video_info_flight : SingleFlight
+        shares one extraction between the downloaders that miss the metadata
+        cache for the same video at the same time, from any endpoint
+    fragment_cache : FragmentCache
+        a disk cache of the downloaded storyboard fragments and thumbnails,
+        shared by all downloaders, images of live streams are never cached
+    EXTRACTOR_PROCESSES : int
+        the amount of worker processes used to extract video information,
+        set with the VIDEO_INFO_EXTRACTOR_PROCESSES environment variable,
+        extraction runs in a thread instead when this is 0, with worker
+        processes no YoutubeDL is built in the serving process at all
+    GRAYSCALE_DECODE : bool
+        whether storyboard frames are decoded straight to grayscale by default,
+        set with the VIDEO_DOWNLOADER_GRAYSCALE_DECODE environment variable
     yt : YoutubeDL
-        a yt_dlp object that is used for retrieving data from YouTube
+        a yt_dlp object that is used for retrieving data from YouTube,
+        when this is None the shared YoutubeDL of the extracting thread
+        or process is used
     video_id : str
         a valid YouTube video id, this is just the id part and not the url
     video_info : dict
-        a dictionary populated with various datapoints about a video
+        a dictionary populated with the datapoints that are used about a video,
+        this may be shared with other downloaders and must not be modified
     video_storyboard_info : dict
         a dictionary populated with information and urls for a video storyboard
-    video_frames : [PIL.Image.Image]
-        a list of frames for a given video
+    video_frames : [numpy.ndarray | PIL.Image.Image]
+        a list of colour frames for a given video, storyboard frames are
+        array views into the decoded storyboard fragments
     is_live : boolean
         indicates if the current video is detected as an ongoing livestream
     http_client : httpx.AsyncClient
-        a client object for making async requests
+        a client object for making async requests, usually the shared
+        client of the application connection pool
 
     Methods
     -------
     get_video_text_info() -> ([str], str)
         gets and returns the YT categories and description text for a video
-    get_video_frames() -> [PIL.Image.Image]
+    get_video_frames() -> [numpy.ndarray | PIL.Image.Image]
         gets and returns the individual frames from a video storyboard,
         or the thumbnails for the video
+    iter_video_frames(bool, bool) -> (int, [numpy.ndarray | PIL.Image.Image], bool)
+        yields the frames in chunks as soon as they are available,
+        storyboard frames can be decoded to grayscale and downloaded
+        progressively, the last chunk of every download round is marked
+    get_color_frame(int, int) -> numpy.ndarray
+        decodes a single storyboard frame in colour after a grayscale decode
+    warm_up() -> None
+        loads the yt_dlp extractors and decodes a blank storyboard fragment
+    start_extractor_pool() -> None
+        starts and warms up the extractor processes if they are enabled
+    shutdown_extractor_pool() -> None
+        stops the extractor processes
     """
 
     HTTP_TIMEOUT = 20
     FRAME_LIMIT = 50
+    storyboard_selector = StoryboardSelector(FRAME_LIMIT)
+    PROGRESSIVE_FIRST_ROUND = 2
     DEFAULT_FRAME_SIZE = (1280, 720)
+    METADATA_CACHE_SIZE = int(os.environ.get("VIDEO_METADATA_CACHE_SIZE", 1024))
+    METADATA_CACHE_TTL = float(os.environ.get("VIDEO_METADATA_CACHE_TTL", 1800))
 
-    def __init__(self, video_id):
+    # Every endpoint looks up the same videos, so share the metadata between them
+    metadata_cache = LRUCache(METADATA_CACHE_SIZE, METADATA_CACHE_TTL)
+    video_info_flight = SingleFlight()
+    # Images are cached on disk, this has to be opened before it is used
+    fragment_cache = FragmentCache()
+
+    EXTRACTOR_PROCESSES = int(os.environ.get("VIDEO_INFO_EXTRACTOR_PROCESSES", 0))
+    _extractor_pool = None
+
+    GRAYSCALE_DECODE = os.environ.get(
+        "VIDEO_DOWNLOADER_GRAYSCALE_DECODE", "true"
+    ).lower() in ("1", "true", "yes")
+
+    def __init__(self, video_id, http_client=None):
         """
         Parameters
         ----------
         video_id : str
             a valid YouTube video id
+        http_client : httpx.AsyncClient
+            a shared client to reuse connections from, a client owned by
+            this downloader is created if none is given
         """
 
         logger.info(f"Initializing VideoDownloader for video ID: {video_id}")
 
-        self.yt = YoutubeDL()
+        # Building a YoutubeDL takes tens of milliseconds, so it isn't done
+        # here on the event loop but by the thread that extracts the info
+        self.yt = None
         self.video_id = video_id
         self.video_info = None
         self.video_storyboard_info = None
         self.video_frames = None
         self.is_live = False
-        # It's better to close this when the server exits or crashes
-        self.http_client = httpx.AsyncClient(timeout=self.HTTP_TIMEOUT)
+        # Text and frame data can be requested concurrently,
+        # this stops them from both extracting the video info
+        self._video_info_lock = asyncio.Lock()
+        # Compressed storyboard fragments that were decoded to grayscale,
+        # kept so a single frame can be decoded again in colour
+        self._fragment_bytes = {}
+        # Shared clients are closed by their owner when the server exits
+        self._owns_http_client = http_client is None
+        self.http_client = (
+            httpx.AsyncClient(timeout=self.HTTP_TIMEOUT)
+            if http_client is None
+            else http_client
+        )
 
     async def get_video_text_info(self):
         """
@@ -120,7 +212,9 @@ class VideoDownloader:
 
         Returns
         -------
-        [PIL.Image.Image]
+        [numpy.ndarray | PIL.Image.Image]
+            storyboard frames are returned as array views,
+            thumbnail frames are returned as PIL images
 
         Raises
         ------
@@ -133,20 +227,113 @@ class VideoDownloader:
             logger.debug("Returning cached video frames.")
             return self.video_frames
 
+        frame_chunks = {
+            chunk_idx: frames
+            async for chunk_idx, frames, _ in self.iter_video_frames(grayscale=False)
+        }
+
+        # Put the chunks back in video order
+        self.video_frames = [
+            frame
+            for chunk_idx in sorted(frame_chunks)
+            for frame in frame_chunks[chunk_idx]
+        ]
+        logger.info(f"Retrieved {len(self.video_frames)} frames.")
+        return self.video_frames
+
+    async def iter_video_frames(self, grayscale=None, progressive=False):
+        """
+        Yields chunks of frames as soon as they are downloaded and extracted
+
+        Storyboard frames are yielded one fragment at a time in the order the
+        fragments finish downloading, so the frames can be processed while the
+        remaining fragments are still downloading
+        Grayscale storyboard frames are decoded straight from the JPEG luma,
+        which skips the colour conversion entirely, use get_color_frame to
+        decode a frame from them in colour. Thumbnails are always in colour
+        Progressive downloads fetch the fragments in rounds, each round fills
+        in the gaps between the fragments of the rounds before it, so the
+        consumer can stop early with an evenly spread subset of the frames.
+        Only the frames up to the end of a round are evenly spread, the last
+        chunk of every round is marked so the consumer knows where to stop
+        May raise an exception if the information could not be retrieved
+
+        Parameters
+        ----------
+        grayscale : bool
+            whether storyboard frames are decoded to 2-D grayscale arrays,
+            defaults to GRAYSCALE_DECODE
+        progressive : bool
+            whether storyboard fragments are downloaded in rounds,
+            the next round only starts once the consumer asks for it
+
+        Yields
+        ------
+        (int, [numpy.ndarray | PIL.Image.Image], bool)
+            the position of the chunk in the video, the frames of the chunk
+            and whether the chunk completes a download round, a round whose
+            last download failed isn't marked
+
+        Raises
+        ------
+        VideoDownloaderError
+        """
+
         # Ensure the required fields are populated
         await self._initialize_video_info()
 
         # If the video is live we fallback to using thumbnails as our frames
         if self.is_live:
             logger.debug("Video is live, retrieving thumbnail frames.")
-            frames = await self._get_thumbnail_frames()
+            yield (0, await self._get_thumbnail_frames(), True)
         else:
             logger.debug("Retrieving storyboard frames.")
-            frames = await self._get_storyboard_frames()
+            if grayscale is None:
+                grayscale = self.GRAYSCALE_DECODE
+
+            async for chunk in self._iter_storyboard_frames(grayscale, progressive):
+                yield chunk
+
+    async def get_color_frame(self, chunk_idx, frame_idx):
+        """
+        Decodes a single storyboard frame in colour
+
+        Only frames from chunks that iter_video_frames decoded to grayscale
+        are available, the fragment is decoded again from the kept bytes
+
+        Parameters
+        ----------
+        chunk_idx : int
+            the position of the chunk in the video
+        frame_idx : int
+            the position of the frame in the chunk
+
+        Returns
+        -------
+        numpy.ndarray
+            the RGB frame, or None if the chunk wasn't decoded to grayscale
+        """
 
-        return frames
+        storyboard_bytes = self._fragment_bytes.get(chunk_idx)
+        if storyboard_bytes is None:
+            return None
+
+        logger.debug(f"Decoding frame {frame_idx} of chunk {chunk_idx} in colour.")
+        frames = await asyncio.to_thread(
+            self._extract_frames,
+            self._open_image(storyboard_bytes),
+            self.video_storyboard_info["columns"],
+            self.video_storyboard_info["rows"],
+            self.video_storyboard_info["width"],
+            self.video_storyboard_info["height"],
+        )
+        return frames[frame_idx]
 
     async def close_http_connections(self):
+        if not self._owns_http_client:
+            logger.debug("HTTP client is shared, leaving connections open.")
+            return
+
         logger.debug("Closing HTTP connections.")
         await self.http_client.aclose()
 
@@ -181,53 +368,167 @@ class VideoDownloader:
         logger.info(f"Retrieved {len(resized_frames)} thumbnail frames.")
         return resized_frames
 
-    async def _get_storyboard_frames(self):
+    async def _iter_storyboard_frames(self, grayscale, progressive):
         if self.video_storyboard_info is None:
             logger.error("Failed to retrieve video storyboard information.")
             raise VideoDownloaderError
 
-        sb_rows = self.video_storyboard_info["rows"]
-        sb_cols = self.video_storyboard_info["columns"]
-        num_fragments = len(self.video_storyboard_info["fragments"])
         # Approximately limit the amount of frames downloaded to FRAME_LIMIT
-        fragment_step_size = (sb_rows * sb_cols * num_fragments) // self.FRAME_LIMIT
+        fragment_positions = self.storyboard_selector.select_fragments(
+            self.video_storyboard_info
+        )
+        fragments = self.video_storyboard_info["fragments"]
+
+        if progressive:
+            download_rounds = self._progressive_rounds(len(fragment_positions))
+        else:
+            # Start all the storyboard downloads at once
+            download_rounds = [list(range(len(fragment_positions)))]
 
         logger.debug("Downloading storyboard fragments.")
-        # Get all storyboard images asynchronously
-        storyboard_fragments = (
-            result  # Get the other images even if one fails
-            for result in await asyncio.gather(
-                *(
-                    self._get_image_from_url(url)
-                    for url in [
-                        x["url"] for x in self.video_storyboard_info["fragments"]
-                    ][::fragment_step_size]
-                ),
-                return_exceptions=True,  # Don't stop gather if a task fails
+        download_tasks = []
+        try:
+            for download_round in download_rounds:
+                round_tasks = [
+                    asyncio.create_task(
+                        self._get_storyboard_fragment(
+                            fragment_idx,
+                            fragments[fragment_positions[fragment_idx]]["url"],
+                            grayscale,
+                        )
+                    )
+                    for fragment_idx in download_round
+                ]
+                download_tasks.extend(round_tasks)
+
+                # Yield the frames of each fragment as soon as it arrives
+                for download_idx, download in enumerate(
+                    asyncio.as_completed(round_tasks), 1
+                ):
+                    try:
+                        fragment_idx, frames = await download
+                    except Exception as e:
+                        # Get the other images even if one fails
+                        logger.warning(f"Failed to download storyboard fragment: {e}")
+                        continue
+
+                    yield (fragment_idx, frames, download_idx == len(round_tasks))
+        finally:
+            # Don't leave downloads running if the consumer stops early
+            for download_task in download_tasks:
+                download_task.cancel()
+
+    @classmethod
+    def _progressive_rounds(cls, fragment_count):
+        # Visit the fragments in van der Corput order, which halves the gaps
+        # between the visited fragments every pass, so every round boundary
+        # leaves an evenly spread subset
+        fragment_order = []
+        sequence_idx = 0
+        while len(fragment_order) < fragment_count:
+            position = 0.0
+            denominator = 1
+            remaining_bits = sequence_idx
+            while remaining_bits > 0:
+                denominator *= 2
+                position += (remaining_bits & 1) / denominator
+                remaining_bits >>= 1
+
+            fragment_idx = int(position * fragment_count)
+            if fragment_idx not in fragment_order:
+                fragment_order.append(fragment_idx)
+            sequence_idx += 1
+
+        download_rounds = []
+        round_end = cls.PROGRESSIVE_FIRST_ROUND
+        round_start = 0
+        while round_start < fragment_count:
+            download_rounds.append(fragment_order[round_start:round_end])
+            round_start = round_end
+            round_end *= 2
+
+        return download_rounds
+
+    async def _get_storyboard_fragment(self, fragment_idx, url, grayscale):
+        storyboard_grid = (
+            self.video_storyboard_info["columns"],
+            self.video_storyboard_info["rows"],
+            self.video_storyboard_info["width"],
+            self.video_storyboard_info["height"],
+        )
+
+        if grayscale:
+            storyboard_bytes = await self._get_image_bytes(url)
+            fragment_logger.debug(
+                "Extracting frames from storyboard fragment %s.", fragment_idx
+            )
+            with stage_timer("extract_frames"):
+                frames = await asyncio.to_thread(
+                    self._extract_gray_frames, storyboard_bytes, *storyboard_grid
+                )
+            # Keep the compressed fragment to decode the selected frame in colour
+            self._fragment_bytes[fragment_idx] = storyboard_bytes
+        else:
+            storyboard = await self._get_image_from_url(url)
+            fragment_logger.debug(
+                "Extracting frames from storyboard fragment %s.", fragment_idx
             )
-            if isinstance(result, Image.Image)  # Filter out exceptions
+            with stage_timer("extract_frames"):
+                frames = await asyncio.to_thread(
+                    self._extract_frames, storyboard, *storyboard_grid
+                )
+
+        return (fragment_idx, frames)
+
+    @classmethod
+    def warm_up(cls):
+        # The first YoutubeDL object loads the extractor modules
+        YoutubeDL()
+
+        _, blank_fragment = cv2.imencode(
+            ".jpg", numpy.zeros((90, 160), dtype=numpy.uint8)
         )
+        cls._extract_gray_frames(blank_fragment.tobytes(), 1, 1, 160, 90)
+
+    @classmethod
+    async def start_extractor_pool(cls):
+        if cls.EXTRACTOR_PROCESSES <= 0 or cls._extractor_pool is not None:
+            return
 
-        sb_width = self.video_storyboard_info["width"]
-        sb_height = self.video_storyboard_info["height"]
+        logger.info(f"Starting {cls.EXTRACTOR_PROCESSES} extractor processes.")
+        # Forking a process that is running threads (tflite, cv2, asyncio)
+        # isn't safe, so the workers are spawned fresh instead
+        cls._extractor_pool = ProcessPoolExecutor(
+            max_workers=cls.EXTRACTOR_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_extractor_process,
+        )
 
-        logger.debug("Extracting frames from storyboard fragments.")
-        # Extract all the frames from the storyboards asynchronously
-        storyboard_frames = await asyncio.gather(
+        # Workers are only spawned once there is work for them, so give every
+        # worker a task to make sure none are started during a request
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
             *(
-                asyncio.to_thread(
-                    self._extract_frames, sb, sb_cols, sb_rows, sb_width, sb_height
-                )
-                for sb in storyboard_fragments
+                loop.run_in_executor(cls._extractor_pool, _warm_up_extractor_process)
+                for _ in range(cls.EXTRACTOR_PROCESSES)
             )
         )
 
-        # Flatten the resulting [[Image, ...], ...] array into a [Image, ...] array
-        self.video_frames = [frame for frames in storyboard_frames for frame in frames]
-        logger.info(f"Retrieved {len(self.video_frames)} storyboard frames.")
-        return self.video_frames
+    @classmethod
+    async def shutdown_extractor_pool(cls):
+        if cls._extractor_pool is None:
+            return
+
+        logger.info("Shutting down extractor processes.")
+        extractor_pool = cls._extractor_pool
+        cls._extractor_pool = None
+        await asyncio.to_thread(extractor_pool.shutdown, True, cancel_futures=True)
 
     async def _initialize_video_info(self):
+        async with self._video_info_lock:
+            await self._load_video_info()
+
+    async def _load_video_info(self):
         # Skip if the object has already been initialized
         if self.video_info and (self.video_storyboard_info or self.is_live):
             logger.debug(
@@ -236,57 +537,230 @@ class VideoDownloader:
             return
 
         logger.debug("Initializing video information.")
-        # Asynchronously get the video info with yt_dlp
-        # We have to do it another thread because yt_dlp doesn't have
-        # async methods for these operations
-        self.video_info = await asyncio.to_thread(
-            self.yt.extract_info, self.video_id, False
-        )
+        video_info = self.metadata_cache.get(self.video_id)
+
+        if video_info is None:
+            # Text and frame requests for a video use different downloaders
+            video_info = await self.video_info_flight.run(
+                self.video_id, self._extract_and_cache_video_info
+            )
+        else:
+            logger.debug("Using cached video information.")
+
+        self.video_info = video_info
+        self.video_storyboard_info = video_info["storyboard"]
+
+        # Live videos don't have storyboard info
+        if video_info["is_live"]:
+            logger.info("Video is a live stream.")
+            self.is_live = True
+
+    async def _extract_and_cache_video_info(self):
+        with stage_timer("extract_video_info"):
+            video_info = await self._extract_video_info()
 
         # Check that we actually managed to download the info
-        if self.video_info is None:
+        if video_info is None:
             logger.error("Failed to retrieve video information.")
             raise VideoDownloaderError
 
+        self.metadata_cache.put(self.video_id, video_info)
+        return video_info
+
+    async def _extract_video_info(self):
+        if VideoDownloader._extractor_pool is not None:
+            # Extraction is mostly pure Python parsing that holds the GIL,
+            # worker processes let it run on every core without blocking
+            # the event loop, only the trimmed info is sent back. The workers
+            # have their own YoutubeDL, so the yt override isn't used here
+            return await asyncio.get_running_loop().run_in_executor(
+                VideoDownloader._extractor_pool,
+                _extract_trimmed_video_info,
+                self.video_id,
+            )
+
+        # Asynchronously get the video info with yt_dlp
+        # We have to do it another thread because yt_dlp doesn't have
+        # async methods for these operations
+        extracted_info = await asyncio.to_thread(self._extract_info)
+
+        if extracted_info is None:
+            return None
+
+        return self._trim_video_info(extracted_info)
+
+    def _extract_info(self):
+        youtube_dl = self.yt if self.yt is not None else _get_thread_youtube_dl()
+        return youtube_dl.extract_info(self.video_id, False)
+
+    @classmethod
+    def _trim_video_info(cls, video_info):
+        # Only keep the fields that are used, the full info dict is large
+        trimmed_info = {
+            "title": video_info["title"],
+            "description": video_info["description"],
+            "categories": video_info["categories"],
+            "is_live": bool(video_info["is_live"]),
+            "thumbnails": [
+                {"url": thumb_info["url"], "preference": thumb_info["preference"]}
+                for thumb_info in video_info["thumbnails"]
+            ],
+            "storyboard": None,
+        }
+
         # Don't attempt to get storyboard info if it's a live video
-        if self.video_info["is_live"]:
-            logger.info("Video is a live stream.")
-            self.is_live = True
-            return
+        if trimmed_info["is_live"]:
+            return trimmed_info
 
         logger.debug("Retrieving video storyboard information.")
         # Get only the storyboard streams and sort them by the highest quality
-        # storyboard, which is usually sb0
-        self.video_storyboard_info = sorted(
+        # storyboard, which is usually sb0, so it wins when the costs are equal
+        storyboard_formats = sorted(
             (
                 # Only get the storyboard streams
                 x
-                for x in self.video_info["formats"]
+                for x in video_info["formats"]
                 if "sb" in x["format_id"]
             ),
             key=lambda x: x["format_id"],
-        )[0]
+        )
+        storyboard_info = cls.storyboard_selector.select_format(storyboard_formats)
+
+        if storyboard_info is not None:
+            trimmed_info["storyboard"] = {
+                "format_id": storyboard_info["format_id"],
+                "rows": storyboard_info["rows"],
+                "columns": storyboard_info["columns"],
+                "width": storyboard_info["width"],
+                "height": storyboard_info["height"],
+                "fragments": [
+                    {"url": fragment["url"]}
+                    for fragment in storyboard_info["fragments"]
+                ],
+            }
+
+        return trimmed_info
+
+    async def _get_image_bytes(self, url):
+        # Live streams keep their thumbnail URLs while the images change
+        use_cache = not self.is_live
+
+        if use_cache:
+            cached_image_bytes = await asyncio.to_thread(self.fragment_cache.get, url)
+
+            if cached_image_bytes is not None:
+                fragment_logger.debug("Using cached image for URL: %s", url)
+                return cached_image_bytes
+
+        fragment_logger.debug("Downloading image from URL: %s", url)
+        with stage_timer("download_image"):
+            response = await self.http_client.get(url)
+
+        # Don't cache error pages
+        if use_cache and response.status_code == httpx.codes.OK:
+            await asyncio.to_thread(self.fragment_cache.put, url, response.content)
+
+        return response.content
 
     async def _get_image_from_url(self, url):
-        logger.debug(f"Downloading image from URL: {url}")
+        return self._open_image(await self._get_image_bytes(url))
+
+    @staticmethod
+    def _open_image(image_bytes):
+        # The memory mapped file is read directly when the image is decoded
+        if isinstance(image_bytes, mmap.mmap):
+            return Image.open(image_bytes)
+
         # We have to use BytesIO cause PIL refuses to create an image otherwise
-        return Image.open(BytesIO((await self.http_client.get(url)).content))
+        return Image.open(BytesIO(image_bytes))
+
+    @classmethod
+    def _extract_frames(cls, storyboard, cols, rows, width, height):
+        # Decode the whole storyboard once, every frame is a view into this array
+        if storyboard.mode != "RGB":
+            storyboard = storyboard.convert("RGB")
+
+        return cls._extract_tiles(numpy.asarray(storyboard), cols, rows, width, height)
+
+    @classmethod
+    def _extract_gray_frames(cls, storyboard_bytes, cols, rows, width, height):
+        # JPEGs store luma separately, so this skips the chroma planes
+        # and the colour conversion that decoding to RGB would need
+        storyboard_array = cv2.imdecode(
+            numpy.frombuffer(storyboard_bytes, dtype=numpy.uint8),
+            cv2.IMREAD_GRAYSCALE,
+        )
+        if storyboard_array is None:
+            raise VideoDownloaderError("Failed to decode storyboard fragment.")
+
+        return cls._extract_tiles(storyboard_array, cols, rows, width, height)
 
     @staticmethod
-    def _extract_frames(storyboard, cols, rows, width, height):
-        return [
-            storyboard.crop(
-                (
-                    width * col,  # Left
-                    height * row,  # Upper
-                    width * (col + 1),  # Right
-                    height * (row + 1),  # Lower
-                )
+    def _extract_tiles(storyboard_array, cols, rows, width, height):
+        # Colour storyboards have a trailing channel axis, grayscale ones don't
+        channel_shape = storyboard_array.shape[2:]
+        grid_height = rows * height
+        grid_width = cols * width
+        storyboard_grid = storyboard_array[:grid_height, :grid_width]
+
+        # Storyboards that are cut short are padded with black,
+        # the same way cropping outside of a PIL image does
+        if storyboard_grid.shape[:2] != (grid_height, grid_width):
+            padded_grid = numpy.zeros(
+                (grid_height, grid_width, *channel_shape), dtype=numpy.uint8
             )
-            for row in range(rows)
-            for col in range(cols)
-        ]
+            padded_grid[: storyboard_grid.shape[0], : storyboard_grid.shape[1]] = (
+                storyboard_grid
+            )
+            storyboard_grid = padded_grid
+
+        # Split the rows and columns into their own axes without copying,
+        # this gives a (rows, cols, height, width, ...) array of frame views
+        frame_grid = storyboard_grid.reshape(
+            rows, height, cols, width, *channel_shape
+        ).swapaxes(1, 2)
+
+        return [frame_grid[row, col] for row in range(rows) for col in range(cols)]
 
 
 class VideoDownloaderError(Exception):
     pass
+
+
+# A YoutubeDL isn't safe to share between threads, so every thread that
+# extracts video info keeps its own for every video it extracts
+_thread_youtube_dl = threading.local()
+
+
+def _get_thread_youtube_dl():
+    youtube_dl = getattr(_thread_youtube_dl, "youtube_dl", None)
+    if youtube_dl is None:
+        youtube_dl = _thread_youtube_dl.youtube_dl = YoutubeDL()
+
+    return youtube_dl
+
+
+# Each extractor process keeps one YoutubeDL for every video it extracts
+_process_youtube_dl = None
+
+
+def _init_extractor_process():
+    global _process_youtube_dl
+    _process_youtube_dl = YoutubeDL()
+
+
+def _warm_up_extractor_process():
+    return os.getpid()
+
+
+def _extract_trimmed_video_info(video_id):
+    try:
+        extracted_info = _process_youtube_dl.extract_info(video_id, False)
+    except Exception as e:
+        # yt_dlp errors hold tracebacks, which can't be sent between processes
+        raise VideoDownloaderError(repr(e)) from None
+
+    if extracted_info is None:
+        return None
+
+    return VideoDownloader._trim_video_info(extracted_info)
@@ -0,0 +1,197 @@
+"""
+Compares the latency and the scores of a quantized model with the float model
+
+Run from the video-analysis-service directory:
+
+    python -m benchmarks.compare_models --quantized-model model/model_quant.tflite
+    python -m benchmarks.compare_models --quantized-model model/model_quant.tflite \\
+        --images "dataset/*/*.png" --threads 1 --threads 4
+
+Every model is timed with and without XNNPACK for every thread count. The
+scores of every configuration are compared with the float model using
+XNNPACK, the drift is the largest absolute difference of a category score
+and the top-1 agreement is the share of frames that get the same best category
+"""
+
+from pathlib import Path
+from PIL import Image
+import argparse
+import json
+import statistics
+import sys
+import time
+import numpy as np
+from app.image_classifier import ImageClassifier, _PooledInterpreter
+from app.logger import setup_logger
+from benchmarks.run_benchmarks import build_context
+from benchmarks.storyboard_fixtures import StoryboardFixture
+
+logger = setup_logger(__name__, log_level="INFO", log_file=None)
+
+
+def load_frames(image_pattern=None, limit=64):
+    """
+    Returns the model inputs of the frames to compare the models on
+
+    Parameters
+    ----------
+    image_pattern : str
+        a glob pattern of images, relative to the working directory,
+        the frames of the synthetic storyboard fixture are used when this is None
+    limit : int
+        the maximum amount of frames
+
+    Returns
+    -------
+    numpy.ndarray
+        the resized frames, stacked into one uint8 array
+    """
+    if image_pattern is None:
+        frames = build_context(StoryboardFixture.synthetic())["video_frames"]
+    else:
+        frames = [
+            Image.open(path).convert("RGB")
+            for path in sorted(Path().glob(image_pattern))
+        ]
+
+    if len(frames) == 0:
+        raise ValueError(f"No images match {image_pattern}.")
+
+    return np.stack([ImageClassifier._prepare_frame(frame) for frame in frames[:limit]])
+
+
+def time_model(model_path, frames, num_threads, xnnpack, repeat):
+    """
+    Returns the scores of every frame and the single frame and batch latency
+
+    Parameters
+    ----------
+    model_path : str
+        the path to the TFLite model file
+    frames : numpy.ndarray
+        the stacked model inputs from load_frames
+    num_threads : int
+        the amount of interpreter threads
+    xnnpack : bool
+        whether the XNNPACK delegate is used
+    repeat : int
+        the amount of timed runs
+
+    Returns
+    -------
+    (numpy.ndarray, {str: float})
+        the dequantized scores, and the median latencies in seconds
+    """
+    pooled_interpreter = _PooledInterpreter(model_path, num_threads, xnnpack)
+    batch_frames = frames[: ImageClassifier.MAX_BATCH_SIZE]
+
+    def median_time(run):
+        # The first run allocates the tensors, so it isn't timed
+        run()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+
+        return statistics.median(timings)
+
+    single_time = median_time(lambda: pooled_interpreter.invoke(frames[:1]))
+    batch_time = median_time(lambda: pooled_interpreter.invoke(batch_frames))
+
+    scores = np.concatenate(
+        [
+            pooled_interpreter.invoke(
+                frames[batch_start : batch_start + len(batch_frames)]
+            )
+            for batch_start in range(0, len(frames), len(batch_frames))
+        ]
+    )
+
+    return scores, {
+        "single_frame": single_time,
+        "batch_frame": batch_time / len(batch_frames),
+    }
+
+
+def compare_scores(scores, reference_scores):
+    """
+    Returns how far scores drifted from the reference scores
+
+    Parameters
+    ----------
+    scores : numpy.ndarray
+        the category scores of every frame
+    reference_scores : numpy.ndarray
+        the category scores of the same frames from the reference model
+
+    Returns
+    -------
+    {str: float}
+        the largest and the mean absolute score difference,
+        and the share of frames with the same best category
+    """
+    differences = np.abs(scores - reference_scores)
+
+    return {
+        "max_drift": float(differences.max()),
+        "mean_drift": float(differences.mean()),
+        "top1_agreement": float(
+            (scores.argmax(axis=1) == reference_scores.argmax(axis=1)).mean()
+        ),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--float-model", default=ImageClassifier.MODEL_PATH)
+    parser.add_argument("--quantized-model", required=True)
+    parser.add_argument("--images", help="a glob pattern of images to score")
+    parser.add_argument("--limit", type=int, default=64)
+    parser.add_argument("--threads", type=int, action="append")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", type=Path, help="write the results here")
+    args = parser.parse_args(argv)
+
+    frames = load_frames(args.images, args.limit)
+    thread_counts = args.threads or [ImageClassifier.NUM_THREADS]
+
+    models = {"float": args.float_model, "quantized": args.quantized_model}
+    reference_scores = None
+    results = []
+    for model_name, model_path in models.items():
+        for num_threads in thread_counts:
+            for xnnpack in (True, False):
+                scores, latency = time_model(
+                    model_path, frames, num_threads, xnnpack, args.repeat
+                )
+                if reference_scores is None:
+                    reference_scores = scores
+
+                result = {
+                    "model": model_name,
+                    "threads": num_threads,
+                    "xnnpack": xnnpack,
+                    **latency,
+                    **compare_scores(scores, reference_scores),
+                }
+                results.append(result)
+
+                logger.info(
+                    f"{model_name} threads={num_threads} xnnpack={xnnpack}: "
+                    f"{result['single_frame'] * 1000:.3f}ms per frame, "
+                    f"{result['batch_frame'] * 1000:.3f}ms per batched frame, "
+                    f"max drift {result['max_drift']:.4f}, "
+                    f"top-1 agreement {result['top1_agreement']:.2%}"
+                )
+
+    if args.output is not None:
+        args.output.write_text(
+            json.dumps({"frames": len(frames), "results": results}, indent=2) + "\n"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
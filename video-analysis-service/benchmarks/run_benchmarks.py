@@ -0,0 +1,376 @@
+"""
+Times each stage of the video analysis pipeline on fixtures, without network access
+
+Run from the video-analysis-service directory:
+
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --update-baseline
+    python -m benchmarks.run_benchmarks --fixture benchmarks/fixtures/recorded/<id>
+    python -m benchmarks.run_benchmarks --record <video id>
+
+The fastest run of every stage is compared with the baseline file, since it is
+the least affected by other load on the machine, the run fails if any stage
+got slower than the baseline by more than the threshold. Every fixture has its
+own baseline, recorded fixtures keep theirs in baseline.json in the fixture
+directory, and a baseline of another fixture is never compared with
+"""
+
+from pathlib import Path
+from io import BytesIO
+from PIL import Image
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from app.frame_scorer import FrameScorer
+from app.image_classifier import ImageClassifier
+from app.keyword_matcher import KeywordMatcher
+from app.logger import setup_logger
+from app.video_analyser import VideoAnalyser
+from app.video_downloader import VideoDownloader
+from benchmarks.storyboard_fixtures import FIXTURE_DIR, StoryboardFixture
+
+logger = setup_logger(__name__, log_level="INFO", log_file=None)
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+# The largest allowed slowdown of a stage, relative to its baseline time
+REGRESSION_THRESHOLD = float(os.environ.get("BENCHMARK_REGRESSION_THRESHOLD", 0.25))
+# Slowdowns below this many seconds are timer noise, whatever the ratio
+REGRESSION_MIN_SECONDS = 0.0001
+CLIENT_KEYWORDS = {
+    "coding": ["programming", "python", "java", "javascript", "c++", "algorithms"],
+    "music": ["music", "song", "beats", "lofi"],
+}
+
+
+def build_context(fixture):
+    """
+    Prepares the inputs of every stage from a fixture the way the service does
+
+    Parameters
+    ----------
+    fixture : StoryboardFixture
+        the video to benchmark on
+
+    Returns
+    -------
+    {str: object}
+    """
+    video_info = VideoDownloader._trim_video_info(fixture.extract_info(None, False))
+    storyboard = video_info["storyboard"]
+    storyboard_grid = (
+        storyboard["columns"],
+        storyboard["rows"],
+        storyboard["width"],
+        storyboard["height"],
+    )
+    fragment_bytes = [
+        fixture.fragment_bytes(storyboard["fragments"][position]["url"])
+        for position in VideoDownloader.storyboard_selector.select_fragments(storyboard)
+    ]
+    video_frames = [
+        frame
+        for storyboard_bytes in fragment_bytes
+        for frame in VideoDownloader._extract_frames(
+            Image.open(BytesIO(storyboard_bytes)), *storyboard_grid
+        )
+    ]
+    merged_keywords = VideoAnalyser.merge_keywords(CLIENT_KEYWORDS)
+
+    return {
+        "fixture": fixture,
+        "storyboard_grid": storyboard_grid,
+        "fragment_bytes": fragment_bytes,
+        "video_frames": video_frames,
+        "video_text": video_info["title"] + " " + video_info["description"],
+        "keyword_matcher": KeywordMatcher(merged_keywords),
+    }
+
+
+def _fixture_downloader(context):
+    vid_dl = VideoDownloader("benchmark")
+    # The fixture stands in for the YoutubeDL of the extracting thread
+    vid_dl.yt = context["fixture"]
+    return vid_dl
+
+
+def _filtered_scorer(context):
+    frame_scorer = FrameScorer(context["video_frames"])
+    frame_scorer._filter_edge_maps()
+    return frame_scorer
+
+
+# Every stage is (setup, run), only run is timed and it gets the setup result
+STAGES = {
+    # Run like the service does when there are no extractor processes
+    "extract_video_info": (
+        _fixture_downloader,
+        lambda vid_dl: asyncio.run(vid_dl._extract_video_info()),
+    ),
+    "extract_frames": (
+        lambda context: context,
+        lambda context: [
+            VideoDownloader._extract_frames(
+                Image.open(BytesIO(storyboard_bytes)), *context["storyboard_grid"]
+            )
+            for storyboard_bytes in context["fragment_bytes"]
+        ],
+    ),
+    "extract_gray_frames": (
+        lambda context: context,
+        lambda context: [
+            VideoDownloader._extract_gray_frames(
+                storyboard_bytes, *context["storyboard_grid"]
+            )
+            for storyboard_bytes in context["fragment_bytes"]
+        ],
+    ),
+    "generate_edge_maps": (
+        lambda context: context,
+        lambda context: FrameScorer(context["video_frames"]),
+    ),
+    "generate_diff_maps": (
+        _filtered_scorer,
+        lambda frame_scorer: frame_scorer._generate_diff_maps(),
+    ),
+    "calculate_frame_scores": (
+        lambda context: VideoAnalyser(context["video_frames"]),
+        lambda vid_analyser: vid_analyser._calculate_frame_scores(),
+    ),
+    "merge_keywords": (
+        lambda context: context,
+        lambda context: VideoAnalyser.merge_keywords(CLIENT_KEYWORDS),
+    ),
+    "calculate_text_scores": (
+        lambda context: context,
+        lambda context: VideoAnalyser.calculate_text_scores(
+            context["video_text"], context["keyword_matcher"]
+        ),
+    ),
+    "classify_frame": (
+        lambda context: (ImageClassifier(), context["video_frames"][0]),
+        lambda classifier_frame: classifier_frame[0].classify_frame(
+            classifier_frame[1]
+        ),
+    ),
+}
+# Stages that can only run when the model has been downloaded
+MODEL_STAGES = {"classify_frame"}
+
+
+def time_stage(setup, run, context, repeat, warmup=2):
+    """
+    Returns the median, minimum and maximum time of a stage in seconds
+
+    Parameters
+    ----------
+    setup : ({str: object}) -> object
+        prepares the input of a single run, this isn't timed
+    run : (object) -> object
+        the timed stage
+    context : {str: object}
+        the inputs built by build_context
+    repeat : int
+        the amount of timed runs
+    warmup : int
+        the amount of untimed runs before the timed ones
+
+    Returns
+    -------
+    {str: float}
+    """
+    timings = []
+    for run_idx in range(warmup + repeat):
+        stage_input = setup(context)
+        start = time.perf_counter()
+        run(stage_input)
+        if run_idx >= warmup:
+            timings.append(time.perf_counter() - start)
+
+    return {
+        "median": statistics.median(timings),
+        "min": min(timings),
+        "max": max(timings),
+    }
+
+
+def find_regressions(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Returns the stages that got slower than the baseline by more than the threshold
+
+    Parameters
+    ----------
+    results : {str: object}
+        the results of this run
+    baseline : {str: object}
+        the results of the baseline run
+    threshold : float
+        the largest allowed slowdown, relative to the baseline time
+
+    Returns
+    -------
+    {str: (float, float)}
+        the baseline and current fastest time of every regressed stage
+
+    Raises
+    ------
+    ValueError
+        if the baseline was recorded on another fixture
+    """
+    # Timings of another video say nothing about a regression
+    if baseline.get("fixture") != results["fixture"]:
+        raise ValueError(
+            f"The baseline is of the {baseline.get('fixture')} fixture, "
+            f"not of {results['fixture']}."
+        )
+
+    regressions = {}
+    for stage, timings in results["stages"].items():
+        baseline_timings = baseline["stages"].get(stage)
+        if baseline_timings is None:
+            continue
+
+        baseline_time = baseline_timings["min"]
+        stage_time = timings["min"]
+        if (
+            stage_time > baseline_time * (1 + threshold)
+            and stage_time - baseline_time > REGRESSION_MIN_SECONDS
+        ):
+            regressions[stage] = (baseline_time, stage_time)
+
+    return regressions
+
+
+def record_fixture(video_id, fixture_dir):
+    """
+    Downloads the payload and the selected storyboard fragments of a video
+    into a recorded fixture, this is the only part that needs network access
+
+    Parameters
+    ----------
+    video_id : str
+        a valid YouTube video id
+    fixture_dir : pathlib.Path
+        the directory to write the fixture to
+
+    Returns
+    -------
+    None
+    """
+    from yt_dlp import YoutubeDL
+    import httpx
+
+    payload = YoutubeDL().extract_info(video_id, False)
+    # Only keep what the service reads, the full payload is large
+    payload = {
+        key: payload[key]
+        for key in ("title", "description", "categories", "is_live", "thumbnails")
+    } | {
+        "formats": [
+            storyboard_format
+            for storyboard_format in payload["formats"]
+            if "sb" in storyboard_format["format_id"]
+        ]
+    }
+
+    storyboard = VideoDownloader._trim_video_info(payload)["storyboard"]
+    fragments = {}
+    with httpx.Client(timeout=VideoDownloader.HTTP_TIMEOUT) as http_client:
+        for position in VideoDownloader.storyboard_selector.select_fragments(
+            storyboard
+        ):
+            url = storyboard["fragments"][position]["url"]
+            fragments[url] = http_client.get(url).content
+
+    StoryboardFixture.record(payload, fragments, fixture_dir)
+    logger.info(f"Recorded {len(fragments)} fragments of {video_id} to {fixture_dir}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--fixture", help="a recorded fixture directory")
+    parser.add_argument("--record", metavar="VIDEO_ID", help="record a fixture")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--stage", action="append", choices=sorted(STAGES))
+    parser.add_argument(
+        "--baseline", type=Path, help="defaults to the baseline of the fixture"
+    )
+    parser.add_argument("--output", type=Path, help="write the results here")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.record is not None:
+        record_fixture(args.record, FIXTURE_DIR / "recorded" / args.record)
+        return 0
+
+    if args.fixture is None:
+        fixture_name = "synthetic"
+        fixture = StoryboardFixture.synthetic()
+        baseline_path = BASELINE_PATH
+    else:
+        fixture_name = str(Path(args.fixture))
+        fixture = StoryboardFixture.recorded(args.fixture)
+        baseline_path = Path(args.fixture) / "baseline.json"
+    context = build_context(fixture)
+
+    if args.baseline is not None:
+        baseline_path = args.baseline
+
+    results = {
+        "fixture": fixture_name,
+        "repeat": args.repeat,
+        "stages": {},
+        "skipped": [],
+    }
+    for stage in args.stage or STAGES:
+        # The classifier needs the model, which may not be downloaded, any
+        # other failure of a stage fails the run
+        if stage in MODEL_STAGES and not os.path.exists(ImageClassifier.MODEL_PATH):
+            logger.warning(
+                f"Skipping {stage}: no model at {ImageClassifier.MODEL_PATH}."
+            )
+            results["skipped"].append(stage)
+            continue
+
+        setup, run = STAGES[stage]
+        results["stages"][stage] = time_stage(setup, run, context, args.repeat)
+        logger.info(
+            f"{stage}: {results['stages'][stage]['median'] * 1000:.3f}ms median, "
+            f"{results['stages'][stage]['min'] * 1000:.3f}ms fastest"
+        )
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+
+    if args.update_baseline:
+        baseline_path.write_text(json.dumps(results, indent=2) + "\n")
+        logger.info(f"Updated the baseline at {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        logger.warning(f"No baseline at {baseline_path}, nothing to compare with.")
+        return 0
+
+    try:
+        regressions = find_regressions(
+            results, json.loads(baseline_path.read_text()), args.threshold
+        )
+    except ValueError as e:
+        logger.error(f"{e} Record one for it with --update-baseline.")
+        return 1
+
+    for stage, (baseline_time, stage_time) in regressions.items():
+        logger.error(
+            f"{stage} regressed from {baseline_time * 1000:.3f}ms "
+            f"to {stage_time * 1000:.3f}ms."
+        )
+
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
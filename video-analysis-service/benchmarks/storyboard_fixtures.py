@@ -0,0 +1,145 @@
+from pathlib import Path
+from io import BytesIO
+from PIL import Image
+import copy
+import json
+import zlib
+import numpy
+import cv2
+
+FIXTURE_DIR = Path(__file__).parent / "fixtures"
+
+
+class StoryboardFixture:
+    """
+    A class used to serve a video to the benchmarks without hitting the network
+
+    A fixture is an extract_info payload and the bytes of the storyboard
+    fragments it points to. Synthetic fixtures render every fragment from a
+    seed derived from its URL, so they are the same on every run. Recorded
+    fixtures are directories made with record(), holding the payload as
+    extract_info.json and every fragment as a numbered JPEG
+
+    ...
+
+    Attributes
+    ----------
+    payload : dict
+        the extract_info payload of the video
+    fragments : {str: bytes}
+        the bytes of every fragment that was loaded, keyed by URL
+
+    Methods
+    -------
+    synthetic(pathlib.Path) -> StoryboardFixture
+        returns a fixture that renders the fragments of a payload
+    recorded(pathlib.Path) -> StoryboardFixture
+        returns a fixture that was recorded with record
+    record(dict, {str: bytes}, pathlib.Path) -> None
+        writes a payload and its fragments as a recorded fixture
+    extract_info(str, bool) -> dict
+        a stand-in for YoutubeDL.extract_info that returns a copy of the payload
+    fragment_bytes(str) -> bytes
+        returns the bytes of a fragment
+    """
+
+    def __init__(self, payload, fragments=None):
+        """
+        Parameters
+        ----------
+        payload : dict
+            the extract_info payload of the video
+        fragments : {str: bytes}
+            the bytes of the fragments, fragments that are missing are rendered
+        """
+        self.payload = payload
+        self.fragments = {} if fragments is None else fragments
+        self._formats = {
+            fragment["url"]: storyboard_format
+            for storyboard_format in payload["formats"]
+            for fragment in storyboard_format.get("fragments", [])
+        }
+
+    @classmethod
+    def synthetic(cls, payload_path=FIXTURE_DIR / "extract_info.json"):
+        with open(payload_path) as payload_file:
+            return cls(json.load(payload_file))
+
+    @classmethod
+    def recorded(cls, fixture_dir):
+        fixture_dir = Path(fixture_dir)
+        with open(fixture_dir / "extract_info.json") as payload_file:
+            payload = json.load(payload_file)
+
+        fragments = {}
+        for storyboard_format in payload["formats"]:
+            for fragment_idx, fragment in enumerate(
+                storyboard_format.get("fragments", [])
+            ):
+                fragment_path = (
+                    fixture_dir / f"{storyboard_format['format_id']}-{fragment_idx}.jpg"
+                )
+                if fragment_path.exists():
+                    fragments[fragment["url"]] = fragment_path.read_bytes()
+
+        return cls(payload, fragments)
+
+    @staticmethod
+    def record(payload, fragments, fixture_dir):
+        fixture_dir = Path(fixture_dir)
+        fixture_dir.mkdir(parents=True, exist_ok=True)
+
+        with open(fixture_dir / "extract_info.json", "w") as payload_file:
+            json.dump(payload, payload_file, indent=2)
+
+        for storyboard_format in payload["formats"]:
+            for fragment_idx, fragment in enumerate(
+                storyboard_format.get("fragments", [])
+            ):
+                if fragment["url"] in fragments:
+                    (
+                        fixture_dir
+                        / f"{storyboard_format['format_id']}-{fragment_idx}.jpg"
+                    ).write_bytes(fragments[fragment["url"]])
+
+    def extract_info(self, video_id, download=True):
+        # The payload is trimmed by the caller, so hand out a copy
+        return copy.deepcopy(self.payload)
+
+    def fragment_bytes(self, url):
+        if url not in self.fragments:
+            self.fragments[url] = self._render_fragment(self._formats[url], url)
+
+        return self.fragments[url]
+
+    @staticmethod
+    def _render_fragment(storyboard_format, url):
+        # Blurred noise of varying sharpness with a bright square that moves
+        # between the frames, so every frame has edges and differs a little
+        rng = numpy.random.default_rng(zlib.crc32(url.encode()))
+        rows = storyboard_format["rows"]
+        columns = storyboard_format["columns"]
+        width = storyboard_format["width"]
+        height = storyboard_format["height"]
+
+        storyboard = numpy.zeros((rows * height, columns * width, 3), dtype=numpy.uint8)
+        for tile_idx in range(rows * columns):
+            frame = cv2.GaussianBlur(
+                rng.integers(0, 256, (height, width, 3), dtype=numpy.uint8),
+                (0, 0),
+                rng.uniform(0.5, 3),
+            )
+            square_size = max(1, height // 4)
+            top = rng.integers(0, height - square_size + 1)
+            left = rng.integers(0, width - square_size + 1)
+            frame[top : top + square_size, left : left + square_size] = 255
+
+            row, column = divmod(tile_idx, columns)
+            storyboard[
+                row * height : (row + 1) * height,
+                column * width : (column + 1) * width,
+            ] = frame
+
+        storyboard_file = BytesIO()
+        Image.fromarray(storyboard).save(storyboard_file, "JPEG", quality=80)
+        return storyboard_file.getvalue()
@@ -0,0 +1,150 @@
+from app.classification_batcher import ClassificationBatcher
+from app.image_classifier import ImageClassifier
+from app.logger import setup_logger
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+import asyncio
+import numpy
+
+logger = setup_logger(__name__, log_level="DEBUG", log_file=None)
+
+
+class ClassificationBatcherTest(IsolatedAsyncioTestCase):
+    # Number of concurrent requests to simulate
+    REQUEST_COUNT = 8
+
+    @classmethod
+    def setUpClass(cls):
+        logger.info("Set up testing class.")
+
+        rng = numpy.random.default_rng(0)
+        cls.video_frames = [
+            rng.integers(0, 256, (90, 160, 3), dtype=numpy.uint8)
+            for _ in range(cls.REQUEST_COUNT)
+        ]
+        # Load the model up front so it isn't part of the timings
+        ImageClassifier()
+
+        logger.info("Testing class set up completed.")
+
+    async def asyncSetUp(self):
+        self.classification_batcher = ClassificationBatcher()
+        # Wait long enough for every concurrent request to join the batch
+        self.classification_batcher.MAX_WAIT = 0.5
+        await self.classification_batcher.start()
+
+    async def asyncTearDown(self):
+        await self.classification_batcher.close()
+
+    async def test_concurrent_frames_batched(self):
+        """
+        Test to ensure that frames from concurrent requests are classified
+        in one batch and every request gets back its own scores
+        """
+
+        logger.info("Starting concurrent batching test.")
+
+        batch_count = ClassificationBatcher.batch_size.snapshot()["count"]
+
+        batch_results = await asyncio.gather(
+            *(
+                self.classification_batcher.classify_frame(frame)
+                for frame in self.video_frames
+            )
+        )
+        single_results = [
+            ImageClassifier().classify_frame(frame) for frame in self.video_frames
+        ]
+
+        self.assertEqual(
+            batch_count + 1,
+            ClassificationBatcher.batch_size.snapshot()["count"],
+            "Expected the frames to be classified in a single batch!",
+        )
+
+        for batch_result, single_result in zip(batch_results, single_results):
+            for category in single_result:
+                self.assertAlmostEqual(
+                    single_result[category],
+                    batch_result[category],
+                    places=4,
+                    msg="Expected every request to get its own scores!",
+                )
+
+        logger.info("Concurrent batching test passed.")
+
+    async def test_full_batch_flushed(self):
+        """
+        Test to ensure that a full batch is flushed without waiting for MAX_WAIT
+        """
+
+        logger.info("Starting full batch test.")
+
+        self.classification_batcher.MAX_BATCH_SIZE = 2
+        batch_count = ClassificationBatcher.batch_size.snapshot()["count"]
+
+        await asyncio.wait_for(
+            asyncio.gather(
+                *(
+                    self.classification_batcher.classify_frame(frame)
+                    for frame in self.video_frames[:2]
+                )
+            ),
+            self.classification_batcher.MAX_WAIT,
+        )
+
+        self.assertEqual(
+            batch_count + 1,
+            ClassificationBatcher.batch_size.snapshot()["count"],
+            "Expected the full batch to be flushed straight away!",
+        )
+
+        logger.info("Full batch test passed.")
+
+    async def test_mixed_batch_allocations(self):
+        """
+        Test to ensure that batches of mixed sizes keep a bounded amount of
+        interpreters per pool slot and stop allocating once the buckets in use
+        are allocated
+        """
+
+        logger.info("Starting mixed batch allocation test.")
+
+        async def classify_batches(request_counts):
+            for request_count in request_counts:
+                await asyncio.gather(
+                    *(
+                        self.classification_batcher.classify_frame(frame)
+                        for frame in self.video_frames[:request_count]
+                    )
+                )
+
+        # Pool slots keep the interpreters of 2 buckets
+        with patch.object(ImageClassifier, "BUCKET_INTERPRETERS", 2):
+            # Padded to the buckets 1 and 8, which both fit in a pool slot
+            request_counts = (1, 8, 1, 7, 1, 5, 1, 6)
+            await classify_batches(request_counts)
+            allocation_count = ImageClassifier.tensor_allocations.value()
+            await classify_batches(request_counts)
+
+            self.assertEqual(
+                allocation_count,
+                ImageClassifier.tensor_allocations.value(),
+                "Expected no allocations once the buckets in use are allocated!",
+            )
+
+            await classify_batches((1, 3, 5, 7, 8, 2, 6, 3, 5, 7))
+
+        for pooled_interpreter in ImageClassifier()._interpreter_pool.queue:
+            self.assertGreaterEqual(
+                2,
+                len(pooled_interpreter.batch_sizes),
+                "Expected a bounded amount of interpreters per pool slot!",
+            )
+            self.assertLessEqual(
+                set(pooled_interpreter.batch_sizes),
+                set(ImageClassifier.BATCH_BUCKETS),
+                "Expected every batch to be padded to a bucket size!",
+            )
+
+        logger.info("Mixed batch allocation test passed.")
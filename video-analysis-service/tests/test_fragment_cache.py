@@ -0,0 +1,111 @@
+from app.fragment_cache import FragmentCache
+from app.logger import setup_logger
+from unittest import TestCase
+from PIL import Image
+from io import BytesIO
+import tempfile
+import numpy
+import os
+
+logger = setup_logger(__name__, log_level="DEBUG", log_file=None)
+
+
+class FragmentCacheTest(TestCase):
+    STORYBOARD_URL = "https://i.ytimg.com/sb/id/storyboard3_L2/M0.jpg?sqp=abc&sigh=%s"
+    THUMBNAIL_URL = "https://i.ytimg.com/vi/id/hqdefault.jpg?sqp=abc&rs=%s"
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+        image_file = BytesIO()
+        Image.fromarray(
+            numpy.random.default_rng(0).integers(
+                0, 256, (90, 160, 3), dtype=numpy.uint8
+            )
+        ).save(image_file, "JPEG")
+        self.image_bytes = image_file.getvalue()
+
+    def _open_cache(self, max_bytes=1024 * 1024):
+        fragment_cache = FragmentCache(self.temp_dir.name, max_bytes)
+        fragment_cache.open()
+        return fragment_cache
+
+    def test_image_decoded_from_cache(self):
+        """
+        Test to ensure that a cached image decodes the same as the downloaded bytes
+        """
+
+        logger.info("Starting cached image test.")
+
+        fragment_cache = self._open_cache()
+        url = self.STORYBOARD_URL % "a"
+
+        self.assertIsNone(fragment_cache.get(url), "Expected a miss!")
+        fragment_cache.put(url, self.image_bytes)
+
+        numpy.testing.assert_array_equal(
+            numpy.asarray(Image.open(BytesIO(self.image_bytes))),
+            numpy.asarray(Image.open(fragment_cache.get(url))),
+        )
+        self.assertEqual(0.5, fragment_cache.stats()["hit_ratio"])
+
+        logger.info("Cached image test passed.")
+
+    def test_volatile_params_ignored(self):
+        """
+        Test to ensure that storyboard signatures are left out of the key,
+        but other signatures are not
+        """
+
+        logger.info("Starting volatile params test.")
+
+        fragment_cache = self._open_cache()
+        fragment_cache.put(self.STORYBOARD_URL % "a", self.image_bytes)
+        fragment_cache.put(self.THUMBNAIL_URL % "a", self.image_bytes)
+
+        self.assertIsNotNone(
+            fragment_cache.get(self.STORYBOARD_URL % "b"),
+            "Expected the storyboard signature to be ignored!",
+        )
+        self.assertIsNone(
+            fragment_cache.get(self.THUMBNAIL_URL % "b"),
+            "Expected the thumbnail signature to be kept!",
+        )
+
+        logger.info("Volatile params test passed.")
+
+    def test_least_recently_used_evicted(self):
+        """
+        Test to ensure that the least recently used files are evicted first,
+        including across reopening the cache
+        """
+
+        logger.info("Starting eviction test.")
+
+        image_size = len(self.image_bytes)
+        fragment_cache = self._open_cache(max_bytes=image_size * 2)
+        urls = [self.STORYBOARD_URL.replace("M0", f"M{idx}") for idx in range(3)]
+
+        fragment_cache.put(urls[0], self.image_bytes)
+        fragment_cache.put(urls[1], self.image_bytes)
+        # Use the first file so that the second one is the least recently used
+        fragment_cache.get(urls[0])
+        fragment_cache.put(urls[2], self.image_bytes)
+
+        self.assertIsNone(fragment_cache.get(urls[1]), "Expected M1 to be evicted!")
+        self.assertEqual(1, fragment_cache.stats()["evictions"])
+
+        # The use order is restored from the modification times,
+        # set them explicitly so they can't be equal
+        for modified_time, url in ((1, urls[0]), (2, urls[2])):
+            os.utime(
+                os.path.join(self.temp_dir.name, fragment_cache._file_name(url)),
+                (modified_time, modified_time),
+            )
+
+        reopened_cache = self._open_cache(max_bytes=image_size)
+        self.assertIsNone(reopened_cache.get(urls[0]), "Expected M0 to be evicted!")
+        self.assertIsNotNone(reopened_cache.get(urls[2]), "Expected M2 to be kept!")
+
+        logger.info("Eviction test passed.")
@@ -0,0 +1,259 @@
+from app.frame_scorer import FrameScorer, FrameScorerError
+from app.logger import setup_logger
+from unittest import TestCase
+from PIL import Image
+import statistics
+import tracemalloc
+import numpy
+import cv2
+
+logger = setup_logger(__name__, log_level="DEBUG", log_file=None)
+
+
+class FrameScorerTest(TestCase):
+    # Number of synthetic frames, roughly the amount of storyboard frames per video
+    FRAME_COUNT = 50
+    FRAME_SIZE = (90, 160)
+
+    @classmethod
+    def setUpClass(cls):
+        logger.info("Set up testing class.")
+
+        rng = numpy.random.default_rng(0)
+        cls.video_frames = [
+            Image.fromarray(
+                cv2.GaussianBlur(
+                    rng.integers(0, 256, cls.FRAME_SIZE + (3,), dtype=numpy.uint8),
+                    (0, 0),
+                    rng.uniform(0.5, 4),
+                )
+            )
+            for _ in range(cls.FRAME_COUNT)
+        ]
+
+        logger.info("Testing class set up completed.")
+
+    @staticmethod
+    def _reference_scores(video_frames):
+        # Straightforward per-frame implementation of the scoring algorithm
+        edge_maps = sorted(
+            (
+                (edge_map, edge_map.var())
+                for edge_map in (
+                    cv2.Laplacian(
+                        cv2.cvtColor(numpy.array(frame), cv2.COLOR_RGB2GRAY),
+                        cv2.CV_64F,
+                    )
+                    for frame in video_frames
+                )
+            ),
+            key=lambda x: x[1],
+        )
+        edge_var = [x[1] for x in edge_maps]
+        edge_mean = statistics.mean(edge_var)
+        edge_stdev = statistics.stdev(edge_var)
+        edge_maps = [
+            x
+            for x in edge_maps
+            if edge_mean - edge_stdev <= x[1] <= edge_mean + edge_stdev
+        ]
+
+        diff_sums = [cv2.absdiff(edge_maps[0][0], x[0]).sum() for x in edge_maps]
+        diff_mean = statistics.mean(diff_sums)
+        diff_stdev = statistics.stdev(diff_sums)
+        filtered = sorted(
+            (
+                (edge_maps[position][1], diff_sum)
+                for position, diff_sum in enumerate(diff_sums)
+                if diff_mean - diff_stdev <= diff_sum <= diff_mean + diff_stdev
+            ),
+            key=lambda x: x[1],
+        )
+
+        return filtered[len(filtered) // 2]
+
+    def test_scores_match_reference(self):
+        """
+        Test to ensure that the vectorized scores are identical to
+        the per-frame implementation
+        """
+
+        logger.info("Starting reference scores test.")
+
+        frame_scorer = FrameScorer(self.video_frames)
+        selected_position = frame_scorer.score()
+
+        self.assertEqual(
+            self._reference_scores(self.video_frames),
+            (
+                frame_scorer.edge_variances[selected_position],
+                frame_scorer.diff_sums[selected_position],
+            ),
+            "Expected scores to match the per-frame implementation!",
+        )
+
+        logger.info("Reference scores test passed.")
+
+    def test_scores_identical_frames(self):
+        """
+        Test to ensure that a video made of a single repeated frame
+        does not filter out every frame
+        """
+
+        logger.info("Starting identical frames test.")
+
+        frame_scorer = FrameScorer([self.video_frames[0]] * self.FRAME_COUNT)
+        selected_position = frame_scorer.score()
+
+        self.assertEqual(
+            self.FRAME_COUNT,
+            len(frame_scorer.filtered_positions),
+            "Expected no frames to be filtered!",
+        )
+        self.assertEqual(
+            0, frame_scorer.diff_sums[selected_position], "Expected no diff!"
+        )
+
+        logger.info("Identical frames test passed.")
+
+    def test_chunked_scores(self):
+        """
+        Test to ensure that adding frames in chunks, in any order,
+        gives the same scores as adding all the frames at once
+        """
+
+        logger.info("Starting chunked scores test.")
+
+        frame_scorer = FrameScorer(self.video_frames)
+        chunked_scorer = FrameScorer()
+        chunk_size = 10
+
+        # Add the chunks back to front to simulate out of order downloads
+        for chunk_start in reversed(range(0, self.FRAME_COUNT, chunk_size)):
+            chunked_scorer.add_frames(
+                self.video_frames[chunk_start : chunk_start + chunk_size],
+                order=chunk_start,
+            )
+
+        self.assertEqual(
+            frame_scorer.score(),
+            chunked_scorer.score(),
+            "Expected the same frame to be selected!",
+        )
+        numpy.testing.assert_array_equal(
+            frame_scorer.diff_sums, chunked_scorer.diff_sums
+        )
+        self.assertEqual(
+            [id(frame) for frame in self.video_frames],
+            [id(frame) for frame in chunked_scorer.video_frames],
+            "Expected the frames to be joined in order!",
+        )
+
+        logger.info("Chunked scores test passed.")
+
+    def test_preview_scores(self):
+        """
+        Test to ensure that previewing the scores leaves the frames open for
+        more chunks and matches the final scores once every frame is added
+        """
+
+        logger.info("Starting preview scores test.")
+
+        chunked_scorer = FrameScorer()
+        chunk_size = 10
+
+        chunked_scorer.add_frames(self.video_frames[:chunk_size], order=0)
+        chunked_scorer.preview()
+        chunked_scorer.add_frames(self.video_frames[chunk_size:], order=1)
+
+        preview_scores = chunked_scorer.preview()
+        selected_position = chunked_scorer.score()
+
+        self.assertEqual(
+            self.FRAME_COUNT,
+            len(chunked_scorer.video_frames),
+            "Expected every chunk to be scored!",
+        )
+        numpy.testing.assert_allclose(
+            FrameScorer(self.video_frames).preview(),
+            preview_scores,
+            err_msg="Expected the same statistics as adding every frame at once!",
+        )
+        self.assertEqual(
+            (
+                chunked_scorer.edge_variances[selected_position],
+                chunked_scorer.diff_sums[selected_position],
+            ),
+            preview_scores[2:],
+            "Expected the preview to match the final scores!",
+        )
+
+        logger.info("Preview scores test passed.")
+
+    def test_low_memory_scores(self):
+        """
+        Test to ensure that low memory mode gives the same scores and
+        can rebuild the maps that it drops
+        """
+
+        logger.info("Starting low memory scores test.")
+
+        frame_scorer = FrameScorer(self.video_frames)
+        low_memory_scorer = FrameScorer(self.video_frames, low_memory=True)
+
+        self.assertEqual(
+            frame_scorer.score(),
+            low_memory_scorer.score(),
+            "Expected the same frame to be selected!",
+        )
+        self.assertIsNone(low_memory_scorer.edge_maps, "Expected no edge maps!")
+        self.assertIsNone(low_memory_scorer.diff_maps, "Expected no diff maps!")
+        numpy.testing.assert_array_equal(
+            frame_scorer.diff_sums, low_memory_scorer.diff_sums
+        )
+
+        selected_position = frame_scorer.selected_position
+        numpy.testing.assert_array_equal(
+            frame_scorer.diff_map(selected_position),
+            low_memory_scorer.diff_map(selected_position),
+        )
+
+        logger.info("Low memory scores test passed.")
+
+    def test_low_memory_peak(self):
+        """
+        Test to check the peak memory used while scoring in each mode
+        """
+
+        logger.info("Starting low memory peak test.")
+
+        peak_memory = {}
+
+        for low_memory in (False, True):
+            tracemalloc.start()
+            frame_scorer = FrameScorer(self.video_frames, low_memory=low_memory)
+            frame_scorer.score()
+            peak_memory[low_memory] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            logger.info(f"Low memory {low_memory}: {peak_memory[low_memory]}B peak")
+
+        self.assertGreater(
+            peak_memory[False],
+            peak_memory[True],
+            "Expected low memory mode to use less memory!",
+        )
+
+        logger.info("Low memory peak test passed.")
+
+    def test_too_few_frames(self):
+        """
+        Test to ensure that scoring fails cleanly without enough frames to diff
+        """
+
+        logger.info("Starting too few frames test.")
+
+        with self.assertRaises(FrameScorerError):
+            FrameScorer(self.video_frames[:1]).score()
+
+        logger.info("Too few frames test passed.")
@@ -1,9 +1,11 @@
-from app.image_classifier import ImageClassifier
+from app.image_classifier import ImageClassifier, _PooledInterpreter
 from app.logger import setup_logger
 from unittest import TestCase
 from pathlib import Path
 from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
 import gdown
+import numpy as np
 import shutil
 import time
 
@@ -110,6 +112,159 @@ class ImageClassifierTest(TestCase):
 
         logger.info("Batch classification test passed.")
 
+    def test_classify_frames_matches_single(self):
+        """
+        Test to ensure that batched classification gives the same scores
+        as classifying each frame on its own
+        """
+
+        logger.info("Starting batched inference consistency test.")
+
+        images = [
+            Image.open(image) for image in list(self.dataset_dir.glob("*/*.png"))[:4]
+        ]
+
+        batch_results = ImageClassifier().classify_frames(images)
+        single_results = [ImageClassifier().classify_frame(image) for image in images]
+
+        self.assertEqual(
+            len(images), len(batch_results), "Expected a result per frame!"
+        )
+
+        for batch_result, single_result in zip(batch_results, single_results):
+            for category in single_result:
+                self.assertAlmostEqual(
+                    single_result[category],
+                    batch_result[category],
+                    places=4,
+                    msg="Expected batched scores to match single frame scores!",
+                )
+
+        logger.info("Batched inference consistency test passed.")
+
+    def test_classify_frames_speed(self):
+        """
+        Test to check that per-frame latency drops as the batch size grows
+        """
+
+        logger.info("Starting batched inference speed test.")
+
+        images = [
+            Image.open(image)
+            for image in list(self.dataset_dir.glob("*/*.png"))[
+                : ImageClassifier.MAX_BATCH_SIZE
+            ]
+        ]
+        per_frame_times = {}
+
+        for batch_size in (1, 4, len(images)):
+            batch = images[:batch_size]
+            # Warm up the interpreter for this batch size
+            ImageClassifier().classify_frames(batch)
+
+            start = time.time()
+            ImageClassifier().classify_frames(batch)
+            per_frame_times[batch_size] = (time.time() - start) / batch_size
+
+            logger.info(
+                f"Batch size {batch_size}: {per_frame_times[batch_size]}s per frame"
+            )
+
+        self.assertGreaterEqual(
+            per_frame_times[1],
+            per_frame_times[len(images)],
+            "Expected batching to reduce the per-frame latency!",
+        )
+
+        logger.info("Batched inference speed test passed.")
+
+    def test_classify_concurrent(self):
+        """
+        Test to ensure that concurrent classifications through the
+        interpreter pool give the same scores as sequential ones
+        """
+
+        logger.info("Starting concurrent classification test.")
+
+        images = [
+            Image.open(image)
+            for image in list(self.dataset_dir.glob("*/*.png"))[: self.BATCH_SIZE]
+        ]
+
+        with ThreadPoolExecutor(max_workers=ImageClassifier.POOL_SIZE * 2) as executor:
+            concurrent_results = list(
+                executor.map(ImageClassifier().classify_frame, images)
+            )
+
+        sequential_results = [
+            ImageClassifier().classify_frame(image) for image in images
+        ]
+
+        self.assertEqual(
+            sequential_results,
+            concurrent_results,
+            "Expected concurrent scores to match sequential scores!",
+        )
+
+        logger.info("Concurrent classification test passed.")
+
+    def test_warm_up(self):
+        """
+        Test to ensure that warming up leaves every interpreter in the pool
+        and doesn't change the scores
+        """
+
+        logger.info("Starting warm up test.")
+
+        image = Image.open(self.dataset_dir.glob("*/*.png").__next__())
+        classifier = ImageClassifier()
+        cold_result = classifier.classify_frame(image)
+
+        classifier.warm_up()
+
+        self.assertEqual(
+            ImageClassifier.POOL_SIZE,
+            classifier._interpreter_pool.qsize(),
+            "Expected every interpreter to be returned to the pool!",
+        )
+        self.assertEqual(
+            cold_result,
+            classifier.classify_frame(image),
+            "Expected the same scores after warming up!",
+        )
+
+        logger.info("Warm up test passed.")
+
+    def test_xnnpack_toggle(self):
+        """
+        Test to ensure that turning off XNNPACK doesn't change the scores
+        """
+
+        logger.info("Starting XNNPACK toggle test.")
+
+        prediction_array = np.stack(
+            [
+                ImageClassifier._prepare_frame(Image.open(image))
+                for image in list(self.dataset_dir.glob("*/*.png"))[:4]
+            ]
+        )
+
+        xnnpack_scores = _PooledInterpreter(
+            ImageClassifier.MODEL_PATH, xnnpack=True
+        ).invoke(prediction_array)
+        builtin_scores = _PooledInterpreter(
+            ImageClassifier.MODEL_PATH, xnnpack=False
+        ).invoke(prediction_array)
+
+        np.testing.assert_allclose(
+            xnnpack_scores,
+            builtin_scores,
+            atol=1e-5,
+            err_msg="Expected the same scores with and without XNNPACK!",
+        )
+
+        logger.info("XNNPACK toggle test passed.")
+
     def test_classify_accuracy_batch(self):
         """
         Test to check the overrall accuracy of the model
@@ -152,3 +307,45 @@ class ImageClassifierTest(TestCase):
         )
 
         logger.info("Batch accuracy test passed.")
+
+
+class QuantizationTest(TestCase):
+    def test_quantization(self):
+        """
+        Test to ensure that inputs are quantized and outputs dequantized
+        with the scale and zero point of their tensors
+        """
+
+        logger.info("Starting quantization test.")
+
+        pixels = np.array([0, 1, 127, 128, 255], dtype=np.uint8)
+        int8_details = {"dtype": np.int8, "quantization": (1.0, -128)}
+        uint8_details = {"dtype": np.uint8, "quantization": (1.0, 0)}
+        float_details = {"dtype": np.float32, "quantization": (0.0, 0)}
+
+        np.testing.assert_array_equal(
+            np.array([-128, -127, -1, 0, 127], dtype=np.int8),
+            _PooledInterpreter._quantize(pixels, int8_details),
+            err_msg="Expected the pixels to be shifted into the int8 range!",
+        )
+        self.assertIs(
+            pixels,
+            _PooledInterpreter._quantize(pixels, uint8_details),
+            "Expected uint8 pixels to be passed as they are!",
+        )
+        self.assertEqual(
+            np.float32,
+            _PooledInterpreter._quantize(pixels, float_details).dtype,
+            "Expected float models to get float inputs!",
+        )
+
+        output_details = {"dtype": np.uint8, "quantization": (1 / 256, 0)}
+        np.testing.assert_allclose(
+            [0.0, 0.5, 255 / 256],
+            _PooledInterpreter._dequantize(
+                np.array([0, 128, 255], dtype=np.uint8), output_details
+            ),
+            err_msg="Expected the outputs to be scaled back to scores!",
+        )
+
+        logger.info("Quantization test passed.")
@@ -0,0 +1,149 @@
+from app.keyword_matcher import KeywordMatcher
+from app.keywords import STATIC_KEYWORDS
+from app.logger import setup_logger
+from unittest import TestCase
+import random
+import time
+import re
+
+logger = setup_logger(__name__, log_level="DEBUG", log_file=None)
+
+
+class KeywordMatcherTest(TestCase):
+    # Roughly the length of a long video description
+    TEXT_WORD_COUNT = 1000
+    CLIENT_KEYWORD_COUNT = 500
+    BENCHMARK_RUNS = 5
+
+    @classmethod
+    def setUpClass(cls):
+        logger.info("Set up testing class.")
+
+        rng = random.Random(0)
+        static_keywords = [
+            keyword for values in STATIC_KEYWORDS.values() for keyword in values
+        ]
+        client_keywords = [
+            "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(3, 10)))
+            for _ in range(cls.CLIENT_KEYWORD_COUNT)
+        ]
+        cls.keywords = STATIC_KEYWORDS | {
+            "client": client_keywords + ["c++", "c#", "node.js", "node"]
+        }
+
+        # Mix keywords with filler words and punctuation
+        cls.text = " ".join(
+            rng.choice(
+                [
+                    rng.choice(static_keywords + client_keywords).upper(),
+                    rng.choice(["the", "a", "video", "about", "this", "and"]),
+                    rng.choice(["C++", "C#", "node.js", "(learn)", "web-design"]),
+                ]
+            )
+            + rng.choice(["", "", ",", ".", "!"])
+            for _ in range(cls.TEXT_WORD_COUNT)
+        )
+
+        logger.info("Testing class set up completed.")
+
+    @staticmethod
+    def _reference_scores(text, keywords):
+        # A scan per keyword, the keywords are escaped and the text is padded
+        # so the results only differ from the matcher in speed
+        text = f" {text} "
+        return {
+            key: len(
+                [
+                    value
+                    for value in values
+                    if re.search(f"\\W{re.escape(value)}\\W", text, re.IGNORECASE)
+                ]
+            )
+            for key, values in keywords.items()
+        }
+
+    def test_scores_match_reference(self):
+        """
+        Test to ensure that the matcher gives the same scores as
+        scanning the text once per keyword
+        """
+
+        logger.info("Starting reference scores test.")
+
+        self.assertEqual(
+            self._reference_scores(self.text, self.keywords),
+            KeywordMatcher(self.keywords).calculate_scores(self.text),
+            "Expected scores to match the per-keyword implementation!",
+        )
+
+        logger.info("Reference scores test passed.")
+
+    def test_overlapping_keywords(self):
+        """
+        Test to ensure that keywords which are prefixes of other keywords
+        are only found when they end at a word boundary
+        """
+
+        logger.info("Starting overlapping keywords test.")
+
+        keyword_matcher = KeywordMatcher(
+            {"coding": ["c", "c++", "java", "javascript", "node", "node.js"]}
+        )
+
+        self.assertEqual(
+            {"c", "c++", "javascript"},
+            keyword_matcher.find_keywords("Learn C++ and JavaScript"),
+            "Expected the prefix c to be found but not java!",
+        )
+        self.assertEqual(
+            {"node", "node.js"},
+            keyword_matcher.find_keywords("node.js"),
+            "Expected both node keywords at the edges of the text!",
+        )
+
+        logger.info("Overlapping keywords test passed.")
+
+    def test_duplicate_keywords(self):
+        """
+        Test to ensure that duplicate keywords are counted each time they are listed
+        """
+
+        logger.info("Starting duplicate keywords test.")
+
+        keyword_matcher = KeywordMatcher({"music": ["song", "Song", "rap"]})
+
+        self.assertEqual(
+            {"music": 2},
+            keyword_matcher.calculate_scores("a new song"),
+            "Expected 2 matches for music!",
+        )
+
+        logger.info("Duplicate keywords test passed.")
+
+    def test_matcher_speed(self):
+        """
+        Test to check the speed of the matcher against scanning the text
+        once per keyword
+        """
+
+        logger.info("Starting matcher speed test.")
+
+        keyword_matcher = KeywordMatcher(self.keywords)
+
+        start = time.perf_counter()
+        for _ in range(self.BENCHMARK_RUNS):
+            keyword_matcher.calculate_scores(self.text)
+        matcher_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(self.BENCHMARK_RUNS):
+            self._reference_scores(self.text, self.keywords)
+        reference_time = time.perf_counter() - start
+
+        logger.info(f"Matcher time: {matcher_time}s, reference time: {reference_time}s")
+
+        self.assertGreater(
+            reference_time, matcher_time, "Expected the matcher to be faster!"
+        )
+
+        logger.info("Matcher speed test passed.")
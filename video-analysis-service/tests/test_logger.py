@@ -0,0 +1,68 @@
+from app.logger import SampledLogger, setup_logger
+from logging.handlers import QueueHandler
+from unittest import TestCase
+import logging
+
+logger = setup_logger(__name__, log_level="DEBUG", log_file=None)
+
+
+class LoggerTest(TestCase):
+    def test_shared_queue_handler(self):
+        """
+        Test to ensure that loggers of the same file share one queued sink
+        """
+
+        logger.info("Starting shared queue handler test.")
+
+        first_logger = setup_logger("test_logger.first", log_file=None)
+        second_logger = setup_logger("test_logger.second", log_file=None)
+
+        self.assertEqual(1, len(first_logger.handlers), "Expected one handler!")
+        self.assertIsInstance(
+            first_logger.handlers[0], QueueHandler, "Expected a queue handler!"
+        )
+        self.assertIs(
+            first_logger.handlers[0],
+            second_logger.handlers[0],
+            "Expected the loggers to share their handler!",
+        )
+
+        logger.info("Shared queue handler test passed.")
+
+    def test_sampled_logger(self):
+        """
+        Test to ensure that only one in every few messages is logged
+        and that nothing is counted while the level is disabled
+        """
+
+        logger.info("Starting sampled logger test.")
+
+        sampled_logger = SampledLogger(logger, every=3)
+        with self.assertLogs(logger, logging.DEBUG) as logs:
+            for message_idx in range(7):
+                sampled_logger.debug("Message %s", message_idx)
+
+        self.assertEqual(
+            [
+                "Message 0 (1 in 3 logged)",
+                "Message 3 (1 in 3 logged)",
+                "Message 6 (1 in 3 logged)",
+            ],
+            [record.getMessage() for record in logs.records],
+            "Expected every third message!",
+        )
+
+        quiet_logger = logging.getLogger("test_logger.quiet")
+        quiet_logger.setLevel(logging.INFO)
+        sampled_quiet_logger = SampledLogger(quiet_logger, every=2)
+        sampled_quiet_logger.debug("Dropped")
+        with self.assertLogs(quiet_logger, logging.INFO) as logs:
+            sampled_quiet_logger.info("Kept")
+
+        self.assertEqual(
+            ["Kept (1 in 2 logged)"],
+            [record.getMessage() for record in logs.records],
+            "Expected disabled messages not to be counted!",
+        )
+
+        logger.info("Sampled logger test passed.")
@@ -0,0 +1,71 @@
+from app.lru_cache import LRUCache
+from app.logger import setup_logger
+from unittest import TestCase
+from unittest.mock import patch
+
+logger = setup_logger(__name__, log_level="DEBUG", log_file=None)
+
+
+class LRUCacheTest(TestCase):
+    def test_hit_and_miss(self):
+        """
+        Test to ensure that stored values are returned and counted
+        """
+
+        logger.info("Starting hit and miss test.")
+
+        cache = LRUCache(2)
+        cache.put("a", 1)
+
+        self.assertEqual(1, cache.get("a"), "Expected the cached value!")
+        self.assertIsNone(cache.get("b"), "Expected no value!")
+        self.assertEqual(
+            {"hits": 1, "misses": 1, "evictions": 0, "size": 1},
+            cache.stats(),
+            "Expected one hit and one miss!",
+        )
+
+        logger.info("Hit and miss test passed.")
+
+    def test_eviction(self):
+        """
+        Test to ensure that the least recently used entry is evicted first
+        """
+
+        logger.info("Starting eviction test.")
+
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        # Use "a" so that "b" becomes the least recently used entry
+        cache.get("a")
+        cache.put("c", 3)
+
+        self.assertEqual(1, cache.get("a"), "Expected a to be kept!")
+        self.assertIsNone(cache.get("b"), "Expected b to be evicted!")
+        self.assertEqual(3, cache.get("c"), "Expected c to be kept!")
+        self.assertEqual(1, cache.stats()["evictions"], "Expected one eviction!")
+
+        logger.info("Eviction test passed.")
+
+    def test_expiry(self):
+        """
+        Test to ensure that entries are dropped once their ttl has passed
+        """
+
+        logger.info("Starting expiry test.")
+
+        cache = LRUCache(2, ttl=10)
+
+        with patch("app.lru_cache.time.monotonic", return_value=100):
+            cache.put("a", 1)
+
+        with patch("app.lru_cache.time.monotonic", return_value=105):
+            self.assertEqual(1, cache.get("a"), "Expected a to still be valid!")
+
+        with patch("app.lru_cache.time.monotonic", return_value=111):
+            self.assertIsNone(cache.get("a"), "Expected a to have expired!")
+
+        self.assertEqual(0, len(cache), "Expected the expired entry to be dropped!")
+
+        logger.info("Expiry test passed.")
@@ -0,0 +1,291 @@
+from app import main
+from app.image_classifier import ImageClassifier
+from app.video_analyser import VideoAnalyser
+from app.video_downloader import VideoDownloader, VideoDownloaderError
+from app.logger import setup_logger
+from fastapi.testclient import TestClient
+from contextlib import contextmanager
+from unittest import TestCase
+from unittest.mock import patch
+import asyncio
+import cv2
+import httpx
+import numpy
+import time
+
+logger = setup_logger(__name__, log_level="DEBUG", log_file=None)
+
+
+def _video_info(title, category, storyboard=None):
+    return {
+        "title": title,
+        "description": "",
+        "categories": [category],
+        "is_live": storyboard is None,
+        "thumbnails": [],
+        "storyboard": storyboard,
+    }
+
+
+class TextAnalysisBatchRouteTest(TestCase):
+    def setUp(self):
+        VideoDownloader.metadata_cache.clear()
+        self.addCleanup(VideoDownloader.metadata_cache.clear)
+        self.client = TestClient(main.app)
+
+    def test_batch_results(self):
+        """
+        Test to ensure that batch results come back in the order of the
+        video ids and a failing video only fails its own result,
+        without hitting the network
+        """
+
+        logger.info("Starting batch text analysis test.")
+
+        async def extract_video_info(vid_dl):
+            if vid_dl.video_id == "broken":
+                raise VideoDownloaderError("Video unavailable")
+
+            # The first video finishes last
+            await asyncio.sleep(0.05 if vid_dl.video_id == "music" else 0)
+            return _video_info(f"{vid_dl.video_id} video", vid_dl.video_id.title())
+
+        with (
+            patch.object(VideoDownloader, "_extract_video_info", extract_video_info),
+            patch("app.video_downloader.YoutubeDL") as youtube_dl,
+        ):
+            response = self.client.post(
+                "/text-analysis/batch",
+                json={"video_ids": ["music", "broken", "news"]},
+            )
+
+        self.assertEqual(200, response.status_code)
+        # Building a YoutubeDL for every video would block the event loop
+        youtube_dl.assert_not_called()
+        results = response.json()["results"]
+
+        self.assertEqual(
+            ["music", "broken", "news"],
+            [result["videoId"] for result in results],
+            "Expected the results in the order of the video ids!",
+        )
+        self.assertTrue(results[0]["isYtCategorized"], "Expected a music video!")
+        self.assertIn("error", results[1], "Expected the broken video to fail!")
+        self.assertNotIn("textScores", results[1])
+        self.assertFalse(results[2]["isYtCategorized"], "Expected a news video!")
+        self.assertIn("textScores", results[2])
+
+        logger.info("Batch text analysis test passed.")
+
+
+class ReadyRouteTest(TestCase):
+    def setUp(self):
+        main.service_ready.clear()
+        self.addCleanup(main.service_ready.clear)
+        self.client = TestClient(main.app)
+
+    def _warm_up(self, image_classifier_warm_up):
+        async def http_pool_warm_up():
+            pass
+
+        with (
+            patch.object(ImageClassifier, "warm_up", image_classifier_warm_up),
+            patch.object(VideoAnalyser, "warm_up", lambda: None),
+            patch.object(VideoDownloader, "warm_up", lambda: None),
+            patch.object(main.http_pool, "warm_up", http_pool_warm_up),
+        ):
+            asyncio.run(main.warm_up(time.time() - 1))
+
+    def test_ready_after_warm_up(self):
+        """
+        Test to ensure that the service is only ready once warm-up finishes
+        """
+
+        logger.info("Starting ready after warm-up test.")
+
+        self.assertEqual(
+            503, self.client.get("/ready").status_code, "Expected not ready yet!"
+        )
+
+        self._warm_up(lambda classifier: None)
+
+        self.assertEqual(
+            200, self.client.get("/ready").status_code, "Expected to be ready!"
+        )
+        self.assertLessEqual(
+            1, main.startup_time.value(), "Expected the time since the start!"
+        )
+
+        logger.info("Ready after warm-up test passed.")
+
+    def test_not_ready_after_failed_warm_up(self):
+        """
+        Test to ensure that the service stays unready when warm-up fails
+        """
+
+        logger.info("Starting failed warm-up test.")
+
+        def failing_warm_up(classifier):
+            raise ValueError("Could not open the model.")
+
+        self._warm_up(failing_warm_up)
+
+        self.assertEqual(
+            503,
+            self.client.get("/ready").status_code,
+            "Expected to stay unready after a failed warm-up!",
+        )
+
+        logger.info("Failed warm-up test passed.")
+
+
+class AnalysisRouteTest(TestCase):
+    FRAGMENT_COUNT = 6
+
+    def setUp(self):
+        VideoDownloader.metadata_cache.clear()
+        self.addCleanup(VideoDownloader.metadata_cache.clear)
+        self.client = TestClient(main.app)
+
+        rng = numpy.random.default_rng(0)
+        _, storyboard = cv2.imencode(
+            ".jpg", rng.integers(0, 256, (90 * 3, 160 * 3, 3), dtype=numpy.uint8)
+        )
+        self.storyboard_bytes = storyboard.tobytes()
+        self.requested_urls = []
+        self.extraction_count = 0
+
+    @contextmanager
+    def _patched_video(self, category):
+        storyboard_info = {
+            "format_id": "sb0",
+            "rows": 3,
+            "columns": 3,
+            "width": 160,
+            "height": 90,
+            "fragments": [
+                {"url": f"http://storyboard/{fragment_idx}"}
+                for fragment_idx in range(self.FRAGMENT_COUNT)
+            ],
+        }
+
+        async def extract_video_info(vid_dl):
+            self.extraction_count += 1
+            # Long enough for concurrent requests to overlap
+            await asyncio.sleep(0.05)
+            return _video_info("Video", category, storyboard_info)
+
+        async def get_image_bytes(vid_dl, url):
+            self.requested_urls.append(url)
+            return self.storyboard_bytes
+
+        async def classify_frame(frame):
+            return {"graphics": 0.5}
+
+        with (
+            patch.object(VideoDownloader, "_extract_video_info", extract_video_info),
+            patch.object(VideoDownloader, "_get_image_bytes", get_image_bytes),
+            patch.object(main.classification_batcher, "classify_frame", classify_frame),
+        ):
+            yield
+
+    def _analyse(self, category):
+        with self._patched_video(category):
+            response = self.client.get("/analysis", params={"video_id": category})
+
+        self.assertEqual(200, response.status_code)
+        return response.json()
+
+    def test_yt_categorized_skips_downloads(self):
+        """
+        Test to ensure that no storyboard fragment is downloaded for a video
+        that YT has already categorized, without hitting the network
+        """
+
+        logger.info("Starting YT categorized analysis test.")
+
+        response_data = self._analyse("Music")
+
+        self.assertTrue(response_data["isYtCategorized"], "Expected a music video!")
+        self.assertEqual([], self.requested_urls, "Expected no downloads!")
+        self.assertEqual(
+            0, response_data["framesUsed"], "Expected the dummy frame scores!"
+        )
+
+        logger.info("YT categorized analysis test passed.")
+
+    def test_uncategorized_analysed(self):
+        """
+        Test to ensure that the frames of a video that YT hasn't categorized
+        are downloaded and analysed, without hitting the network
+        """
+
+        logger.info("Starting uncategorized analysis test.")
+
+        response_data = self._analyse("News")
+
+        self.assertFalse(response_data["isYtCategorized"], "Expected a news video!")
+        self.assertEqual(
+            self.FRAGMENT_COUNT,
+            len(self.requested_urls),
+            "Expected every fragment to be downloaded!",
+        )
+        self.assertLess(0, response_data["framesUsed"], "Expected frames to be used!")
+        self.assertEqual({"graphics": 0.5}, response_data["imageScores"])
+
+        logger.info("Uncategorized analysis test passed.")
+
+    def test_progressive_stops_between_rounds(self):
+        """
+        Test to ensure that a progressive analysis only stops once a whole
+        round of fragments is in, without hitting the network
+        """
+
+        logger.info("Starting progressive analysis test.")
+
+        async def has_converged(vid_analyser):
+            return True
+
+        with (
+            patch.object(VideoAnalyser, "PROGRESSIVE", True),
+            patch.object(VideoAnalyser, "has_converged", has_converged),
+        ):
+            response_data = self._analyse("News")
+
+        self.assertEqual(
+            VideoDownloader.PROGRESSIVE_FIRST_ROUND,
+            len(self.requested_urls),
+            "Expected to stop after the first round!",
+        )
+        self.assertEqual(
+            VideoDownloader.PROGRESSIVE_FIRST_ROUND * 9,
+            response_data["framesUsed"],
+            "Expected the frames of the whole first round!",
+        )
+
+        logger.info("Progressive analysis test passed.")
+
+    def test_concurrent_endpoints_extract_once(self):
+        """
+        Test to ensure that concurrent text and video analyses of the same
+        video extract its information once, without hitting the network
+        """
+
+        logger.info("Starting concurrent endpoints test.")
+
+        async def analyse_concurrently():
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=main.app), base_url="http://test"
+            ) as client:
+                return await asyncio.gather(
+                    client.get("/text-analysis", params={"video_id": "News"}),
+                    client.get("/video-analysis", params={"video_id": "News"}),
+                )
+
+        with self._patched_video("News"):
+            responses = asyncio.run(analyse_concurrently())
+
+        self.assertEqual([200, 200], [response.status_code for response in responses])
+        self.assertEqual(1, self.extraction_count, "Expected a single extraction!")
+
+        logger.info("Concurrent endpoints test passed.")
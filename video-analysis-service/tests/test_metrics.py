@@ -0,0 +1,142 @@
+from app.metrics import Counter, Gauge, Histogram, MetricsError, MetricsRegistry
+from app.metrics import stage_timer
+from app.metrics import registry as default_registry
+from app.logger import setup_logger
+from unittest import TestCase
+
+logger = setup_logger(__name__, log_level="DEBUG", log_file=None)
+
+
+class MetricsTest(TestCase):
+    def test_histogram_rendering(self):
+        """
+        Test to ensure that histograms are rendered with cumulative buckets
+        """
+
+        logger.info("Starting histogram rendering test.")
+
+        registry = MetricsRegistry()
+        histogram = Histogram(
+            "test_seconds", "Test timings", buckets=(0.1, 1), registry=registry
+        )
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.observe(value)
+
+        self.assertEqual(
+            "# HELP test_seconds Test timings\n"
+            "# TYPE test_seconds histogram\n"
+            'test_seconds_bucket{le="0.1"} 2\n'
+            'test_seconds_bucket{le="1"} 3\n'
+            'test_seconds_bucket{le="+Inf"} 4\n'
+            "test_seconds_sum 2.65\n"
+            "test_seconds_count 4\n",
+            registry.render(),
+            "Expected the histogram in the Prometheus text format!",
+        )
+
+        logger.info("Histogram rendering test passed.")
+
+    def test_labels(self):
+        """
+        Test to ensure that metrics of the same name share one header
+        and are told apart by their labels
+        """
+
+        logger.info("Starting labels test.")
+
+        registry = MetricsRegistry()
+        Gauge("test_ratio", "Test ratio", labels={"cache": "a"}, registry=registry)
+        Gauge(
+            "test_ratio", "Test ratio", labels={"cache": 'b"c'}, registry=registry
+        ).set(0.5)
+
+        self.assertEqual(
+            "# HELP test_ratio Test ratio\n"
+            "# TYPE test_ratio gauge\n"
+            'test_ratio{cache="a"} 0\n'
+            'test_ratio{cache="b\\"c"} 0.5\n',
+            registry.render(),
+            "Expected one header and escaped labels!",
+        )
+        with self.assertRaises(MetricsError):
+            Gauge("test_ratio", "Test ratio", labels={"cache": "a"}, registry=registry)
+
+        logger.info("Labels test passed.")
+
+    def test_gauge(self):
+        """
+        Test to ensure that gauges count up and down and read their function
+        """
+
+        logger.info("Starting gauge test.")
+
+        gauge = Gauge("test_in_flight", "Test gauge", registry=None)
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+        self.assertEqual(1, gauge.value(), "Expected one increment to be left!")
+
+        items = [1, 2, 3]
+        function_gauge = Gauge(
+            "test_size", "Test gauge", function=lambda: len(items), registry=None
+        )
+        items.append(4)
+        self.assertEqual(4, function_gauge.value(), "Expected the current size!")
+
+        logger.info("Gauge test passed.")
+
+    def test_counter(self):
+        """
+        Test to ensure that counters only go up and are rendered as counters
+        """
+
+        logger.info("Starting counter test.")
+
+        registry = MetricsRegistry()
+        counter = Counter("test_requests_total", "Test counter", registry=registry)
+        counter.inc()
+        counter.inc(2)
+        Counter(
+            "test_calls_total",
+            "Test counter",
+            function=lambda: 5,
+            labels={"role": "leader"},
+            registry=registry,
+        )
+
+        self.assertEqual(
+            "# HELP test_calls_total Test counter\n"
+            "# TYPE test_calls_total counter\n"
+            'test_calls_total{role="leader"} 5\n'
+            "# HELP test_requests_total Test counter\n"
+            "# TYPE test_requests_total counter\n"
+            "test_requests_total 3\n",
+            registry.render(),
+            "Expected the counters in the Prometheus text format!",
+        )
+        with self.assertRaises(MetricsError):
+            counter.inc(-1)
+        with self.assertRaises(MetricsError):
+            Counter("test_requests", "Test counter", registry=None)
+
+        logger.info("Counter test passed.")
+
+    def test_stage_timer(self):
+        """
+        Test to ensure that stage timings are recorded even when the stage fails
+        """
+
+        logger.info("Starting stage timer test.")
+
+        with stage_timer("test_stage"):
+            pass
+        with self.assertRaises(ValueError), stage_timer("test_stage"):
+            raise ValueError
+
+        self.assertIn(
+            'video_analysis_stage_seconds_count{stage="test_stage"} 2\n',
+            default_registry.render(),
+            "Expected both runs of the stage to be recorded!",
+        )
+
+        logger.info("Stage timer test passed.")
@@ -0,0 +1,134 @@
+from app.result_cache import ResultCache
+from app.video_analyser import VideoAnalyser
+from app.video_downloader import VideoDownloader
+from app.logger import setup_logger
+from unittest import TestCase
+from unittest.mock import patch
+from pathlib import Path
+import tempfile
+
+logger = setup_logger(__name__, log_level="DEBUG", log_file=None)
+
+
+class ResultCacheTest(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        # Cleanups run last in first out, so the caches are closed first
+        self.addCleanup(self.temp_dir.cleanup)
+        self.cache_path = str(Path(self.temp_dir.name) / "result-cache.sqlite3")
+        self.model_path = Path(self.temp_dir.name) / "model.tflite"
+        self.model_path.write_bytes(b"model")
+        self.result = {
+            "imageScores": {"graphics": 0.5},
+            "frameScores": {"detailScore": 100.0, "diffScore": 1000.0},
+        }
+
+    def _open_cache(self, max_entries=10):
+        result_cache = ResultCache(self.cache_path, max_entries, self.model_path)
+        result_cache.open()
+        self.addCleanup(result_cache.close)
+        return result_cache
+
+    def test_result_persisted(self):
+        """
+        Test to ensure that results are still available after reopening the cache
+        """
+
+        logger.info("Starting result persistence test.")
+
+        result_cache = self._open_cache()
+        result_cache.put("video", self.result)
+        result_cache.close()
+
+        self.assertEqual(
+            self.result,
+            self._open_cache().get("video"),
+            "Expected the stored result!",
+        )
+
+        logger.info("Result persistence test passed.")
+
+    def test_least_recently_used_evicted(self):
+        """
+        Test to ensure that the least recently used result is evicted first
+        """
+
+        logger.info("Starting eviction test.")
+
+        result_cache = self._open_cache(max_entries=2)
+        with patch("app.result_cache.time.time", side_effect=[1, 2, 3, 4]):
+            result_cache.put("a", self.result)
+            result_cache.put("b", self.result)
+            # Use "a" so that "b" becomes the least recently used result
+            result_cache.get("a")
+            result_cache.put("c", self.result)
+
+        self.assertIsNotNone(result_cache.get("a"), "Expected a to be kept!")
+        self.assertIsNone(result_cache.get("b"), "Expected b to be evicted!")
+        self.assertIsNotNone(result_cache.get("c"), "Expected c to be kept!")
+        self.assertEqual(2, result_cache.stats()["entries"], "Expected 2 results!")
+
+        logger.info("Eviction test passed.")
+
+    def test_fingerprint_invalidation(self):
+        """
+        Test to ensure that results are dropped when the model or
+        the settings that change results change
+        """
+
+        logger.info("Starting fingerprint invalidation test.")
+
+        result_cache = self._open_cache()
+        result_cache.put("video", self.result)
+        result_cache.close()
+
+        self.model_path.write_bytes(b"new model")
+        result_cache = self._open_cache()
+        self.assertIsNone(
+            result_cache.get("video"), "Expected the model change to drop results!"
+        )
+        result_cache.put("video", self.result)
+        result_cache.close()
+
+        with patch.object(VideoAnalyser, "DIFF_SCORE_RANGE", (0, 1)):
+            result_cache = self._open_cache()
+            self.assertIsNone(
+                result_cache.get("video"),
+                "Expected the constant change to drop results!",
+            )
+            result_cache.put("video", self.result)
+            result_cache.close()
+
+            with patch.object(
+                VideoDownloader,
+                "GRAYSCALE_DECODE",
+                not VideoDownloader.GRAYSCALE_DECODE,
+            ):
+                result_cache = self._open_cache()
+                self.assertIsNone(
+                    result_cache.get("video"),
+                    "Expected the decode setting change to drop results!",
+                )
+
+        logger.info("Fingerprint invalidation test passed.")
+
+    def test_missing_model_disabled(self):
+        """
+        Test to ensure that the cache is disabled instead of failing to open
+        when there is no model file to fingerprint
+        """
+
+        logger.info("Starting missing model test.")
+
+        self.model_path.unlink()
+        result_cache = self._open_cache()
+        result_cache.put("video", self.result)
+
+        self.assertIsNone(result_cache.get("video"), "Expected nothing cached!")
+        self.assertEqual(
+            {"hits": 0, "misses": 0, "entries": 0},
+            result_cache.stats(),
+            "Expected the cache to be disabled!",
+        )
+
+        logger.info("Missing model test passed.")
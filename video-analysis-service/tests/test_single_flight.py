@@ -0,0 +1,113 @@
+from app.single_flight import SingleFlight
+from app.logger import setup_logger
+from unittest import IsolatedAsyncioTestCase
+import asyncio
+
+logger = setup_logger(__name__, log_level="DEBUG", log_file=None)
+
+
+class SingleFlightTest(IsolatedAsyncioTestCase):
+    # Number of concurrent requests to simulate
+    REQUEST_COUNT = 5
+
+    def setUp(self):
+        self.single_flight = SingleFlight()
+        self.call_count = 0
+
+    async def _compute(self, result="result"):
+        self.call_count += 1
+        await asyncio.sleep(0.05)
+        return result
+
+    async def test_concurrent_requests_coalesced(self):
+        """
+        Test to ensure that concurrent requests for a key share one computation
+        """
+
+        logger.info("Starting coalescing test.")
+
+        results = await asyncio.gather(
+            *(
+                self.single_flight.run("video", self._compute)
+                for _ in range(self.REQUEST_COUNT)
+            )
+        )
+
+        self.assertEqual(["result"] * self.REQUEST_COUNT, results)
+        self.assertEqual(1, self.call_count, "Expected a single computation!")
+        self.assertEqual(
+            {"leaders": 1, "followers": self.REQUEST_COUNT - 1, "in_flight": 0},
+            self.single_flight.stats(),
+            "Expected one leader and the rest to be followers!",
+        )
+
+        logger.info("Coalescing test passed.")
+
+    async def test_different_keys_not_coalesced(self):
+        """
+        Test to ensure that requests for different keys run separately
+        """
+
+        logger.info("Starting different keys test.")
+
+        results = await asyncio.gather(
+            self.single_flight.run("a", lambda: self._compute("a")),
+            self.single_flight.run("b", lambda: self._compute("b")),
+        )
+
+        self.assertEqual(["a", "b"], results)
+        self.assertEqual(2, self.call_count, "Expected a computation per key!")
+
+        logger.info("Different keys test passed.")
+
+    async def test_exception_shared(self):
+        """
+        Test to ensure that every waiting request gets the exception
+        """
+
+        logger.info("Starting shared exception test.")
+
+        async def fail():
+            await asyncio.sleep(0.05)
+            raise ValueError
+
+        results = await asyncio.gather(
+            *(self.single_flight.run("video", fail) for _ in range(2)),
+            return_exceptions=True,
+        )
+
+        for result in results:
+            self.assertIsInstance(result, ValueError, "Expected the exception!")
+
+        logger.info("Shared exception test passed.")
+
+    async def test_cancelled_follower(self):
+        """
+        Test to ensure that a cancelled request only cancels the computation
+        once no other requests are waiting on it
+        """
+
+        logger.info("Starting cancelled follower test.")
+
+        leader = asyncio.create_task(self.single_flight.run("video", self._compute))
+        follower = asyncio.create_task(self.single_flight.run("video", self._compute))
+        await asyncio.sleep(0)
+
+        follower.cancel()
+        self.assertEqual("result", await leader, "Expected the leader to finish!")
+
+        leader = asyncio.create_task(self.single_flight.run("video", self._compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.gather(leader, return_exceptions=True)
+
+        self.assertEqual(
+            0, self.single_flight.stats()["in_flight"], "Expected nothing in flight!"
+        )
+        self.assertEqual(
+            "result",
+            await self.single_flight.run("video", self._compute),
+            "Expected a new computation after the cancelled one!",
+        )
+
+        logger.info("Cancelled follower test passed.")
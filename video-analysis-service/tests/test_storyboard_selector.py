@@ -0,0 +1,183 @@
+from app.storyboard_selector import StoryboardSelector
+from app.video_analyser import VideoAnalyser
+from app.logger import setup_logger
+from unittest import IsolatedAsyncioTestCase
+from pathlib import Path
+import json
+import cv2
+import numpy
+
+logger = setup_logger(__name__, log_level="DEBUG", log_file=None)
+
+
+class StoryboardSelectorTest(IsolatedAsyncioTestCase):
+    FIXTURE_PATH = Path(__file__).parent / "fixtures" / "storyboard_formats.json"
+    FRAME_TARGET = 50
+    # Largest allowed change of the normalized scores from scoring every frame
+    SCORE_TOLERANCE = 0.05
+    SCENE_COUNT = 24
+
+    def setUp(self):
+        self.selector = StoryboardSelector(
+            self.FRAME_TARGET, min_frame_size=(320, 180), request_cost=50_000
+        )
+
+        with open(self.FIXTURE_PATH) as fixture_file:
+            self.videos = json.load(fixture_file)
+
+        for video in self.videos:
+            for storyboard_format in video["formats"]:
+                storyboard_format["fragments"] = [
+                    {"url": f"http://storyboard/{storyboard_format['format_id']}/{i}"}
+                    for i in range(storyboard_format.pop("fragment_count"))
+                ]
+
+    def _legacy_selection(self, storyboard_formats):
+        # The first format by id, strided to roughly the frame target
+        storyboard_format = sorted(storyboard_formats, key=lambda x: x["format_id"])[0]
+        frames_per_fragment = storyboard_format["rows"] * storyboard_format["columns"]
+        fragment_count = len(storyboard_format["fragments"])
+        step_size = max(1, frames_per_fragment * fragment_count // self.FRAME_TARGET)
+
+        return storyboard_format, list(range(0, fragment_count, step_size))
+
+    def _render_frames(self, video_idx, storyboard_format, fragment_positions):
+        # Every scene is a blurred texture that drifts across the frame,
+        # rendered at the calibrated resolution and scaled like a storyboard
+        rng = numpy.random.default_rng(video_idx)
+        scenes = [
+            cv2.GaussianBlur(
+                rng.integers(0, 256, (220, 360), dtype=numpy.uint8),
+                (0, 0),
+                rng.uniform(1.5, 2.5),
+            )
+            for _ in range(self.SCENE_COUNT)
+        ]
+        frames_per_fragment = storyboard_format["rows"] * storyboard_format["columns"]
+        fragment_count = len(storyboard_format["fragments"])
+        frame_size = (storyboard_format["width"], storyboard_format["height"])
+
+        frames = []
+        for position in fragment_positions:
+            for tile in range(frames_per_fragment):
+                time = (position + (tile + 0.5) / frames_per_fragment) / fragment_count
+                scene = scenes[int(time * self.SCENE_COUNT)]
+                offset = int(time * self.SCENE_COUNT % 1 * 40)
+                frame = scene[offset : offset + 180, offset : offset + 320]
+                frames.append(
+                    cv2.resize(frame, frame_size, interpolation=cv2.INTER_AREA)
+                )
+
+        return frames
+
+    def test_fixture_selection(self):
+        """
+        Test to ensure that the expected formats are selected from the fixtures,
+        and that they never cost more than the old selection
+        """
+
+        logger.info("Starting fixture selection test.")
+
+        for video in self.videos:
+            selected_format = self.selector.select_format(video["formats"])
+
+            if video["expected_format_id"] is None:
+                self.assertIsNone(selected_format, "Expected no format!")
+                continue
+
+            self.assertEqual(
+                video["expected_format_id"],
+                selected_format["format_id"],
+                f"Expected a different format for {video['video']}!",
+            )
+
+            legacy_format, legacy_positions = self._legacy_selection(video["formats"])
+            legacy_cost = len(legacy_positions) * (
+                50_000
+                + legacy_format["rows"]
+                * legacy_format["columns"]
+                * legacy_format["width"]
+                * legacy_format["height"]
+            )
+            self.assertLessEqual(
+                self.selector.cost(selected_format),
+                legacy_cost,
+                f"Expected {video['video']} to cost no more than before!",
+            )
+
+        logger.info("Fixture selection test passed.")
+
+    def test_fragments_evenly_spread(self):
+        """
+        Test to ensure that enough distinct fragments are selected
+        and that they are spread over the whole video
+        """
+
+        logger.info("Starting fragment spread test.")
+
+        for video in self.videos:
+            for storyboard_format in video["formats"]:
+                positions = self.selector.select_fragments(storyboard_format)
+                fragment_count = len(storyboard_format["fragments"])
+                frames_per_fragment = (
+                    storyboard_format["rows"] * storyboard_format["columns"]
+                )
+
+                self.assertEqual(
+                    sorted(set(positions)), positions, "Expected distinct positions!"
+                )
+                self.assertGreaterEqual(
+                    len(positions) * frames_per_fragment,
+                    min(self.FRAME_TARGET, fragment_count * frames_per_fragment),
+                    "Expected enough frames!",
+                )
+                # Every selected fragment is in its own evenly sized section
+                for section, position in enumerate(positions):
+                    self.assertEqual(
+                        section, position * len(positions) // fragment_count
+                    )
+
+        logger.info("Fragment spread test passed.")
+
+    async def test_scores_within_tolerance(self):
+        """
+        Test to ensure that the scores of the selected frames stay within
+        a tolerance of the scores of every frame of the highest quality format
+        on the fixture corpus
+        """
+
+        logger.info("Starting score tolerance test.")
+
+        for video_idx, video in enumerate(self.videos):
+            if len(video["formats"]) == 0:
+                continue
+
+            selected_format = self.selector.select_format(video["formats"])
+            selected_scores = await VideoAnalyser(
+                self._render_frames(
+                    video_idx,
+                    selected_format,
+                    self.selector.select_fragments(selected_format),
+                )
+            ).calculate_frame_scores()
+
+            reference_format = self._legacy_selection(video["formats"])[0]
+            reference_scores = await VideoAnalyser(
+                self._render_frames(
+                    video_idx,
+                    reference_format,
+                    range(len(reference_format["fragments"])),
+                )
+            ).calculate_frame_scores()
+
+            for score, reference_score in zip(
+                selected_scores[:2], reference_scores[:2]
+            ):
+                self.assertAlmostEqual(
+                    reference_score,
+                    score,
+                    delta=self.SCORE_TOLERANCE,
+                    msg=f"Expected similar scores for {video['video']}!",
+                )
+
+        logger.info("Score tolerance test passed.")
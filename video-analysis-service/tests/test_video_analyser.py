@@ -1,8 +1,10 @@
 from app.video_analyser import VideoAnalyser
 from app.video_downloader import VideoDownloader
 from app.logger import setup_logger
-from unittest import IsolatedAsyncioTestCase
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import patch
 from PIL import Image
+import numpy
 import asyncio
 
 logger = setup_logger(__name__, log_level="DEBUG", log_file=None)
@@ -99,7 +101,9 @@ class VideoAnalyserTest(IsolatedAsyncioTestCase):
 
         self.assertLess(0, detail_score, "Expected a valid detail score!")
         self.assertLess(0, diff_score, "Expected a valid diff score!")
-        self.assertIsInstance(selected_frame, Image.Image, "Expected a valid image!")
+        self.assertIsInstance(
+            selected_frame, (numpy.ndarray, Image.Image), "Expected a valid image!"
+        )
 
         logger.info("Frame scoring test passed.")
 
@@ -136,3 +140,77 @@ class VideoAnalyserTest(IsolatedAsyncioTestCase):
         )
 
         logger.info("Frame duplication test passed.")
+
+    async def test_progressive_convergence(self):
+        """
+        Test to ensure that the frame statistics converge once more frames
+        stop changing them, and that the amount of frames used is reported
+        """
+
+        logger.info("Starting progressive convergence test.")
+
+        # Every chunk repeats the same frames, so only the first chunk adds detail
+        chunk = self.video_frames[:9]
+        chunk_count = 6
+
+        async def add_until_converged(tolerance):
+            vid_anl = VideoAnalyser()
+            with patch.object(VideoAnalyser, "PROGRESSIVE_TOLERANCE", tolerance):
+                for chunk_idx in range(chunk_count):
+                    await vid_anl.add_frames(chunk, chunk_idx)
+                    if await vid_anl.has_converged():
+                        break
+
+            await vid_anl.calculate_frame_scores()
+            return vid_anl.frames_used
+
+        self.assertEqual(
+            2 * len(chunk),
+            await add_until_converged(0.05),
+            "Expected to stop after the repeated chunk!",
+        )
+        self.assertEqual(
+            chunk_count * len(chunk),
+            await add_until_converged(0.0),
+            "Expected every frame without a tolerance!",
+        )
+
+        logger.info("Progressive convergence test passed.")
+
+
+class KeywordCacheTest(TestCase):
+    # Mock category keywords dictionary
+    keywords = {
+        "music": ["music", "song", "orchestra", "rap", "rock", "classical", "pop"],
+        "coding": ["programming", "java", "javascript", "c#", "c++"],
+    }
+
+    def test_keyword_cache(self):
+        """
+        Test to ensure that the same client keywords reuse the cached matcher
+        """
+
+        logger.info("Starting keyword cache test.")
+
+        VideoAnalyser.keyword_cache.clear()
+        keyword_matcher = VideoAnalyser.get_keyword_matcher(self.keywords)
+        # The same keywords with the categories in a different order
+        reordered_keywords = dict(reversed(self.keywords.items()))
+
+        self.assertIs(
+            keyword_matcher,
+            VideoAnalyser.get_keyword_matcher(reordered_keywords),
+            "Expected the cached matcher to be reused!",
+        )
+        self.assertEqual(
+            VideoAnalyser.merge_keywords(self.keywords),
+            keyword_matcher.keywords,
+            "Expected the matcher to hold the merged keywords!",
+        )
+        self.assertIsNot(
+            keyword_matcher,
+            VideoAnalyser.get_keyword_matcher(None),
+            "Expected a different matcher without client keywords!",
+        )
+
+        logger.info("Keyword cache test passed.")
@@ -1,7 +1,17 @@
 from app.video_downloader import VideoDownloader, VideoDownloaderError
+from app.fragment_cache import FragmentCache
 from app.logger import setup_logger
 from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+from contextlib import aclosing
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from io import BytesIO
 import asyncio
+import tempfile
+import httpx
+import numpy
+import cv2
 
 logger = setup_logger(__name__, log_level="DEBUG", log_file=None)
 
@@ -61,6 +71,38 @@ class VideoDownloaderTest(IsolatedAsyncioTestCase):
 
         logger.info("Category data test passed.")
 
+    async def test_text_data_extractor_processes(self):
+        """
+        Test to ensure that extracting in worker processes gives the same
+        text data as extracting in a thread
+        """
+
+        logger.info("Starting extractor processes test.")
+
+        VideoDownloader.metadata_cache.clear()
+        thread_results = await asyncio.gather(
+            *(VideoDownloader(id).get_video_text_info() for id in self.video_ids)
+        )
+
+        VideoDownloader.metadata_cache.clear()
+        with patch.object(VideoDownloader, "EXTRACTOR_PROCESSES", 2):
+            await VideoDownloader.start_extractor_pool()
+            try:
+                process_results = await asyncio.gather(
+                    *(
+                        VideoDownloader(id).get_video_text_info()
+                        for id in self.video_ids
+                    )
+                )
+            finally:
+                await VideoDownloader.shutdown_extractor_pool()
+
+        self.assertEqual(
+            thread_results, process_results, "Expected the same text data!"
+        )
+
+        logger.info("Extractor processes test passed.")
+
     async def test_text_data_text_not_empty(self):
         """
         Test to ensure that text data is properly populated
@@ -95,3 +137,315 @@ class VideoDownloaderTest(IsolatedAsyncioTestCase):
             self.assertLess(1, len(result), "Expected at least 2 images!")
 
         logger.info("Frame data test passed.")
+
+    async def test_frame_chunks_in_order(self):
+        """
+        Test to ensure that streamed storyboard chunks can be put back
+        in video order, without hitting the network
+        """
+
+        logger.info("Starting frame chunk order test.")
+
+        # Two fragments of 25 frames stay under FRAME_LIMIT, so none are skipped
+        fragment_count = 2
+        storyboard_bytes = []
+
+        for fragment_idx in range(fragment_count):
+            storyboard = BytesIO()
+            Image.new("RGB", (160 * 5, 90 * 5), (fragment_idx * 50,) * 3).save(
+                storyboard, "PNG"
+            )
+            storyboard_bytes.append(storyboard.getvalue())
+
+        async def storyboard_handler(request):
+            fragment_idx = int(request.url.path.strip("/"))
+            # Finish the fragments in reverse order
+            await asyncio.sleep(0.01 * (fragment_count - fragment_idx))
+            return httpx.Response(200, content=storyboard_bytes[fragment_idx])
+
+        vid_dl = VideoDownloader(self.video_ids[0])
+        vid_dl.http_client = httpx.AsyncClient(
+            transport=httpx.MockTransport(storyboard_handler)
+        )
+        # Skip the yt_dlp lookup with fake storyboard information
+        vid_dl.video_info = {"is_live": False}
+        vid_dl.video_storyboard_info = {
+            "rows": 5,
+            "columns": 5,
+            "width": 160,
+            "height": 90,
+            "fragments": [
+                {"url": f"http://storyboard/{fragment_idx}"}
+                for fragment_idx in range(fragment_count)
+            ],
+        }
+
+        chunks = [chunk async for chunk in vid_dl.iter_video_frames()]
+        chunk_order = [chunk_idx for chunk_idx, _, _ in chunks]
+        video_frames = await vid_dl.get_video_frames()
+        await vid_dl.close_http_connections()
+
+        self.assertEqual(
+            list(reversed(range(fragment_count))),
+            chunk_order,
+            "Expected chunks in download order!",
+        )
+        self.assertEqual(
+            [False] * (fragment_count - 1) + [True],
+            [round_end for _, _, round_end in chunks],
+            "Expected only the last chunk to end the single round!",
+        )
+        self.assertEqual(
+            [fragment_idx * 50 for fragment_idx in range(fragment_count)],
+            [int(video_frames[i * 25][0, 0, 0]) for i in range(fragment_count)],
+            "Expected frames in video order!",
+        )
+
+        logger.info("Frame chunk order test passed.")
+
+    async def test_grayscale_frames_match_color(self):
+        """
+        Test to ensure that frames decoded straight to grayscale match the
+        converted colour frames, and that the selected frame can be decoded
+        again in colour, without hitting the network
+        """
+
+        logger.info("Starting grayscale frame test.")
+
+        # Colour gradients, noise would be smeared by the chroma subsampling
+        y, x = numpy.mgrid[: 90 * 5, : 160 * 5]
+        storyboard = BytesIO()
+        Image.fromarray(
+            numpy.stack(
+                [x * 255 // x.max(), y * 255 // y.max(), (x + y) // 5], -1
+            ).astype(numpy.uint8)
+        ).save(storyboard, "JPEG")
+
+        vid_dl = VideoDownloader(self.video_ids[0])
+        vid_dl.http_client = httpx.AsyncClient(
+            transport=httpx.MockTransport(
+                lambda request: httpx.Response(200, content=storyboard.getvalue())
+            )
+        )
+        # Skip the yt_dlp lookup with fake storyboard information
+        vid_dl.video_info = {"is_live": False}
+        vid_dl.video_storyboard_info = {
+            "rows": 5,
+            "columns": 5,
+            "width": 160,
+            "height": 90,
+            "fragments": [{"url": "http://storyboard/0"}],
+        }
+
+        gray_chunks = {
+            chunk_idx: frames
+            async for chunk_idx, frames, _ in vid_dl.iter_video_frames(grayscale=True)
+        }
+        color_frames = await vid_dl.get_video_frames()
+        color_frame = await vid_dl.get_color_frame(0, 7)
+        await vid_dl.close_http_connections()
+
+        for gray_frame, frame in zip(gray_chunks[0], color_frames):
+            self.assertEqual(2, gray_frame.ndim, "Expected a grayscale frame!")
+            # The decoders round differently, so allow off by one errors
+            numpy.testing.assert_allclose(
+                cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY).astype(int), gray_frame, atol=1
+            )
+
+        numpy.testing.assert_array_equal(color_frames[7], color_frame)
+        self.assertIsNone(
+            await vid_dl.get_color_frame(1, 0), "Expected no colour frame!"
+        )
+
+        logger.info("Grayscale frame test passed.")
+
+    async def test_progressive_download_stops_early(self):
+        """
+        Test to ensure that progressive downloads fetch evenly spread rounds
+        of fragments and stop once the consumer stops, without hitting the network
+        """
+
+        logger.info("Starting progressive download test.")
+
+        fragment_count = 6
+        storyboard = BytesIO()
+        Image.new("RGB", (160 * 3, 90 * 3)).save(storyboard, "PNG")
+        requested_urls = []
+
+        def storyboard_handler(request):
+            requested_urls.append(str(request.url))
+            return httpx.Response(200, content=storyboard.getvalue())
+
+        vid_dl = VideoDownloader(self.video_ids[0])
+        vid_dl.http_client = httpx.AsyncClient(
+            transport=httpx.MockTransport(storyboard_handler)
+        )
+        # Skip the yt_dlp lookup with fake storyboard information
+        vid_dl.video_info = {"is_live": False}
+        vid_dl.video_storyboard_info = {
+            "rows": 3,
+            "columns": 3,
+            "width": 160,
+            "height": 90,
+            "fragments": [
+                {"url": f"http://storyboard/{fragment_idx}"}
+                for fragment_idx in range(fragment_count)
+            ],
+        }
+
+        async with aclosing(vid_dl.iter_video_frames(progressive=True)) as chunks:
+            first_round = []
+            async for chunk_idx, _, round_end in chunks:
+                first_round.append(chunk_idx)
+                if round_end:
+                    break
+
+        self.assertEqual(
+            [0, 3], sorted(first_round), "Expected an evenly spread first round!"
+        )
+        self.assertEqual(
+            VideoDownloader.PROGRESSIVE_FIRST_ROUND,
+            len(requested_urls),
+            "Expected no downloads after stopping!",
+        )
+
+        every_chunk = [
+            chunk async for chunk in vid_dl.iter_video_frames(progressive=True)
+        ]
+        await vid_dl.close_http_connections()
+
+        self.assertEqual(
+            list(range(fragment_count)),
+            sorted(chunk_idx for chunk_idx, _, _ in every_chunk),
+            "Expected every fragment once!",
+        )
+        # The rounds fetch 2, then 2 more and then the last 2 fragments
+        self.assertEqual(
+            [False, True] * 3,
+            [round_end for _, _, round_end in every_chunk],
+            "Expected the last chunk of every round to be marked!",
+        )
+
+        logger.info("Progressive download test passed.")
+
+    async def test_live_thumbnails_not_cached(self):
+        """
+        Test to ensure that live stream thumbnails are downloaded again on
+        every analysis, since their images change behind the same URL,
+        without hitting the network
+        """
+
+        logger.info("Starting live thumbnail cache test.")
+
+        thumbnail_brightness = [50]
+
+        def thumbnail_handler(request):
+            thumbnail = BytesIO()
+            Image.new("RGB", (160, 90), (thumbnail_brightness[0],) * 3).save(
+                thumbnail, "PNG"
+            )
+            return httpx.Response(200, content=thumbnail.getvalue())
+
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        fragment_cache = FragmentCache(temp_dir.name)
+        fragment_cache.open()
+
+        async def get_live_frames():
+            vid_dl = VideoDownloader(self.video_ids[0])
+            vid_dl.http_client = httpx.AsyncClient(
+                transport=httpx.MockTransport(thumbnail_handler)
+            )
+            # Skip the yt_dlp lookup with fake live stream information
+            vid_dl.is_live = True
+            vid_dl.video_info = {
+                "is_live": True,
+                "thumbnails": [{"url": "http://thumbnail/0", "preference": 0}],
+            }
+            frames = await vid_dl.get_video_frames()
+            await vid_dl.close_http_connections()
+            return frames
+
+        with patch.object(VideoDownloader, "fragment_cache", fragment_cache):
+            first_frames = await get_live_frames()
+            thumbnail_brightness[0] = 200
+            second_frames = await get_live_frames()
+
+        self.assertEqual(50, numpy.asarray(first_frames[0])[0, 0, 0])
+        self.assertEqual(
+            200,
+            numpy.asarray(second_frames[0])[0, 0, 0],
+            "Expected the changed thumbnail, not a cached one!",
+        )
+        self.assertEqual(
+            {"hits": 0, "misses": 0},
+            {key: fragment_cache.stats()[key] for key in ("hits", "misses")},
+            "Expected the cache not to be used for live streams!",
+        )
+
+        logger.info("Live thumbnail cache test passed.")
+
+    async def test_cached_info_skips_youtube_dl(self):
+        """
+        Test to ensure that creating a downloader and reading cached video
+        information doesn't build a YoutubeDL, without hitting the network
+        """
+
+        logger.info("Starting cached video info test.")
+
+        video_info = {
+            "title": "Title",
+            "description": "Description",
+            "categories": ["Music"],
+            "is_live": True,
+            "thumbnails": [],
+            "storyboard": None,
+        }
+        VideoDownloader.metadata_cache.put(self.video_ids[0], video_info)
+        self.addCleanup(VideoDownloader.metadata_cache.clear)
+
+        with patch("app.video_downloader.YoutubeDL") as youtube_dl:
+            text_info = await VideoDownloader(self.video_ids[0]).get_video_text_info()
+
+        self.assertEqual((["Music"], "Title Description"), text_info)
+        youtube_dl.assert_not_called()
+
+        logger.info("Cached video info test passed.")
+
+    async def test_extractor_processes_skip_youtube_dl(self):
+        """
+        Test to ensure that no YoutubeDL is built in the serving process
+        when the video info is extracted in worker processes,
+        without hitting the network
+        """
+
+        logger.info("Starting extractor process YoutubeDL test.")
+
+        video_info = {
+            "title": "Title",
+            "description": "Description",
+            "categories": ["Music"],
+            "is_live": True,
+            "thumbnails": [],
+            "storyboard": None,
+        }
+        VideoDownloader.metadata_cache.clear()
+        self.addCleanup(VideoDownloader.metadata_cache.clear)
+
+        # A thread pool stands in for the worker processes
+        with (
+            ThreadPoolExecutor(max_workers=1) as extractor_pool,
+            patch.object(VideoDownloader, "_extractor_pool", extractor_pool),
+            patch(
+                "app.video_downloader._extract_trimmed_video_info",
+                return_value=video_info,
+            ) as extract_trimmed_video_info,
+            patch("app.video_downloader.YoutubeDL") as youtube_dl,
+        ):
+            text_info = await VideoDownloader(self.video_ids[0]).get_video_text_info()
+
+        self.assertEqual((["Music"], "Title Description"), text_info)
+        extract_trimmed_video_info.assert_called_once_with(self.video_ids[0])
+        youtube_dl.assert_not_called()
+
+        logger.info("Extractor process YoutubeDL test passed.")